@@ -0,0 +1,48 @@
+"""add_equipment_search_indexes
+
+Revision ID: 3f7a9c2e5b14
+Revises: cc21666635e2
+Create Date: 2026-10-17 21:05:12.504913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7a9c2e5b14'
+down_revision: Union[str, None] = 'cc21666635e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Совпадает с app.models.equipment.SEARCH_DOCUMENT_SQL; миграция хранит свою
+# копию, чтобы не зависеть от последующих изменений модели
+SEARCH_DOCUMENT_SQL = (
+    "to_tsvector('simple'::regconfig, "
+    "coalesce(equipment.name, '') || ' ' || "
+    "coalesce(equipment.serial_number, '') || ' ' || "
+    "coalesce(equipment.inventory_number, '') || ' ' || "
+    "coalesce(equipment.manufacturer, '') || ' ' || "
+    "coalesce(equipment.model, ''))"
+)
+
+
+def upgrade() -> None:
+    # pg_trgm входит в contrib (есть в образе postgres); с PG 13 - trusted extension
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_equipment_name_trgm', 'equipment', ['name'],
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'ix_equipment_search_document', 'equipment', [sa.text(SEARCH_DOCUMENT_SQL)],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    # Расширение не удаляется: его могут использовать другие объекты БД
+    op.drop_index('ix_equipment_search_document', table_name='equipment')
+    op.drop_index('ix_equipment_name_trgm', table_name='equipment')
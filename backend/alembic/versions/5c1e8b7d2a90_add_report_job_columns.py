@@ -0,0 +1,35 @@
+"""add_report_job_columns
+
+Revision ID: 5c1e8b7d2a90
+Revises: 8d2b6e4f1a07
+Create Date: 2026-10-17 23:12:05.441918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8b7d2a90'
+down_revision: Union[str, None] = '8d2b6e4f1a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Состояние задания генерации отчёта; существующие записи считаются готовыми
+    op.add_column('generated_reports', sa.Column('report_type', sa.String(length=100), nullable=True))
+    op.add_column('generated_reports', sa.Column('format', sa.String(length=50), nullable=True))
+    op.add_column('generated_reports', sa.Column('status', sa.String(length=20), server_default='completed', nullable=False))
+    op.add_column('generated_reports', sa.Column('error', sa.Text(), nullable=True))
+    op.add_column('generated_reports', sa.Column('row_count', sa.Integer(), nullable=True))
+    op.add_column('generated_reports', sa.Column('duration_ms', sa.Integer(), nullable=True))
+    op.add_column('generated_reports', sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True))
+    op.alter_column('generated_reports', 'status', server_default='queued')
+
+
+def downgrade() -> None:
+    for column in ('completed_at', 'duration_ms', 'row_count', 'error', 'status', 'format', 'report_type'):
+        op.drop_column('generated_reports', column)
@@ -0,0 +1,50 @@
+"""add_filter_index_pack
+
+Revision ID: 8d2b6e4f1a07
+Revises: 3f7a9c2e5b14
+Create Date: 2026-10-17 21:48:30.117062
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2b6e4f1a07'
+down_revision: Union[str, None] = '3f7a9c2e5b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, колонки): фильтры эндпоинтов и фоновых заданий.
+# Уже есть и здесь не повторяются: metrics_data(equipment_id, metric_id, timestamp),
+# anomalies(equipment_id, detected_at, id), production_cycles(factory_id, start_time, id),
+# maintenance_log(equipment_id, scheduled_date, id)
+INDEXES = [
+    # /analytics/kpi, DELETE/пересчёт в kpi_rollup, /dashboard/kpi-summary по заводу
+    ('ix_kpi_calculations_entity_period', 'kpi_calculations', ['entity_type', 'entity_id', 'period_type', 'period_start']),
+    # /dashboard/stats и /dashboard/kpi-summary по всем заводам
+    ('ix_kpi_calculations_period_start', 'kpi_calculations', ['period_type', 'period_start']),
+    # Список аномалий с фильтром status (порядок detected_at, id) и активные алерты дашборда
+    ('ix_anomalies_status_detected_at_id', 'anomalies', ['status', 'detected_at', 'id']),
+    # Список и статистика оборудования завода по статусу
+    ('ix_equipment_factory_status', 'equipment', ['factory_id', 'status']),
+    # Циклы оборудования (фильтр equipment_id, порядок start_time, id)
+    ('ix_production_cycles_equipment_start_time_id', 'production_cycles', ['equipment_id', 'start_time', 'id']),
+    # Прогнозы оборудования, новые первыми
+    ('ix_predictions_equipment_created_at', 'predictions', ['equipment_id', 'created_at']),
+    # Рекомендации завода и новые рекомендации, новые первыми
+    ('ix_recommendations_target_created_at', 'recommendations', ['target_type', 'target_id', 'created_at']),
+    ('ix_recommendations_status_created_at', 'recommendations', ['status', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,94 @@
+"""partition_metrics_data_by_timestamp
+
+Revision ID: 97d1ce90daf2
+Revises: 1bc23f385037
+Create Date: 2026-10-17 10:12:31.402118
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.services.metrics_partitions import partition_name, partition_starts, partition_step
+
+
+# revision identifiers, used by Alembic.
+revision: str = '97d1ce90daf2'
+down_revision: Union[str, None] = '1bc23f385037'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DATA_COLUMNS = "id, equipment_id, metric_id, timestamp, value, is_anomaly, is_critical, shift, operator_id, created_at"
+
+
+def _metrics_data_columns(id_type) -> list:
+    return [
+        sa.Column('id', id_type, server_default=sa.text("nextval('metrics_data_id_seq')"), nullable=False),
+        sa.Column('equipment_id', sa.UUID(), nullable=False),
+        sa.Column('metric_id', sa.UUID(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('value', sa.Numeric(precision=20, scale=6), nullable=True),
+        sa.Column('is_anomaly', sa.Boolean(), nullable=True),
+        sa.Column('is_critical', sa.Boolean(), nullable=True),
+        sa.Column('shift', sa.String(length=50), nullable=True),
+        sa.Column('operator_id', sa.UUID(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['equipment_id'], ['equipment.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['metric_id'], ['metrics_catalog.id'], ),
+    ]
+
+
+def upgrade() -> None:
+    # Старая таблица уступает имя секционированной
+    op.execute("ALTER TABLE metrics_data RENAME TO metrics_data_unpartitioned")
+    op.execute("ALTER TABLE metrics_data_unpartitioned RENAME CONSTRAINT metrics_data_pkey TO metrics_data_unpartitioned_pkey")
+    op.execute("ALTER TABLE metrics_data_unpartitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE metrics_data_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE metrics_data_id_seq AS bigint")
+
+    op.create_table('metrics_data',
+    *_metrics_data_columns(sa.BigInteger()),
+    sa.PrimaryKeyConstraint('id', 'timestamp'),
+    postgresql_partition_by='RANGE (timestamp)'
+    )
+    op.execute("ALTER SEQUENCE metrics_data_id_seq OWNED BY metrics_data.id")
+    op.create_index('ix_metrics_data_equipment_metric_timestamp', 'metrics_data', ['equipment_id', 'metric_id', 'timestamp'], unique=False)
+
+    # Секции под существующие данные и на METRICS_PARTITION_PREMAKE интервалов вперёд
+    bind = op.get_bind()
+    min_ts, max_ts = bind.execute(
+        sa.text("SELECT min(timestamp), max(timestamp) FROM metrics_data_unpartitioned")
+    ).first()
+    now = datetime.now(timezone.utc)
+    step = partition_step()
+    start = min_ts or now
+    end = max(max_ts or now, now) + step * settings.METRICS_PARTITION_PREMAKE
+    for partition_start in partition_starts(start, end):
+        op.execute(
+            f'CREATE TABLE "{partition_name(partition_start)}" PARTITION OF metrics_data '
+            f"FOR VALUES FROM ('{partition_start.isoformat()}') TO ('{(partition_start + step).isoformat()}')"
+        )
+
+    op.execute(f"INSERT INTO metrics_data ({DATA_COLUMNS}) SELECT {DATA_COLUMNS} FROM metrics_data_unpartitioned")
+    op.drop_table('metrics_data_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE metrics_data RENAME TO metrics_data_partitioned")
+    op.execute("ALTER TABLE metrics_data_partitioned RENAME CONSTRAINT metrics_data_pkey TO metrics_data_partitioned_pkey")
+    op.execute("ALTER TABLE metrics_data_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE metrics_data_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE metrics_data_id_seq AS integer")
+
+    op.create_table('metrics_data',
+    *_metrics_data_columns(sa.Integer()),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE metrics_data_id_seq OWNED BY metrics_data.id")
+
+    op.execute(f"INSERT INTO metrics_data ({DATA_COLUMNS}) SELECT {DATA_COLUMNS} FROM metrics_data_partitioned")
+    # Секции удаляются вместе с родительской таблицей
+    op.drop_table('metrics_data_partitioned')
@@ -0,0 +1,35 @@
+"""add_scheduled_reports
+
+Revision ID: 9e4b2d7c6f18
+Revises: 5c1e8b7d2a90
+Create Date: 2026-10-18 10:41:27.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b2d7c6f18'
+down_revision: Union[str, None] = '5c1e8b7d2a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Плановые запуски по расписанию шаблона; один отчёт на (шаблон, завод, период)
+    op.add_column('generated_reports', sa.Column('scheduled', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index(
+        'uq_generated_reports_scheduled_period',
+        'generated_reports',
+        ['template_id', 'factory_id', 'period_start', 'period_end'],
+        unique=True,
+        postgresql_where=sa.text('scheduled'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_generated_reports_scheduled_period', table_name='generated_reports')
+    op.drop_column('generated_reports', 'scheduled')
@@ -0,0 +1,35 @@
+"""add_kpi_rollup_state
+
+Revision ID: c19422938b2d
+Revises: 97d1ce90daf2
+Create Date: 2026-10-17 13:40:05.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c19422938b2d'
+down_revision: Union[str, None] = '97d1ce90daf2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('kpi_rollup_state',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('watermark', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_run_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_dirty_hours', sa.Integer(), nullable=True),
+    sa.Column('last_rows_written', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_index('ix_metrics_data_created_at_brin', 'metrics_data', ['created_at'], unique=False, postgresql_using='brin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_metrics_data_created_at_brin', table_name='metrics_data', postgresql_using='brin')
+    op.drop_table('kpi_rollup_state')
@@ -0,0 +1,43 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: cc21666635e2
+Revises: c19422938b2d
+Create Date: 2026-10-17 19:38:43.388426
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cc21666635e2'
+down_revision: Union[str, None] = 'c19422938b2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, колонки): ключ сортировки списка и id
+INDEXES = [
+    ('ix_factories_name_id', 'factories', ['name', 'id']),
+    ('ix_equipment_name_id', 'equipment', ['name', 'id']),
+    ('ix_equipment_factory_name_id', 'equipment', ['factory_id', 'name', 'id']),
+    ('ix_production_cycles_start_time_id', 'production_cycles', ['start_time', 'id']),
+    ('ix_production_cycles_factory_start_time_id', 'production_cycles', ['factory_id', 'start_time', 'id']),
+    ('ix_maintenance_log_scheduled_date_id', 'maintenance_log', ['scheduled_date', 'id']),
+    ('ix_maintenance_log_equipment_scheduled_date_id', 'maintenance_log', ['equipment_id', 'scheduled_date', 'id']),
+    ('ix_anomalies_detected_at_id', 'anomalies', ['detected_at', 'id']),
+    ('ix_anomalies_equipment_detected_at_id', 'anomalies', ['equipment_id', 'detected_at', 'id']),
+    ('ix_generated_reports_generated_at_id', 'generated_reports', ['generated_at', 'id']),
+    ('ix_generated_reports_factory_generated_at_id', 'generated_reports', ['factory_id', 'generated_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -1,25 +1,29 @@
 """
 Dependencies для API endpoints
 """
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.core.security import decode_access_token
+from app.core.slow_queries import bind_query_user
+from app.core.user_cache import UserPrincipal, user_cache
 from app.models.user import User
 from sqlalchemy import select
 
 security = HTTPBearer()
+# EventSource и WebSocket в браузере не передают заголовки: токен можно дать в ?token=
+optional_security = HTTPBearer(auto_error=False)
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
+async def authenticate_token(token: str, db: AsyncSession) -> UserPrincipal:
     """
-    Получение текущего пользователя из JWT токена
+    Пользователь по JWT токену
+
+    Пользователь берётся из кэша; в БД запрос идёт только при промахе
     """
-    token = credentials.credentials
     payload = decode_access_token(token)
     
     if payload is None:
@@ -45,15 +49,20 @@ async def get_current_user(
             detail="Неверный формат ID пользователя",
         )
     
-    query = select(User).where(User.id == user_id)
-    result = await db.execute(query)
-    user = result.scalar_one_or_none()
-    
+    user = await user_cache.get(user_id)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Пользователь не найден",
-        )
+        query = select(User).where(User.id == user_id)
+        result = await db.execute(query)
+        db_user = result.scalar_one_or_none()
+        
+        if db_user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Пользователь не найден",
+            )
+        
+        user = UserPrincipal.from_user(db_user)
+        await user_cache.put(user)
     
     if not user.is_active:
         raise HTTPException(
@@ -61,5 +70,35 @@ async def get_current_user(
             detail="Пользователь неактивен",
         )
     
+    bind_query_user(user.id)
     return user
 
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> UserPrincipal:
+    """
+    Получение текущего пользователя из JWT токена
+    """
+    return await authenticate_token(credentials.credentials, db)
+
+
+async def get_stream_user(
+    token: Optional[str] = Query(None, description="JWT, если клиент не может передать заголовок"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_db)
+) -> UserPrincipal:
+    """
+    Текущий пользователь для потоковых подписок: заголовок Authorization или ?token=
+    """
+    if credentials is not None:
+        token = credentials.credentials
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Не передан токен аутентификации",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await authenticate_token(token, db)
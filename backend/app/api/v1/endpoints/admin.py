@@ -1,25 +1,30 @@
 """
 API endpoints для админ-панели (одобрение заявок, создание аккаунтов)
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from uuid import UUID
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import database_pool_stats, get_db
+from app.core.replicas import replica_router
+from app.core.responses import FastJSONRoute
 from app.api.v1.deps import get_current_user
 from app.models.user import User
 from app.models.application import Application
 from app.models.factory import Factory
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash_async, password_hasher
+from app.core.slow_queries import slow_query_log
+from app.services.metrics_pubsub import metrics_broker
 from app.utils.pdf_generator import generate_credentials_pdf
 from fastapi.responses import Response
 import secrets
 import string
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 def generate_secure_password(length: int = 16) -> str:
@@ -96,7 +101,7 @@ async def approve_application(
     
     # Генерация пароля
     password = generate_secure_password(16)
-    password_hash = get_password_hash(password)
+    password_hash = await get_password_hash_async(password)
     
     # Получаем factory_id (если не указан, берем первый)
     factory_id = request.factory_id
@@ -242,3 +247,91 @@ async def reject_application(
     
     return {"success": True, "message": "Заявка отклонена"}
 
+
+@router.get("/password-hashing/stats")
+async def get_password_hashing_stats(
+    current_user: User = Depends(get_current_user),
+):
+    """Состояние пула хеширования паролей (только для админов)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
+    
+    return password_hasher.stats()
+
+
+@router.get("/realtime/stats")
+async def get_realtime_stats(
+    current_user: User = Depends(get_current_user),
+):
+    """Подписки на показания в реальном времени в этом процессе (только для админов)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
+    
+    return metrics_broker.stats()
+
+
+@router.get("/database/pool/stats")
+async def get_database_pool_stats(
+    current_user: User = Depends(get_current_user),
+):
+    """Пулы соединений с БД и репликами этого процесса: занятость, переполнение, ожидание (только для админов)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
+    
+    return database_pool_stats()
+
+
+@router.get("/database/replicas/stats")
+async def get_database_replicas_stats(
+    current_user: User = Depends(get_current_user),
+):
+    """Отставание реплик и распределение чтения между ними и основной БД (только для админов)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
+    
+    return replica_router.stats()
+
+
+@router.get("/database/slow-queries")
+async def get_database_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+):
+    """Медленные запросы к БД этого процесса по убыванию суммарного времени, с планами EXPLAIN (только для админов)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
+    
+    return {
+        "enabled": settings.SLOW_QUERY_LOG_ENABLED,
+        **slow_query_log.stats(),
+        "queries": slow_query_log.top(limit),
+    }
+
+
+@router.delete("/database/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_database_slow_queries(
+    current_user: User = Depends(get_current_user),
+):
+    """Очистить журнал медленных запросов этого процесса (только для админов)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
+    
+    slow_query_log.reset()
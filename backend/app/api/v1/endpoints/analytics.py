@@ -5,16 +5,28 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID
-from app.core.database import get_db
+from app.core.replicas import get_read_db, replica_router
+from app.core.responses import FastJSONRoute, streaming_json_response
 from app.models.analytics import KPICalculation, Anomaly, Prediction, Recommendation
 from app.models.user import User
 from app.models.equipment import Equipment
 from app.api.v1.deps import get_current_user
 from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access
+from app.api.v1.pagination import Keyset, paginate, page_items
+from app.api.v1.projection import columns, rows_as_dicts, stream_row_batches
 from fastapi import HTTPException
 from sqlalchemy import select, func, desc
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Порядок списка аномалий: свежие первыми
+ANOMALIES_KEYSET = Keyset(Anomaly.detected_at, Anomaly.id)
+
+# Колонки элемента списка аномалий
+ANOMALY_LIST_COLUMNS = columns(
+    Anomaly.id, Anomaly.equipment_id, Anomaly.detected_at, Anomaly.severity,
+    Anomaly.anomaly_score, Anomaly.anomaly_type, Anomaly.status,
+)
 
 
 @router.get("/kpi")
@@ -24,7 +36,7 @@ async def get_kpi(
     period_type: str = Query("daily", description="hourly, daily, weekly, monthly"),
     limit: int = Query(30, le=365),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить KPI для сущности
@@ -79,14 +91,19 @@ async def list_anomalies(
     status: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
+    stream: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="Потоковая выдача всех аномалий: json, ndjson"),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список аномалий
     Для не-админов показываются только аномалии оборудования их завода
+    
+    Со stream=json|ndjson отдаются все аномалии (после cursor, если задан)
+    без limit, порциями из серверного курсора
     """
-    query = select(Anomaly).join(Equipment, Anomaly.equipment_id == Equipment.id)
+    query = select(*ANOMALY_LIST_COLUMNS).join(Equipment, Anomaly.equipment_id == Equipment.id)
     
     # Фильтрация по доступу пользователя
     user_factory_id = get_user_factory_filter(current_user)
@@ -105,25 +122,23 @@ async def list_anomalies(
     if status:
         query = query.where(Anomaly.status == status)
     
-    query = query.order_by(desc(Anomaly.detected_at)).offset(offset).limit(limit)
+    if stream:
+        if offset:
+            raise HTTPException(status_code=400, detail="Нельзя использовать offset вместе со stream")
+        query = ANOMALIES_KEYSET.order(query)
+        if cursor:
+            query = ANOMALIES_KEYSET.after(query, cursor)
+        return streaming_json_response(stream_row_batches(query, replica_router.sessionmaker()), stream, {}, "items")
+    
+    query = paginate(query, ANOMALIES_KEYSET, cursor, offset, limit)
     result = await db.execute(query)
-    anomalies = result.scalars().all()
+    anomalies, next_cursor = page_items(result.all(), ANOMALIES_KEYSET, limit)
     
     return {
-        "items": [
-            {
-                "id": str(a.id),
-                "equipment_id": str(a.equipment_id),
-                "detected_at": a.detected_at.isoformat(),
-                "severity": a.severity,
-                "anomaly_score": float(a.anomaly_score) if a.anomaly_score else None,
-                "anomaly_type": a.anomaly_type,
-                "status": a.status,
-            }
-            for a in anomalies
-        ],
+        "items": rows_as_dicts(anomalies),
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
     }
 
 
@@ -133,7 +148,7 @@ async def list_predictions(
     prediction_type: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список прогнозов
@@ -183,7 +198,7 @@ async def list_recommendations(
     status: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список рекомендаций
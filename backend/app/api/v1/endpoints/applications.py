@@ -8,11 +8,12 @@ from typing import Optional
 from uuid import UUID
 from pydantic import BaseModel, EmailStr
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.application import Application
 from app.api.v1.deps import get_current_user
 from app.models.user import User
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 class ApplicationCreate(BaseModel):
@@ -7,13 +7,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import timedelta, datetime
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.core.config import settings
-from app.core.security import verify_password, create_access_token
+from app.core.security import verify_password_async, create_access_token
 from app.models.user import User
 from app.api.v1.deps import get_current_user
 from pydantic import BaseModel
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 
@@ -51,7 +52,7 @@ async def login(
     result = await db.execute(query)
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
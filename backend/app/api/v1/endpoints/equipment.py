@@ -6,14 +6,50 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.equipment import Equipment
 from app.models.user import User
 from app.models.factory import Factory
 from app.api.v1.deps import get_current_user
 from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access, check_role
-from sqlalchemy import select, func
+from app.api.v1.pagination import Keyset, paginate, page_items
+from app.api.v1.projection import columns, rows_as_dicts
+from app.services.list_totals import list_total
+from app.services.equipment_search import search_equipment
+from sqlalchemy import select
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Порядок списка оборудования
+EQUIPMENT_KEYSET = Keyset(Equipment.name, Equipment.id, descending=False)
+
+# Колонки элемента списка
+EQUIPMENT_LIST_COLUMNS = columns(
+    Equipment.id, Equipment.name, Equipment.factory_id, Equipment.status,
+    Equipment.health_score, Equipment.workshop, Equipment.line,
+)
+
+
+def equipment_filters(
+    user_factory_id: Optional[UUID],
+    factory_id: Optional[UUID],
+    status: Optional[str],
+    equipment_type: Optional[UUID],
+    search: Optional[str],
+) -> list:
+    """Условия списка оборудования: общие для страницы и подсчёта total"""
+    conditions = []
+    # Не-админ видит только свой завод, админ может фильтровать по любому
+    effective_factory_id = user_factory_id or factory_id
+    if effective_factory_id:
+        conditions.append(Equipment.factory_id == effective_factory_id)
+    if status:
+        conditions.append(Equipment.status == status)
+    if equipment_type:
+        conditions.append(Equipment.equipment_type_id == equipment_type)
+    if search:
+        conditions.append(Equipment.name.ilike(f"%{search}%"))
+    return conditions
 
 
 @router.get("/")
@@ -24,6 +60,8 @@ async def list_equipment(
     search: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
+    total: str = Query("exact", pattern="^(exact|estimate|none)$", description="Подсчёт total: exact, estimate, none"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -31,49 +69,44 @@ async def list_equipment(
     Получить список оборудования с фильтрами
     Для не-админов показывается только оборудование их завода
     """
-    query = select(Equipment)
-    
-    # Фильтрация по доступу пользователя
     user_factory_id = get_user_factory_filter(current_user)
-    if user_factory_id:
-        # Если пользователь не админ, показываем только его завод
-        effective_factory_id = user_factory_id
-    else:
-        # Админ может фильтровать по любому заводу
-        effective_factory_id = factory_id
+    query = select(*EQUIPMENT_LIST_COLUMNS).where(*equipment_filters(
+        user_factory_id, factory_id, status, equipment_type, search
+    ))
     
-    if effective_factory_id:
-        query = query.where(Equipment.factory_id == effective_factory_id)
-    elif factory_id:
-        query = query.where(Equipment.factory_id == factory_id)
-    
-    if status:
-        query = query.where(Equipment.status == status)
-    if equipment_type:
-        query = query.where(Equipment.equipment_type_id == equipment_type)
-    if search:
-        query = query.where(Equipment.name.ilike(f"%{search}%"))
-    
-    # Подсчет общего количества
-    count_query = select(func.count()).select_from(Equipment)
-    if effective_factory_id:
-        count_query = count_query.where(Equipment.factory_id == effective_factory_id)
-    elif factory_id:
-        count_query = count_query.where(Equipment.factory_id == factory_id)
-    if status:
-        count_query = count_query.where(Equipment.status == status)
-    if equipment_type:
-        count_query = count_query.where(Equipment.equipment_type_id == equipment_type)
-    if search:
-        count_query = count_query.where(Equipment.name.ilike(f"%{search}%"))
-    
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
+    # Подсчет общего количества по тем же условиям
+    total_count, total_estimated = await list_total(db, query, total)
     
     # Получение данных с пагинацией
-    query = query.offset(offset).limit(limit)
+    query = paginate(query, EQUIPMENT_KEYSET, cursor, offset, limit)
     result = await db.execute(query)
-    equipment_list = result.scalars().all()
+    equipment_list, next_cursor = page_items(result.all(), EQUIPMENT_KEYSET, limit)
+    
+    return {
+        "items": rows_as_dicts(equipment_list),
+        "total": total_count,
+        "total_mode": total,
+        "total_estimated": total_estimated,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/search")
+async def search_equipment_endpoint(
+    q: str = Query(..., min_length=2, max_length=200, description="Название, серийный/инвентарный номер, производитель или модель"),
+    factory_id: Optional[UUID] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Поиск оборудования с допуском опечаток, по убыванию релевантности
+    Для не-админов ищется только оборудование их завода
+    """
+    user_factory_id = get_user_factory_filter(current_user)
+    rows = await search_equipment(db, q.strip(), user_factory_id or factory_id, limit)
     
     return {
         "items": [
@@ -81,16 +114,17 @@ async def list_equipment(
                 "id": str(e.id),
                 "name": e.name,
                 "factory_id": str(e.factory_id),
+                "serial_number": e.serial_number,
+                "inventory_number": e.inventory_number,
+                "manufacturer": e.manufacturer,
+                "model": e.model,
                 "status": e.status,
-                "health_score": float(e.health_score) if e.health_score else None,
-                "workshop": e.workshop,
-                "line": e.line,
+                "score": round(float(score), 4),
             }
-            for e in equipment_list
+            for e, score in rows
         ],
-        "total": total,
+        "query": q,
         "limit": limit,
-        "offset": offset
     }
 
 
@@ -6,13 +6,39 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.factory import Factory, Industry
 from app.models.user import User
 from app.api.v1.deps import get_current_user
 from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access
-from sqlalchemy import select, func
+from app.api.v1.pagination import Keyset, paginate, page_items
+from app.api.v1.projection import columns, rows_as_dicts
+from app.services.list_totals import list_total
+from sqlalchemy import select
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Порядок списка заводов
+FACTORY_KEYSET = Keyset(Factory.name, Factory.id, descending=False)
+
+# Колонки элемента списка
+FACTORY_LIST_COLUMNS = columns(Factory.id, Factory.name, Factory.city, Factory.status, Factory.equipment_count)
+
+
+def factory_filters(
+    user_factory_id: Optional[UUID],
+    industry_id: Optional[UUID],
+    status: Optional[str],
+) -> list:
+    """Условия списка заводов: общие для страницы и подсчёта total"""
+    conditions = []
+    if user_factory_id:
+        conditions.append(Factory.id == user_factory_id)
+    if industry_id:
+        conditions.append(Factory.industry_id == industry_id)
+    if status:
+        conditions.append(Factory.status == status)
+    return conditions
 
 
 @router.get("/")
@@ -21,6 +47,8 @@ async def list_factories(
     status: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
+    total: str = Query("exact", pattern="^(exact|estimate|none)$", description="Подсчёт total: exact, estimate, none"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -28,49 +56,25 @@ async def list_factories(
     Получить список заводов с фильтрами
     Для не-админов показываются только заводы, к которым есть доступ
     """
-    query = select(Factory)
-    
-    # Фильтрация по доступу пользователя
     user_factory_id = get_user_factory_filter(current_user)
-    if user_factory_id:
-        query = query.where(Factory.id == user_factory_id)
+    query = select(*FACTORY_LIST_COLUMNS).where(*factory_filters(user_factory_id, industry_id, status))
     
-    if industry_id:
-        query = query.where(Factory.industry_id == industry_id)
-    if status:
-        query = query.where(Factory.status == status)
-    
-    # Подсчет общего количества
-    count_query = select(func.count()).select_from(Factory)
-    if user_factory_id:
-        count_query = count_query.where(Factory.id == user_factory_id)
-    if industry_id:
-        count_query = count_query.where(Factory.industry_id == industry_id)
-    if status:
-        count_query = count_query.where(Factory.status == status)
-    
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
+    # Подсчет общего количества по тем же условиям
+    total_count, total_estimated = await list_total(db, query, total)
     
     # Получение данных с пагинацией
-    query = query.offset(offset).limit(limit)
+    query = paginate(query, FACTORY_KEYSET, cursor, offset, limit)
     result = await db.execute(query)
-    factories = result.scalars().all()
+    factories, next_cursor = page_items(result.all(), FACTORY_KEYSET, limit)
     
     return {
-        "items": [
-            {
-                "id": str(f.id),
-                "name": f.name,
-                "city": f.city,
-                "status": f.status,
-                "equipment_count": f.equipment_count,
-            }
-            for f in factories
-        ],
-        "total": total,
+        "items": rows_as_dicts(factories),
+        "total": total_count,
+        "total_mode": total,
+        "total_estimated": total_estimated,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
     }
 
 
@@ -8,12 +8,13 @@ from typing import Optional, List
 from uuid import UUID
 from pydantic import BaseModel, EmailStr
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.individual_entrepreneur import IndividualEntrepreneur, ip_factory_association
 from app.models.factory import Factory
 from app.models.user import User
 from app.api.v1.deps import get_current_user
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 class IPCreate(BaseModel):
@@ -6,13 +6,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.integrations import ExternalSystem
 from app.models.user import User
 from app.api.v1.deps import get_current_user
 from app.api.v1.endpoints.rbac import get_user_factory_filter
 from sqlalchemy import select
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.get("/")
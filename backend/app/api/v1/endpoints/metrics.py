@@ -1,20 +1,42 @@
 """
 API endpoints для метрик
 """
-from fastapi import APIRouter, Depends, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
-from datetime import datetime
-from app.core.database import get_db
+from datetime import datetime, timedelta, timezone
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.replicas import get_read_db, replica_router
+from app.core.responses import FastJSONRoute, streaming_json_response
 from app.models.metrics import MetricsCatalog, MetricsData
 from app.models.user import User
 from app.models.equipment import Equipment
-from app.api.v1.deps import get_current_user
+from app.api.v1.deps import authenticate_token, get_current_user, get_stream_user
 from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access
+from app.api.v1.export import export_response
+from app.api.v1.projection import columns, rows_as_dicts, stream_row_batches, stream_row_partitions
+from app.services.metrics_aggregation import build_bucket_query, parse_aggregates, serialize_buckets
+from app.services.metrics_downsampling import downsample_series
+from app.services.metrics_ingest import ingest_readings, parse_json_payload, parse_ndjson_payload
+from app.services.metrics_partitions import partition_manager, partition_start, partition_step
+from app.services.metrics_pubsub import Subscriber, metrics_broker
 from sqlalchemy import select, func
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Колонки точки сырых данных
+DATA_POINT_COLUMNS = columns(MetricsData.timestamp, MetricsData.value, MetricsData.is_anomaly, MetricsData.is_critical)
+
+# Колонки выгрузки сырых данных (заголовки файла - EXPORT_HEADERS)
+EXPORT_COLUMNS = columns(
+    MetricsData.timestamp, MetricsData.equipment_id, Equipment.name, MetricsCatalog.code,
+    MetricsData.value, MetricsCatalog.unit, MetricsData.is_anomaly, MetricsData.is_critical,
+)
+EXPORT_HEADERS = ["timestamp", "equipment_id", "equipment", "metric", "value", "unit", "is_anomaly", "is_critical"]
 
 
 @router.get("/catalog")
@@ -52,6 +74,43 @@ async def list_metrics_catalog(
     }
 
 
+@router.post("/ingest")
+async def ingest_metrics(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Пакетный приём показаний телеметрии
+    
+    Тело: JSON-массив (или {"readings": [...]}) либо NDJSON
+    (Content-Type: application/x-ndjson), по одному показанию на строку.
+    Показание - объект {equipment_id, metric_code, timestamp, value}
+    или компактный массив [equipment_id, metric_code, timestamp, value].
+    Принятые строки пишутся в metrics_data одним COPY.
+    Не-админы могут передавать данные только по оборудованию своего завода
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    
+    try:
+        if "ndjson" in content_type:
+            items = parse_ndjson_payload(body)
+        else:
+            items = parse_json_payload(body)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if len(items) > settings.METRICS_INGEST_MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Слишком большой пакет. Максимум {settings.METRICS_INGEST_MAX_BATCH} показаний"
+        )
+    
+    result = await ingest_readings(db, items, get_user_factory_filter(current_user))
+    return result.as_dict()
+
+
 @router.get("/data")
 async def get_metrics_data(
     equipment_id: UUID = Query(...),
@@ -59,12 +118,26 @@ async def get_metrics_data(
     start_time: Optional[datetime] = Query(None),
     end_time: Optional[datetime] = Query(None),
     limit: int = Query(100, le=1000),
+    bucket: Optional[str] = Query(None, pattern="^(1m|5m|1h|1d)$", description="Размер корзины агрегации: 1m, 5m, 1h, 1d"),
+    agg: str = Query("avg", description="Агрегаты через запятую: avg, min, max, last, count"),
+    downsample: Optional[str] = Query(None, pattern="^lttb$", description="Прореживание для графиков: lttb"),
+    points: int = Query(1000, ge=3, le=10000, description="Число точек после прореживания"),
+    stream: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="Потоковая выдача всех сырых точек: json, ndjson"),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить исторические данные метрик
     Для не-админов доступны только данные оборудования их завода
+    
+    С параметром bucket данные агрегируются в SQL: по одной строке
+    на корзину и метрику, корзины по возрастанию времени
+    
+    С downsample=lttb ряд одной метрики (metric_id обязателен) сводится
+    к points точкам с сохранением пиков, по возрастанию времени
+    
+    Со stream=json|ndjson отдаются все сырые точки за период без limit,
+    порциями из серверного курсора
     """
     # Проверка доступа к оборудованию
     equipment = await db.scalar(select(Equipment).where(Equipment.id == equipment_id))
@@ -73,7 +146,60 @@ async def get_metrics_data(
     
     check_factory_access(current_user, equipment.factory_id)
     
-    query = select(MetricsData).where(MetricsData.equipment_id == equipment_id)
+    if bucket and downsample:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Параметры bucket и downsample несовместимы"
+        )
+    if stream and (bucket or downsample):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Потоковая выдача доступна только для сырых точек"
+        )
+    
+    if downsample:
+        if not metric_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Для прореживания требуется metric_id"
+            )
+        
+        source_points, xs, ys = await downsample_series(
+            db, equipment_id, metric_id, points, start_time=start_time, end_time=end_time
+        )
+        return {
+            "equipment_id": str(equipment_id),
+            "metric_id": str(metric_id),
+            "downsample": downsample,
+            "source_points": source_points,
+            "data_points": [
+                {
+                    "timestamp": datetime.fromtimestamp(x, tz=timezone.utc).isoformat(),
+                    "value": y,
+                }
+                for x, y in zip(xs.tolist(), ys.tolist())
+            ]
+        }
+    
+    if bucket:
+        try:
+            aggregates = parse_aggregates(agg)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        
+        bucket_query = build_bucket_query(
+            equipment_id, bucket, aggregates,
+            metric_id=metric_id, start_time=start_time, end_time=end_time,
+        )
+        result = await db.execute(bucket_query)
+        return {
+            "equipment_id": str(equipment_id),
+            "bucket": bucket,
+            "aggregates": aggregates,
+            "data_points": serialize_buckets(result.all(), aggregates),
+        }
+    
+    query = select(*DATA_POINT_COLUMNS).where(MetricsData.equipment_id == equipment_id)
     
     if metric_id:
         query = query.where(MetricsData.metric_id == metric_id)
@@ -82,20 +208,231 @@ async def get_metrics_data(
     if end_time:
         query = query.where(MetricsData.timestamp <= end_time)
     
-    query = query.order_by(MetricsData.timestamp.desc()).limit(limit)
-    result = await db.execute(query)
-    data_points = result.scalars().all()
+    query = query.order_by(MetricsData.timestamp.desc())
+    if stream:
+        return streaming_json_response(
+            stream_row_batches(query, replica_router.sessionmaker()), stream, {"equipment_id": equipment_id}, "data_points"
+        )
+    
+    result = await db.execute(query.limit(limit))
     
     return {
-        "equipment_id": str(equipment_id),
-        "data_points": [
-            {
-                "timestamp": dp.timestamp.isoformat(),
-                "value": float(dp.value) if dp.value else None,
-                "is_anomaly": dp.is_anomaly,
-                "is_critical": dp.is_critical,
-            }
-            for dp in data_points
-        ]
+        "equipment_id": equipment_id,
+        "data_points": rows_as_dicts(result.all()),
     }
 
+
+
+async def _export_partitions(query, time_range, sessionmaker):
+    """
+    Строки выгрузки порциями, окнами по секциям metrics_data
+
+    Каждое окно - отдельный запрос к одной секции: сортировка по времени
+    идёт в пределах окна, а не по всей выборке за год
+    """
+    if not time_range:
+        async for partition in stream_row_partitions(query, sessionmaker):
+            yield partition
+        return
+    
+    start, end = time_range
+    step = partition_step()
+    window = partition_start(start)
+    while window < end:
+        window_query = (
+            query.where(MetricsData.timestamp >= max(window, start))
+            .where(MetricsData.timestamp < min(window + step, end))
+        )
+        async for partition in stream_row_partitions(window_query, sessionmaker):
+            yield partition
+        window += step
+
+
+@router.get("/export")
+async def export_metrics_data(
+    equipment_id: Optional[UUID] = Query(None),
+    factory_id: Optional[UUID] = Query(None, description="Все оборудование завода"),
+    metric_id: Optional[UUID] = Query(None),
+    start_time: Optional[datetime] = Query(None),
+    end_time: Optional[datetime] = Query(None),
+    format: str = Query("csv", pattern="^(csv|excel)$"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Выгрузить сырые данные метрик в CSV или Excel
+    
+    Без limit, по возрастанию времени: строки читаются из серверного курсора
+    окнами по секциям и пишутся в ответ порциями. Для не-админов - только
+    оборудование их завода
+    """
+    if equipment_id:
+        equipment_factory_id = await db.scalar(select(Equipment.factory_id).where(Equipment.id == equipment_id))
+        if not equipment_factory_id:
+            raise HTTPException(status_code=404, detail="Оборудование не найдено")
+        check_factory_access(current_user, equipment_factory_id)
+        equipment_filter = Equipment.id == equipment_id
+        scope = equipment_id
+    else:
+        factory_id = get_user_factory_filter(current_user) or factory_id
+        if not factory_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Требуется equipment_id или factory_id"
+            )
+        check_factory_access(current_user, factory_id)
+        equipment_filter = Equipment.factory_id == factory_id
+        scope = factory_id
+    
+    query = (
+        select(*EXPORT_COLUMNS)
+        .join(Equipment, MetricsData.equipment_id == Equipment.id)
+        .join(MetricsCatalog, MetricsData.metric_id == MetricsCatalog.id)
+        .where(equipment_filter)
+    )
+    if metric_id:
+        query = query.where(MetricsData.metric_id == metric_id)
+    query = query.order_by(MetricsData.timestamp, MetricsData.equipment_id, MetricsData.metric_id)
+    
+    # Период выгрузки: запрошенный, в пределах существующих секций
+    start_time = start_time and (start_time if start_time.tzinfo else start_time.replace(tzinfo=timezone.utc))
+    end_time = end_time and (end_time if end_time.tzinfo else end_time.replace(tzinfo=timezone.utc))
+    time_range = await partition_manager.partition_range(await db.connection())
+    if time_range:
+        range_start, range_end = time_range
+        if start_time:
+            range_start = max(range_start, start_time)
+        if end_time:
+            range_end = min(range_end, end_time + timedelta(microseconds=1))
+        time_range = (range_start, range_end)
+    else:
+        if start_time:
+            query = query.where(MetricsData.timestamp >= start_time)
+        if end_time:
+            query = query.where(MetricsData.timestamp <= end_time)
+    
+    return await export_response(
+        _export_partitions(query, time_range, replica_router.sessionmaker()),
+        EXPORT_HEADERS, format, "Метрики", f"metrics_{scope}",
+    )
+
+
+async def authorize_subscription(db: AsyncSession, user: User, equipment_ids: List[UUID]) -> List[UUID]:
+    """Проверить список оборудования подписки и доступ к нему"""
+    equipment_ids = list(dict.fromkeys(equipment_ids))
+    if not settings.REALTIME_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Показания в реальном времени отключены"
+        )
+    if len(equipment_ids) > settings.REALTIME_MAX_EQUIPMENT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Не больше {settings.REALTIME_MAX_EQUIPMENT} единиц оборудования в подписке"
+        )
+    
+    result = await db.execute(
+        select(Equipment.id, Equipment.factory_id).where(Equipment.id.in_(equipment_ids))
+    )
+    factories = dict(result.all())
+    if len(factories) != len(equipment_ids):
+        raise HTTPException(status_code=404, detail="Оборудование не найдено")
+    for factory_id in set(factories.values()):
+        check_factory_access(user, factory_id)
+    return equipment_ids
+
+
+async def _next_message(subscriber: Subscriber) -> Optional[bytes]:
+    """Следующее сообщение или None, если за интервал heartbeat ничего не пришло"""
+    try:
+        return await asyncio.wait_for(subscriber.get(), settings.REALTIME_HEARTBEAT_SECONDS)
+    except asyncio.TimeoutError:
+        return None
+
+
+async def _sse_events(equipment_ids: List[UUID]):
+    # Подписка внутри генератора: если клиент отключится до первой порции,
+    # генератор не запустится и подписка не останется висеть
+    subscriber = await metrics_broker.subscribe(equipment_ids)
+    try:
+        yield b": connected\n\n"
+        while True:
+            message = await _next_message(subscriber)
+            yield b": ping\n\n" if message is None else b"data: " + message + b"\n\n"
+    finally:
+        # Starlette отменяет генератор при отключении клиента
+        metrics_broker.unsubscribe(subscriber)
+
+
+@router.get("/stream")
+async def stream_metrics(
+    equipment_id: List[UUID] = Query(..., description="Оборудование; параметр можно повторять"),
+    current_user: User = Depends(get_stream_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Новые показания оборудования в реальном времени (Server-Sent Events)
+    
+    Каждое событие - JSON: {"type": "readings", "equipment_id", "readings",
+    "anomalies"} на принятый пакет, либо {"type": "gap", "dropped"}, если
+    клиент не успевал читать и часть сообщений пропущена. Токен можно
+    передать в ?token=, так как EventSource не отправляет заголовки
+    """
+    equipment_ids = await authorize_subscription(db, current_user, equipment_id)
+    return StreamingResponse(
+        _sse_events(equipment_ids),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def metrics_websocket(
+    websocket: WebSocket,
+    equipment_id: List[UUID] = Query(...),
+    token: Optional[str] = Query(None),
+):
+    """
+    Новые показания оборудования в реальном времени (WebSocket)
+    
+    Сообщения те же, что у /metrics/stream. Токен - в ?token= или в
+    заголовке Authorization. Сессия БД нужна только на проверку доступа
+    и не держится открытой всё время соединения
+    """
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    try:
+        if not token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Не передан токен аутентификации")
+        async with AsyncSessionLocal() as db:
+            user = await authenticate_token(token, db)
+            equipment_ids = await authorize_subscription(db, user, equipment_id)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    
+    await websocket.accept()
+    subscriber = await metrics_broker.subscribe(equipment_ids)
+    
+    async def send_messages():
+        while True:
+            message = await _next_message(subscriber)
+            await websocket.send_text('{"type":"ping"}' if message is None else message.decode())
+    
+    async def receive_until_closed():
+        # Входящие сообщения не ожидаются; чтение нужно, чтобы заметить закрытие
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+    
+    tasks = [asyncio.ensure_future(send_messages()), asyncio.ensure_future(receive_until_closed())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        metrics_broker.unsubscribe(subscriber)
@@ -7,14 +7,52 @@ from typing import Optional
 from uuid import UUID
 from datetime import datetime
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
+from app.models.equipment import Equipment
 from app.models.production import ProductionCycle, MaintenanceLog
 from app.models.user import User
 from app.api.v1.deps import get_current_user
-from app.api.v1.endpoints.rbac import get_user_factory_filter
+from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access
+from app.api.v1.export import export_response
+from app.api.v1.pagination import Keyset, paginate, page_items
+from app.api.v1.projection import columns, rows_as_dicts, stream_row_partitions
 from fastapi import HTTPException
-from sqlalchemy import select, desc
+from sqlalchemy import select
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Порядок списков: свежие первыми
+CYCLES_KEYSET = Keyset(ProductionCycle.start_time, ProductionCycle.id)
+MAINTENANCE_KEYSET = Keyset(MaintenanceLog.scheduled_date, MaintenanceLog.id)
+
+# Колонки элементов списков
+CYCLE_LIST_COLUMNS = columns(
+    ProductionCycle.id, ProductionCycle.factory_id, ProductionCycle.equipment_id,
+    ProductionCycle.start_time, ProductionCycle.end_time, ProductionCycle.product_name,
+    ProductionCycle.planned_quantity, ProductionCycle.actual_quantity,
+    ProductionCycle.oee_score, ProductionCycle.status,
+)
+MAINTENANCE_LIST_COLUMNS = columns(
+    MaintenanceLog.id, MaintenanceLog.equipment_id, MaintenanceLog.type, MaintenanceLog.title,
+    MaintenanceLog.scheduled_date, MaintenanceLog.start_time, MaintenanceLog.end_time,
+    MaintenanceLog.duration_minutes, MaintenanceLog.cost, MaintenanceLog.status,
+)
+
+# Колонки выгрузки циклов (заголовки файла - имена колонок)
+CYCLE_EXPORT_COLUMNS = columns(
+    ProductionCycle.id, ProductionCycle.equipment_id, Equipment.name,
+    ProductionCycle.start_time, ProductionCycle.end_time, ProductionCycle.duration_minutes,
+    ProductionCycle.product_name, ProductionCycle.planned_quantity, ProductionCycle.actual_quantity,
+    ProductionCycle.quantity_unit, ProductionCycle.defect_quantity, ProductionCycle.quality_percentage,
+    ProductionCycle.oee_score, ProductionCycle.availability, ProductionCycle.performance, ProductionCycle.quality,
+    ProductionCycle.energy_consumed_kwh, ProductionCycle.shift, ProductionCycle.status,
+)
+CYCLE_EXPORT_HEADERS = [
+    "id", "equipment_id", "equipment", "start_time", "end_time", "duration_minutes",
+    "product_name", "planned_quantity", "actual_quantity", "quantity_unit", "defect_quantity",
+    "quality_percentage", "oee_score", "availability", "performance", "quality",
+    "energy_consumed_kwh", "shift", "status",
+]
 
 
 @router.get("/cycles")
@@ -24,13 +62,14 @@ async def list_production_cycles(
     status: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить список производственных циклов
     Для не-админов показываются только циклы их завода
     """
-    query = select(ProductionCycle)
+    query = select(*CYCLE_LIST_COLUMNS)
     
     # Фильтрация по доступу пользователя
     user_factory_id = get_user_factory_filter(current_user)
@@ -44,31 +83,60 @@ async def list_production_cycles(
     if status:
         query = query.where(ProductionCycle.status == status)
     
-    query = query.order_by(desc(ProductionCycle.start_time)).offset(offset).limit(limit)
+    query = paginate(query, CYCLES_KEYSET, cursor, offset, limit)
     result = await db.execute(query)
-    cycles = result.scalars().all()
+    cycles, next_cursor = page_items(result.all(), CYCLES_KEYSET, limit)
     
     return {
-        "items": [
-            {
-                "id": str(c.id),
-                "factory_id": str(c.factory_id),
-                "equipment_id": str(c.equipment_id) if c.equipment_id else None,
-                "start_time": c.start_time.isoformat() if c.start_time else None,
-                "end_time": c.end_time.isoformat() if c.end_time else None,
-                "product_name": c.product_name,
-                "planned_quantity": float(c.planned_quantity) if c.planned_quantity else None,
-                "actual_quantity": float(c.actual_quantity) if c.actual_quantity else None,
-                "oee_score": float(c.oee_score) if c.oee_score else None,
-                "status": c.status,
-            }
-            for c in cycles
-        ],
+        "items": rows_as_dicts(cycles),
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
     }
 
 
+@router.get("/cycles/export")
+async def export_production_cycles(
+    factory_id: Optional[UUID] = Query(None),
+    equipment_id: Optional[UUID] = Query(None),
+    status: Optional[str] = Query(None),
+    start_time: Optional[datetime] = Query(None),
+    end_time: Optional[datetime] = Query(None),
+    format: str = Query("csv", pattern="^(csv|excel)$"),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Выгрузить производственные циклы завода в CSV или Excel
+    
+    Без limit, порциями из серверного курсора, по времени начала.
+    Для не-админов - только циклы их завода
+    """
+    factory_id = get_user_factory_filter(current_user) or factory_id
+    if not factory_id:
+        raise HTTPException(status_code=400, detail="Требуется factory_id")
+    check_factory_access(current_user, factory_id)
+    
+    query = (
+        select(*CYCLE_EXPORT_COLUMNS)
+        .outerjoin(Equipment, ProductionCycle.equipment_id == Equipment.id)
+        .where(ProductionCycle.factory_id == factory_id)
+    )
+    if equipment_id:
+        query = query.where(ProductionCycle.equipment_id == equipment_id)
+    if status:
+        query = query.where(ProductionCycle.status == status)
+    if start_time:
+        query = query.where(ProductionCycle.start_time >= start_time)
+    if end_time:
+        query = query.where(ProductionCycle.start_time <= end_time)
+    
+    query = query.order_by(ProductionCycle.start_time, ProductionCycle.id)
+    return await export_response(
+        stream_row_partitions(query), CYCLE_EXPORT_HEADERS, format,
+        "Производственные циклы", f"production_cycles_{factory_id}",
+    )
+
+
 @router.get("/maintenance")
 async def list_maintenance_logs(
     equipment_id: Optional[UUID] = Query(None),
@@ -76,6 +144,7 @@ async def list_maintenance_logs(
     status: Optional[str] = Query(None),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -84,7 +153,7 @@ async def list_maintenance_logs(
     """
     from app.models.equipment import Equipment
     
-    query = select(MaintenanceLog).join(Equipment, MaintenanceLog.equipment_id == Equipment.id)
+    query = select(*MAINTENANCE_LIST_COLUMNS).join(Equipment, MaintenanceLog.equipment_id == Equipment.id)
     
     # Фильтрация по доступу пользователя
     user_factory_id = get_user_factory_filter(current_user)
@@ -103,27 +172,14 @@ async def list_maintenance_logs(
     if status:
         query = query.where(MaintenanceLog.status == status)
     
-    query = query.order_by(desc(MaintenanceLog.scheduled_date)).offset(offset).limit(limit)
+    query = paginate(query, MAINTENANCE_KEYSET, cursor, offset, limit)
     result = await db.execute(query)
-    logs = result.scalars().all()
+    logs, next_cursor = page_items(result.all(), MAINTENANCE_KEYSET, limit)
     
     return {
-        "items": [
-            {
-                "id": str(l.id),
-                "equipment_id": str(l.equipment_id),
-                "type": l.type,
-                "title": l.title,
-                "scheduled_date": l.scheduled_date.isoformat() if l.scheduled_date else None,
-                "start_time": l.start_time.isoformat() if l.start_time else None,
-                "end_time": l.end_time.isoformat() if l.end_time else None,
-                "duration_minutes": l.duration_minutes,
-                "cost": float(l.cost) if l.cost else None,
-                "status": l.status,
-            }
-            for l in logs
-        ],
+        "items": rows_as_dicts(logs),
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
     }
 
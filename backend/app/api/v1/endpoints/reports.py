@@ -1,18 +1,55 @@
 """
 API endpoints для отчетов
 """
-from fastapi import APIRouter, Depends, Query
+import asyncio
+import os
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.integrations import ReportTemplate, GeneratedReport
 from app.models.user import User
 from app.api.v1.deps import get_current_user
-from app.api.v1.endpoints.rbac import get_user_factory_filter
-from sqlalchemy import select, desc
+from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access
+from app.api.v1.pagination import Keyset, paginate, page_items
+from app.api.v1.projection import columns, rows_as_dicts
+from app.services.report_jobs import REPORT_FORMATS, REPORTS, default_period, report_path
+from app.utils.report_writers import FORMAT_EXTENSIONS, FORMAT_MEDIA_TYPES
+from app.worker import generate_report
+from sqlalchemy import select
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Порядок списка отчётов: свежие первыми
+REPORTS_KEYSET = Keyset(GeneratedReport.generated_at, GeneratedReport.id)
+
+# Колонки элемента списка отчётов
+REPORT_LIST_COLUMNS = columns(
+    GeneratedReport.id, GeneratedReport.template_id, GeneratedReport.factory_id,
+    GeneratedReport.report_type, GeneratedReport.format, GeneratedReport.status,
+    GeneratedReport.period_start, GeneratedReport.period_end, GeneratedReport.file_url,
+    GeneratedReport.file_size_bytes, GeneratedReport.row_count, GeneratedReport.duration_ms,
+    GeneratedReport.scheduled, GeneratedReport.generated_at, GeneratedReport.completed_at,
+)
+
+# Карточка отчёта: колонки списка и текст ошибки
+REPORT_DETAIL_COLUMNS = REPORT_LIST_COLUMNS + columns(GeneratedReport.error)
+
+
+class GenerateReportRequest(BaseModel):
+    """Параметры отчёта; тип и формат по умолчанию берутся из шаблона"""
+    template_id: Optional[UUID] = None
+    report_type: Optional[str] = None
+    format: Optional[str] = None
+    factory_id: Optional[UUID] = None
+    period_start: Optional[date] = None
+    period_end: Optional[date] = None
 
 
 @router.get("/templates")
@@ -57,45 +94,155 @@ async def list_generated_reports(
     template_id: Optional[UUID] = Query(None),
     limit: int = Query(50, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить список сгенерированных отчетов
     Для не-админов показываются только отчеты их завода
     """
-    query = select(GeneratedReport)
+    query = select(*REPORT_LIST_COLUMNS)
     
     # Фильтрация по доступу пользователя
     user_factory_id = get_user_factory_filter(current_user)
     if user_factory_id:
         query = query.where(GeneratedReport.factory_id == user_factory_id)
     elif factory_id:
-        from app.api.v1.endpoints.rbac import check_factory_access
         check_factory_access(current_user, factory_id)
         query = query.where(GeneratedReport.factory_id == factory_id)
     
     if template_id:
         query = query.where(GeneratedReport.template_id == template_id)
     
-    query = query.order_by(desc(GeneratedReport.generated_at)).offset(offset).limit(limit)
+    query = paginate(query, REPORTS_KEYSET, cursor, offset, limit)
     result = await db.execute(query)
-    reports = result.scalars().all()
+    reports, next_cursor = page_items(result.all(), REPORTS_KEYSET, limit)
     
     return {
-        "items": [
-            {
-                "id": str(r.id),
-                "template_id": str(r.template_id) if r.template_id else None,
-                "factory_id": str(r.factory_id) if r.factory_id else None,
-                "period_start": r.period_start.isoformat() if r.period_start else None,
-                "period_end": r.period_end.isoformat() if r.period_end else None,
-                "file_url": r.file_url,
-                "file_size_bytes": r.file_size_bytes,
-                "generated_at": r.generated_at.isoformat() if r.generated_at else None,
-            }
-            for r in reports
-        ],
+        "items": rows_as_dicts(reports),
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
+    }
+
+
+
+@router.post("/generate", status_code=status.HTTP_202_ACCEPTED)
+async def generate_report_job(
+    request: GenerateReportRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Поставить отчёт в очередь генерации
+    Отчёт строится воркером; статус - GET /reports/generated/{id},
+    файл после завершения - GET /reports/generated/{id}/file
+    """
+    report_type, report_format = request.report_type, request.format
+    if request.template_id:
+        template = await db.scalar(select(ReportTemplate).where(ReportTemplate.id == request.template_id))
+        if not template:
+            raise HTTPException(status_code=404, detail="Шаблон отчета не найден")
+        report_type = report_type or template.report_type
+        report_format = report_format or template.format
+    report_format = report_format or "pdf"
+    
+    if report_type not in REPORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Тип отчета должен быть одним из: {', '.join(REPORTS)}"
+        )
+    if report_format not in REPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Формат отчета должен быть одним из: {', '.join(REPORT_FORMATS)}"
+        )
+    
+    factory_id = get_user_factory_filter(current_user) or request.factory_id
+    if not factory_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Требуется factory_id")
+    check_factory_access(current_user, factory_id)
+    
+    period_start, period_end = default_period()
+    period_start = request.period_start or period_start
+    period_end = request.period_end or period_end
+    if period_end < period_start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="period_end раньше period_start"
+        )
+    
+    report = GeneratedReport(
+        template_id=request.template_id,
+        factory_id=factory_id,
+        report_type=report_type,
+        format=report_format,
+        period_start=period_start,
+        period_end=period_end,
+        status="queued",
+        generated_by=current_user.id,
+    )
+    db.add(report)
+    await db.commit()
+    
+    try:
+        # Публикация в брокер синхронная: не блокировать цикл событий API
+        await asyncio.to_thread(generate_report.apply_async, (str(report.id),), retry=False)
+    except Exception:
+        report.status = "failed"
+        report.error = "Очередь заданий недоступна"
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Очередь генерации отчетов недоступна, повторите попытку"
+        )
+    
+    return {
+        "id": str(report.id),
+        "status": report.status,
+        "report_type": report_type,
+        "format": report_format,
+        "status_url": f"{settings.API_V1_STR}/reports/generated/{report.id}",
     }
 
+
+async def _get_report(db: AsyncSession, report_id: UUID, current_user: User):
+    result = await db.execute(select(*REPORT_DETAIL_COLUMNS).where(GeneratedReport.id == report_id))
+    report = result.first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Отчет не найден")
+    check_factory_access(current_user, report.factory_id)
+    return report
+
+
+@router.get("/generated/{report_id}")
+async def get_generated_report(
+    report_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Состояние задания и параметры отчета"""
+    report = await _get_report(db, report_id, current_user)
+    return report._asdict()
+
+
+@router.get("/generated/{report_id}/file")
+async def download_generated_report(
+    report_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Скачать файл готового отчета"""
+    report = await _get_report(db, report_id, current_user)
+    if report.status != "completed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Отчет еще не готов (статус: {report.status})"
+        )
+    
+    # У отчетов, созданных до очереди заданий, формата и файла может не быть
+    path = report_path(report_id, report.format) if report.format in FORMAT_EXTENSIONS else None
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Файл отчета не найден")
+    
+    filename = f"{report.report_type}_{report.period_start}_{report.period_end}.{FORMAT_EXTENSIONS[report.format]}"
+    return FileResponse(path, media_type=FORMAT_MEDIA_TYPES[report.format], filename=filename)
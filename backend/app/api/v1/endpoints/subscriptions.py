@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID
 from app.core.database import get_db
+from app.core.responses import FastJSONRoute
 from app.models.subscription import Subscription
 from app.models.factory import Factory
 from app.models.user import User
@@ -13,7 +14,7 @@ from app.api.v1.deps import get_current_user
 from app.api.v1.endpoints.rbac import get_user_factory_filter, check_factory_access
 from sqlalchemy import select, func
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.get("/")
@@ -0,0 +1,77 @@
+"""
+Выгрузка больших выборок в CSV и Excel
+
+Строки приходят порциями (обычно stream_row_partitions - серверный курсор) и
+сразу уходят в ответ: CSV отдаётся chunked-потоком без сборки в памяти,
+xlsx пишется XlsxWriter в режиме constant_memory во временный файл, который
+удаляется сразу после записи и отдаётся из открытого дескриптора (место на
+диске освобождается и при обрыве соединения). Запись xlsx идёт в отдельном
+потоке, чтобы не занимать цикл событий API.
+"""
+import asyncio
+import os
+import tempfile
+from typing import Any, AsyncIterator, BinaryIO, Iterator, Sequence
+
+from fastapi.responses import StreamingResponse
+
+from app.utils.report_writers import FORMAT_EXTENSIONS, FORMAT_MEDIA_TYPES, ExcelStreamWriter, csv_chunk, csv_header
+
+# Размер порции при отдаче готового xlsx
+FILE_CHUNK_BYTES = 256 * 1024
+
+
+RowPartitions = AsyncIterator[Sequence[Sequence[Any]]]
+
+
+async def csv_export_chunks(partitions: RowPartitions, headers: Sequence[str]) -> AsyncIterator[bytes]:
+    """Шапка и порции строк в байтах CSV"""
+    yield csv_header(headers)
+    async for partition in partitions:
+        yield csv_chunk(partition)
+
+
+async def build_excel_export(partitions: RowPartitions, headers: Sequence[str], title: str) -> BinaryIO:
+    """Записать строки во временный xlsx; возвращает открытый файл (уже без имени на диске)"""
+    fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="export_")
+    os.close(fd)
+    try:
+        writer = await asyncio.to_thread(ExcelStreamWriter, path, title, headers)
+        try:
+            async for partition in partitions:
+                await asyncio.to_thread(writer.write_rows, partition)
+        finally:
+            # Книга закрывается и при ошибке: иначе её временные файлы constant_memory
+            # остаются открытыми до сборки мусора
+            await asyncio.to_thread(writer.close)
+        return open(path, "rb")
+    except BaseException:
+        # Сессия генератора порций освобождается сразу, а не при сборке мусора
+        aclose = getattr(partitions, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        raise
+    finally:
+        os.unlink(path)
+
+
+def _file_chunks(f: BinaryIO) -> Iterator[bytes]:
+    with f:
+        while chunk := f.read(FILE_CHUNK_BYTES):
+            yield chunk
+
+
+async def export_response(
+    partitions: RowPartitions, headers: Sequence[str], export_format: str, title: str, filename: str
+) -> StreamingResponse:
+    """Ответ с выгрузкой порций строк; filename без расширения"""
+    disposition = {"Content-Disposition": f'attachment; filename="{filename}.{FORMAT_EXTENSIONS[export_format]}"'}
+    if export_format == "csv":
+        return StreamingResponse(
+            csv_export_chunks(partitions, headers),
+            media_type=FORMAT_MEDIA_TYPES["csv"],
+            headers=disposition,
+        )
+    f = await build_excel_export(partitions, headers, title)
+    disposition["Content-Length"] = str(os.fstat(f.fileno()).st_size)
+    return StreamingResponse(_file_chunks(f), media_type=FORMAT_MEDIA_TYPES[export_format], headers=disposition)
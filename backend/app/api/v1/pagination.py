@@ -0,0 +1,108 @@
+"""
+Keyset-пагинация списков (курсоры)
+
+Курсор - непрозрачный токен с ключом сортировки и id последней строки
+страницы. Следующая страница выбирается условием по (ключ, id), поэтому
+её стоимость не зависит от глубины, в отличие от OFFSET.
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, and_, or_, tuple_
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load(value: Any, python_type: type) -> Any:
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+class Keyset:
+    """
+    Порядок списка: ключ сортировки и id для однозначности
+
+    Порядок NULL совпадает с PostgreSQL по умолчанию (при убывании NULL
+    первыми), поэтому индекс (ключ, id) подходит и для прямого, и для
+    обратного обхода
+    """
+
+    def __init__(self, key, id_column, descending: bool = True):
+        self.key = key
+        self.id_column = id_column
+        self.descending = descending
+        self._key_type = key.type.python_type
+
+    def order(self, query: Select) -> Select:
+        if self.descending:
+            return query.order_by(self.key.desc(), self.id_column.desc())
+        return query.order_by(self.key.asc(), self.id_column.asc())
+
+    def encode(self, item) -> str:
+        payload = [_dump(getattr(item, self.key.key)), str(getattr(item, self.id_column.key))]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> Tuple[Any, UUID]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            key_value, item_id = json.loads(raw)
+            return _load(key_value, self._key_type), UUID(item_id)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Неверный курсор",
+            )
+
+    def after(self, query: Select, cursor: str) -> Select:
+        """Строки строго после курсора в порядке order()"""
+        key_value, item_id = self.decode(cursor)
+        key, id_column = self.key, self.id_column
+        if self.descending:
+            if key_value is None:
+                return query.where(or_(and_(key.is_(None), id_column < item_id), key.isnot(None)))
+            return query.where(tuple_(key, id_column) < tuple_(key_value, item_id))
+        if key_value is None:
+            return query.where(and_(key.is_(None), id_column > item_id))
+        return query.where(or_(tuple_(key, id_column) > tuple_(key_value, item_id), key.is_(None)))
+
+
+def paginate(query: Select, keyset: Keyset, cursor: Optional[str], offset: int, limit: int) -> Select:
+    """
+    Упорядочить и ограничить запрос списка
+
+    С курсором offset не используется; выбирается limit + 1 строк, чтобы
+    понять, есть ли следующая страница
+    """
+    if cursor and offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя использовать cursor вместе с offset",
+        )
+    query = keyset.order(query)
+    if cursor:
+        query = keyset.after(query, cursor)
+    elif offset:
+        query = query.offset(offset)
+    return query.limit(limit + 1)
+
+
+def page_items(items: Sequence, keyset: Keyset, limit: int) -> Tuple[List, Optional[str]]:
+    """Отрезать лишнюю строку и вернуть (строки страницы, курсор следующей страницы)"""
+    items = list(items)
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, keyset.encode(items[-1])
@@ -0,0 +1,64 @@
+"""
+Лёгкое чтение списков: колонки ответа кортежами вместо сущностей ORM
+
+select(Model) загружает все колонки (включая JSONB и Text), создаёт объект на
+строку и регистрирует его в identity map сессии, а ответ потом собирается из
+нескольких атрибутов с переводом Numeric -> Decimal -> float. Здесь выбираются
+только колонки ответа, приведённые в SQL к типам JSON (Numeric -> float8,
+UUID -> text), а строки сразу отдаются в JSON-ответ на orjson.
+"""
+from typing import Any, AsyncIterator, Dict, List, Sequence
+
+from sqlalchemy import Float, Numeric, Select, Text, Uuid, cast
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+
+def _json_type(col):
+    # asyncpg отдаёт собственный тип UUID, который orjson не сериализует;
+    # в ответе UUID всё равно строка
+    if isinstance(col.type, Uuid):
+        return Text
+    if isinstance(col.type, Numeric) and not isinstance(col.type, Float):
+        return Float
+    return None
+
+
+def columns(*cols) -> list:
+    """Колонки для select(): UUID и Numeric приводятся к text и float8 под тем же именем"""
+    result = []
+    for col in cols:
+        json_type = _json_type(col)
+        result.append(cast(col, json_type).label(col.key) if json_type else col)
+    return result
+
+
+def rows_as_dicts(rows: Sequence) -> List[Dict[str, Any]]:
+    """Строки Row -> словари элементов ответа (ключи - имена колонок)"""
+    return [row._asdict() for row in rows]
+
+
+async def stream_row_partitions(
+    query: Select, sessionmaker: async_sessionmaker = AsyncSessionLocal
+) -> AsyncIterator[Sequence]:
+    """
+    Строки запроса порциями (Row) через серверный курсор
+
+    Открывает свою сессию (sessionmaker - например, реплики для чтения):
+    сессия запроса (get_db) закрывается до того, как потоковый ответ
+    начнёт отдавать тело
+    """
+    async with sessionmaker() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.STREAM_BATCH_ROWS))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def stream_row_batches(
+    query: Select, sessionmaker: async_sessionmaker = AsyncSessionLocal
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Строки запроса порциями словарей (см. stream_row_partitions)"""
+    async for partition in stream_row_partitions(query, sessionmaker):
+        yield rows_as_dicts(partition)
@@ -0,0 +1,88 @@
+"""
+Кэш в Redis (REDIS_URL)
+
+Кэш необязателен: при недоступном Redis операции молча пропускаются,
+а повторное подключение пробуется не чаще раза в RETRY_SECONDS.
+"""
+import json
+import time
+from typing import Any, Optional
+
+import redis.asyncio as redis
+from loguru import logger
+
+from app.core.config import settings
+
+# Пауза перед новой попыткой после ошибки Redis (секунды)
+RETRY_SECONDS = 30.0
+# Таймауты, чтобы недоступный Redis не задерживал ответы API
+SOCKET_TIMEOUT_SECONDS = 0.25
+
+_client: Optional[redis.Redis] = None
+_disabled_until = 0.0
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """Клиент Redis или None, если Redis недавно был недоступен"""
+    global _client
+    if time.monotonic() < _disabled_until:
+        return None
+    if _client is None:
+        _client = redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=SOCKET_TIMEOUT_SECONDS,
+        )
+    return _client
+
+
+def _mark_unavailable(e: Exception):
+    global _disabled_until
+    if time.monotonic() >= _disabled_until:
+        logger.warning(f"Redis недоступен, кэш отключён на {RETRY_SECONDS:.0f} с: {e}")
+    _disabled_until = time.monotonic() + RETRY_SECONDS
+
+
+async def cache_get_json(key: str) -> Optional[Any]:
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = await client.get(key)
+    except (redis.RedisError, OSError) as e:
+        _mark_unavailable(e)
+        return None
+    return json.loads(raw) if raw is not None else None
+
+
+async def cache_set_json(key: str, value: Any, ttl_seconds: int):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        await client.set(key, json.dumps(value), ex=ttl_seconds)
+    except (redis.RedisError, OSError) as e:
+        _mark_unavailable(e)
+
+
+async def cache_delete(*keys: str):
+    client = get_redis()
+    if client is None or not keys:
+        return
+    try:
+        await client.delete(*keys)
+    except (redis.RedisError, OSError) as e:
+        _mark_unavailable(e)
+
+
+async def cache_delete_prefix(prefix: str):
+    """Удалить все ключи с префиксом (SCAN, без блокировки Redis)"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        keys = [key async for key in client.scan_iter(match=f"{prefix}*", count=500)]
+        if keys:
+            await client.delete(*keys)
+    except (redis.RedisError, OSError) as e:
+        _mark_unavailable(e)
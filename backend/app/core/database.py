@@ -1,25 +1,135 @@
 """
 Настройка подключения к базе данных
 """
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
 
+
+class PoolStats:
+    """
+    Счётчики пула соединений
+
+    Ожидание - время от запроса соединения до его выдачи: очередь пула,
+    открытие нового соединения и pre_ping. Пул у каждого воркера uvicorn
+    свой, поэтому и счётчики - на процесс
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.overflow_checkouts = 0  # выдано, когда пул уже сверх pool_size
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_checked_out = 0
+        self.max_overflow_in_use = 0
+
+    def record_checkout(self, pool: "InstrumentedPool", wait_seconds: float):
+        self.checkouts += 1
+        self.wait_seconds_total += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.max_checked_out = max(self.max_checked_out, pool.checkedout())
+        overflow = max(pool.overflow(), 0)
+        self.max_overflow_in_use = max(self.max_overflow_in_use, overflow)
+        if overflow:
+            self.overflow_checkouts += 1
+
+    def snapshot(self, pool: "InstrumentedPool") -> Dict[str, Any]:
+        """Размер пула, занятые соединения и ожидание выдачи"""
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "timeout_seconds": settings.DB_POOL_TIMEOUT_SECONDS,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow_in_use": max(pool.overflow(), 0),
+            "max_checked_out": self.max_checked_out,
+            "max_overflow_in_use": self.max_overflow_in_use,
+            "checkouts": self.checkouts,
+            "overflow_checkouts": self.overflow_checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "avg_wait_ms": round(self.wait_seconds_total / self.checkouts * 1000, 3) if self.checkouts else None,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+# Счётчики по имени пула (primary, replica1, ...); переживают пересоздание пула при dispose
+pool_stats: Dict[str, PoolStats] = {}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool с замером ожидания соединения (pool_stats[logging_name])"""
+
+    def connect(self):
+        stats = pool_stats.setdefault(self.logging_name, PoolStats())
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            stats.timeouts += 1
+            raise
+        stats.record_checkout(self, time.perf_counter() - started)
+        return connection
+
+
+def make_engine(url: str, name: str) -> AsyncEngine:
+    """Движок с пулом из настроек DB_POOL_*; name - имя пула в pool_stats"""
+    return create_async_engine(
+        url,
+        echo=False,  # Отключаем SQL логи для production
+        future=True,
+        poolclass=InstrumentedPool,
+        pool_logging_name=name,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            # Кэши подготовленных запросов asyncpg и SQLAlchemy; 0 - за pgbouncer в режиме transaction
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+
 # Создание движка базы данных
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,  # Отключаем SQL логи для production
-    future=True,
-)
+# Соединений с Postgres на процесс - до DB_POOL_SIZE + DB_MAX_OVERFLOW на каждый движок
+engine = make_engine(settings.DATABASE_URL, "primary")
+
+# Реплики только для чтения (маршрутизация - app/core/replicas.py)
+replica_engines: List[AsyncEngine] = [
+    make_engine(url, f"replica{number}") for number, url in enumerate(settings.DATABASE_REPLICA_URLS, 1)
+]
+
+
+def database_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Состояние пулов основной БД и реплик этого процесса"""
+    result = {}
+    for db_engine in [engine, *replica_engines]:
+        pool = db_engine.sync_engine.pool
+        result[pool.logging_name] = pool_stats.get(pool.logging_name, PoolStats()).snapshot(pool)
+    return result
+
+
+def make_sessionmaker(db_engine: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(
+        db_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False,
+    )
+
 
 # Фабрика сессий
-AsyncSessionLocal = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False,
-)
+AsyncSessionLocal = make_sessionmaker(engine)
 
 # Базовый класс для моделей
 Base = declarative_base()
@@ -34,4 +144,3 @@ async def get_db() -> AsyncSession:
             yield session
         finally:
             await session.close()
-
@@ -0,0 +1,214 @@
+"""
+Метрики Prometheus: задержка и размер ответов по маршрутам, запросы к БД
+
+PrometheusMiddleware (ASGI) на каждый HTTP-запрос пишет длительность (для
+потоковых ответов - до отдачи последней порции), размер тела ответа и число
+запросов в обработке. Маршрут в метках - шаблон пути
+(/api/v1/equipment/{equipment_id}), ненайденные пути - "unmatched".
+
+Запросы к БД считаются событиями before/after_cursor_execute движков
+основной БД и реплик и относятся к текущему HTTP-запросу через contextvar:
+http_request_db_queries и http_request_db_seconds по маршруту показывают
+N+1 (число запросов растёт с размером входных данных) и долю времени в БД.
+
+GET /metrics отдаёт метрики в формате Prometheus, включая счётчики
+сервисов процесса (хеширование паролей, кэш пользователей, приём
+телеметрии, подписки, пулы соединений, реплики). С несколькими воркерами
+uvicorn задайте PROMETHEUS_MULTIPROC_DIR (общий пустой каталог): метрики
+запросов собираются со всех процессов, счётчики сервисов - процесса,
+ответившего на запрос.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import FastAPI
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.database import database_pool_stats, engine, replica_engines
+from app.core.replicas import replica_router
+from app.core.security import password_hasher
+from app.core.user_cache import user_cache
+from app.services.metrics_ingest import ingest_stats
+from app.services.metrics_pubsub import metrics_broker
+
+METRICS_PATH = "/metrics"
+UNMATCHED_ROUTE = "unmatched"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Длительность HTTP-запроса", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP-запросы в обработке", ["method"], multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Размер тела ответа", ["method", "route"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Запросов к БД за HTTP-запрос", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Время в запросах к БД за HTTP-запрос", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class RequestDbStats:
+    """Запросы к БД текущего HTTP-запроса"""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+
+
+def instrument_engines():
+    """Подключить учёт запросов к движкам основной БД и реплик"""
+    for db_engine in [engine, *replica_engines]:
+        if not event.contains(db_engine.sync_engine, "after_cursor_execute", _after_cursor_execute):
+            event.listen(db_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(db_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class PrometheusMiddleware:
+    """Метрики HTTP-запросов по маршрутам (ASGI)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        db_stats = RequestDbStats()
+        token = _request_db_stats.set(db_stats)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress.dec()
+            _request_db_stats.reset(token)
+            # FastAPI кладёт найденный маршрут в scope
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            REQUEST_LATENCY.labels(method, route, str(status_code)).observe(elapsed)
+            RESPONSE_SIZE.labels(method, route).observe(response_size)
+            REQUEST_DB_QUERIES.labels(method, route).observe(db_stats.queries)
+            REQUEST_DB_SECONDS.labels(method, route).observe(db_stats.seconds)
+
+
+def _metric_name(prefix: str, key: str) -> str:
+    # CounterMetricFamily сам добавляет суффикс _total
+    return f"{prefix}_{key[:-len('_total')] if key.endswith('_total') else key}"
+
+
+def _families(
+    prefix: str, rows: Iterable[Tuple[Dict[str, str], Dict[str, Any]]], counters: Set[str]
+) -> Iterable:
+    """Семейства метрик из строк (метки, stats()); числовые значения, по семейству на ключ"""
+    families: Dict[str, Any] = {}
+    for labels, stats in rows:
+        for key, value in stats.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            family = families.get(key)
+            if family is None:
+                family_class = CounterMetricFamily if key in counters else GaugeMetricFamily
+                family = families[key] = family_class(_metric_name(prefix, key), f"{prefix}: {key}", labels=list(labels))
+            family.add_metric(list(labels.values()), value)
+    return families.values()
+
+
+# Счётчики сервисов процесса: (префикс метрик, stats(), ключи-счётчики; остальные - gauge)
+SERVICE_STATS: tuple = (
+    ("password_hashing", password_hasher.stats, {"completed", "rejected"}),
+    ("user_cache", user_cache.stats, {"hits", "redis_hits", "misses"}),
+    ("ingest", ingest_stats.stats, {"rows", "batches"}),
+    ("realtime", metrics_broker.stats, {"published", "delivered", "dropped"}),
+)
+
+POOL_COUNTERS = {"checkouts", "overflow_checkouts", "timeouts", "wait_seconds_total"}
+
+
+class ServiceStatsCollector:
+    """Текущие значения stats() сервисов процесса в формате Prometheus"""
+
+    def __init__(self, sources: Iterable[tuple] = SERVICE_STATS):
+        self.sources = sources
+
+    def collect(self):
+        for prefix, stats, counters in self.sources:
+            yield from _families(prefix, [({}, stats())], counters)
+        yield from _families(
+            "db_pool", [({"pool": pool}, stats) for pool, stats in database_pool_stats().items()], POOL_COUNTERS
+        )
+
+        replicas = replica_router.stats()
+        yield from _families("db_read", [({}, replicas)], {"primary_sessions", "fallbacks"})
+        yield from _families(
+            "db_replica", [({"replica": replica["name"]}, replica) for replica in replicas["replicas"]], {"sessions"}
+        )
+
+
+def metrics_endpoint(request: Request) -> Response:
+    """Экспорт метрик Prometheus"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(ServiceStatsCollector())
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def instrument_app(app: FastAPI):
+    """Middleware метрик, учёт запросов к БД и GET /metrics"""
+    instrument_engines()
+    app.add_middleware(PrometheusMiddleware)
+    app.add_route(METRICS_PATH, metrics_endpoint, methods=["GET"], include_in_schema=False)
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        REGISTRY.register(ServiceStatsCollector())
@@ -0,0 +1,142 @@
+"""
+Маршрутизация чтения на реплики (DATABASE_REPLICA_URLS)
+
+Тяжёлые запросы на чтение (аналитика, дашборд, /metrics/data) берут сессию
+через get_read_db: реплики чередуются по кругу, а реплика с отставанием
+больше REPLICA_MAX_LAG_SECONDS, недоступная или давно не проверенная
+пропускается. Если подходящих реплик нет (или они не настроены), чтение
+идёт в основную БД. Отставание проверяет фоновая задача
+run_replica_lag_monitor раз в REPLICA_LAG_CHECK_SECONDS.
+
+Результаты, которые кэшируются до сброса при записи (dashboard/stats),
+считаются по основной БД: реплика вернула бы в кэш данные до записи.
+"""
+import asyncio
+import itertools
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, make_sessionmaker, replica_engines
+
+# Отставание воспроизведения WAL; 0, если реплика догнала всё полученное (или это не реплика)
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class Replica:
+    """Реплика: сессии, последнее измеренное отставание и счётчик выданных сессий"""
+
+    def __init__(self, engine: AsyncEngine):
+        self.name = engine.sync_engine.pool.logging_name
+        self.engine = engine
+        self.sessionmaker = make_sessionmaker(engine)
+        self.lag_seconds: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.sessions = 0
+
+    def available(self, now: float) -> bool:
+        # Замер старше трёх интервалов проверки не считается актуальным
+        return (
+            self.lag_seconds is not None
+            and self.lag_seconds <= settings.REPLICA_MAX_LAG_SECONDS
+            and now - self.checked_at <= settings.REPLICA_LAG_CHECK_SECONDS * 3
+        )
+
+    async def _read_lag(self) -> float:
+        async with self.engine.connect() as conn:
+            return float(await conn.scalar(text(LAG_SQL)))
+
+    async def check_lag(self):
+        was_available = self.available(time.monotonic())
+        try:
+            self.lag_seconds = await asyncio.wait_for(self._read_lag(), settings.REPLICA_LAG_CHECK_SECONDS)
+            self.error = None
+        except Exception as e:
+            self.lag_seconds, self.error = None, str(e)[:200]
+        self.checked_at = time.monotonic()
+
+        available = self.available(self.checked_at)
+        if was_available and not available:
+            logger.warning(f"Реплика {self.name} исключена из чтения: отставание {self.lag_seconds}, ошибка {self.error}")
+        elif available and not was_available:
+            logger.info(f"Реплика {self.name} доступна для чтения, отставание {self.lag_seconds:.2f} с")
+
+
+class ReplicaRouter:
+    """Выбор сессии для чтения: реплики по кругу, основная БД - запасной вариант"""
+
+    def __init__(self, engines: List[AsyncEngine]):
+        self.replicas = [Replica(engine) for engine in engines]
+        self._order = itertools.cycle(self.replicas)
+        self.primary_sessions = 0
+        self.fallbacks = 0  # реплики настроены, но ни одна не подошла
+
+    def sessionmaker(self) -> async_sessionmaker:
+        """Фабрика сессий для очередного запроса на чтение"""
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = next(self._order)
+            if replica.available(now):
+                replica.sessions += 1
+                return replica.sessionmaker
+        if self.replicas:
+            self.fallbacks += 1
+        self.primary_sessions += 1
+        return AsyncSessionLocal
+
+    async def check_lag(self):
+        await asyncio.gather(*(replica.check_lag() for replica in self.replicas))
+
+    def stats(self) -> Dict[str, Any]:
+        """Отставание и доступность реплик, распределение сессий чтения"""
+        now = time.monotonic()
+        return {
+            "max_lag_seconds": settings.REPLICA_MAX_LAG_SECONDS,
+            "primary_sessions": self.primary_sessions,
+            "fallbacks": self.fallbacks,
+            "replicas": [
+                {
+                    "name": replica.name,
+                    "available": replica.available(now),
+                    "lag_seconds": None if replica.lag_seconds is None else round(replica.lag_seconds, 3),
+                    "checked_seconds_ago": None if replica.checked_at is None else round(now - replica.checked_at, 1),
+                    "error": replica.error,
+                    "sessions": replica.sessions,
+                }
+                for replica in self.replicas
+            ],
+        }
+
+
+replica_router = ReplicaRouter(replica_engines)
+
+
+async def get_read_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency: сессия только для чтения - реплика или основная БД
+
+    Только для эндпоинтов без записи: на реплике запись завершится ошибкой
+    """
+    async with replica_router.sessionmaker()() as session:
+        yield session
+
+
+async def run_replica_lag_monitor():
+    """Фоновая проверка отставания реплик"""
+    while True:
+        try:
+            await replica_router.check_lag()
+        except Exception as e:
+            logger.error(f"Ошибка проверки реплик: {e}")
+        await asyncio.sleep(settings.REPLICA_LAG_CHECK_SECONDS)
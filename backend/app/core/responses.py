@@ -0,0 +1,128 @@
+"""
+JSON-ответы на orjson
+
+FastJSONResponse сериализует UUID, datetime, date, Decimal и массивы numpy
+без предварительного jsonable_encoder. FastJSONRoute для маршрутов без
+response_model отдаёт результат обработчика прямо в FastJSONResponse
+(FastAPI иначе прогоняет каждый dict через jsonable_encoder). Для больших
+массивов - потоковый ответ: JSON с массивом, дописываемым порциями, или
+NDJSON (объект на строку); тело целиком в памяти не собирается.
+"""
+import asyncio
+import functools
+import uuid
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from fastapi.utils import is_body_allowed_for_status_code
+from pydantic import BaseModel
+from starlette.responses import Response
+
+STREAM_FORMATS = ("json", "ndjson")
+STREAM_MEDIA_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    # orjson понимает только точный uuid.UUID, asyncpg отдаёт свой подкласс
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse на orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Маршрут, который отдаёт dict/list обработчика в FastJSONResponse напрямую
+
+    Маршруты с response_model не меняются: валидация и сериализация модели
+    остаются за FastAPI
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        if self.response_field is None:
+            # Обработчик запроса читает dependant.call при каждом вызове
+            self.dependant.call = self._wrap(self.dependant.call, self.status_code)
+
+    @staticmethod
+    def _wrap(call, status_code):
+        def respond(result):
+            if isinstance(result, Response):
+                return result
+            # 204, 304 и 1xx без тела, как у FastAPI
+            if not is_body_allowed_for_status_code(status_code):
+                return Response(status_code=status_code)
+            return FastJSONResponse(result, status_code=status_code or 200)
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def endpoint(**values):
+                return respond(await call(**values))
+        else:
+            @functools.wraps(call)
+            def endpoint(**values):
+                return respond(call(**values))
+        return endpoint
+
+
+async def _json_array_chunks(
+    batches: AsyncIterator[List[Dict[str, Any]]], envelope: Dict[str, Any], key: str
+) -> AsyncIterator[bytes]:
+    # {"...": ..., "key":[  - порции через запятую -  ]}
+    head = dumps({**envelope, key: []})
+    yield head[:-2]
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        chunk = b",".join(dumps(item) for item in batch)
+        yield chunk if first else b"," + chunk
+        first = False
+    yield head[-2:]
+
+
+async def _ndjson_chunks(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        if batch:
+            yield b"".join(dumps(item) + b"\n" for item in batch)
+
+
+def streaming_json_response(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+    stream_format: str,
+    envelope: Dict[str, Any],
+    key: str,
+) -> StreamingResponse:
+    """
+    Потоковый ответ из порций строк
+
+    json - тот же объект, что и обычный ответ (envelope + массив key);
+    ndjson - только элементы массива, по одному на строку
+    """
+    if stream_format == "ndjson":
+        chunks = _ndjson_chunks(batches)
+    else:
+        chunks = _json_array_chunks(batches, envelope, key)
+    return StreamingResponse(chunks, media_type=STREAM_MEDIA_TYPES[stream_format])
@@ -1,8 +1,11 @@
 """
 Модуль для работы с безопасностью и JWT токенами
 """
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import bcrypt
@@ -34,6 +37,76 @@ def get_password_hash(password: str) -> str:
         return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 
+class PasswordHashingBusy(Exception):
+    """Очередь на хеширование паролей переполнена"""
+
+
+class PasswordHasher:
+    """
+    bcrypt вне event loop: отдельный пул потоков с ограниченным числом
+    одновременных хеширований и ограниченной очередью ожидания
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.run_seconds_total = 0.0
+
+    async def run(self, func: Callable, *args) -> Any:
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordHashingBusy()
+
+        def timed():
+            started = time.perf_counter()
+            return started, func(*args), time.perf_counter()
+
+        submitted = time.perf_counter()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            started, result, finished = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.wait_seconds_total += started - submitted
+        self.run_seconds_total += finished - started
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики пула и очереди"""
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(self.in_flight - self.workers, 0),
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds_total / self.completed * 1000, 2) if self.completed else None,
+            "avg_hash_ms": round(self.run_seconds_total / self.completed * 1000, 2) if self.completed else None,
+        }
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле хеширования"""
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Хеширование пароля в пуле хеширования"""
+    return await password_hasher.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Создание JWT токена"""
     to_encode = data.copy()
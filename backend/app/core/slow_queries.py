@@ -0,0 +1,288 @@
+"""
+Журнал медленных запросов к БД (SLOW_QUERY_LOG_ENABLED)
+
+События before/after_cursor_execute движков основной БД и реплик замеряют
+каждый запрос; запросы дольше SLOW_QUERY_THRESHOLD_MS пишутся в лог и
+сводятся по тексту SQL (списки IN ($1, $2, ...) разной длины - один
+запрос): число вызовов, суммарное и максимальное время, маршруты и
+пользователи, параметры самого медленного вызова. Строковые параметры в
+сводку не попадают - только их длина.
+
+Для медленных SELECT в фоне снимается план EXPLAIN (ANALYZE, BUFFERS) - не
+чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS на запрос. ANALYZE выполняет
+запрос повторно, поэтому план снимается в транзакции только для чтения с
+statement_timeout и откатом.
+
+Сводка - на процесс (GET /api/v1/admin/database/slow-queries), по убыванию
+суммарного времени.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Set
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.database import engine, replica_engines
+
+# Списки IN ($1::UUID, $2::UUID, ...) любой длины и номера параметров сводятся к одному виду
+_IN_LIST = re.compile(r"\bIN \(\$\d+(?:::[\w ]+)?(?:\s*,\s*\$\d+(?:::[\w ]+)?)*\)", re.IGNORECASE)
+_PARAM = re.compile(r"\$\d+")
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+MAX_STATEMENT_LENGTH = 4000
+MAX_ROUTES = 10
+MAX_USERS = 10
+MAX_CONCURRENT_EXPLAINS = 2
+
+
+class QueryScope:
+    """Откуда выполняется запрос: HTTP-маршрут и пользователь"""
+
+    __slots__ = ("asgi_scope", "user_id")
+
+    def __init__(self, asgi_scope: Optional[dict] = None):
+        self.asgi_scope = asgi_scope
+        self.user_id: Optional[str] = None
+
+    @property
+    def route(self) -> str:
+        if self.asgi_scope is None:
+            return "background"
+        # FastAPI кладёт найденный маршрут в scope до вызова эндпоинта
+        path = getattr(self.asgi_scope.get("route"), "path", None) or "unmatched"
+        return f"{self.asgi_scope['method']} {path}"
+
+
+_query_scope: contextvars.ContextVar[Optional[QueryScope]] = contextvars.ContextVar("query_scope", default=None)
+# Запросы самого EXPLAIN не замеряются
+_explaining: contextvars.ContextVar[bool] = contextvars.ContextVar("slow_query_explaining", default=False)
+
+
+def bind_query_user(user_id: Any):
+    """Запомнить пользователя текущего HTTP-запроса для журнала медленных запросов"""
+    query_scope = _query_scope.get()
+    if query_scope is not None:
+        query_scope.user_id = str(user_id)
+
+
+class QueryScopeMiddleware:
+    """Контекст HTTP-запроса для журнала медленных запросов (ASGI)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _query_scope.set(QueryScope(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _query_scope.reset(token)
+
+
+def redact(value: Any) -> Any:
+    """Параметр для сводки: числа, даты и UUID как есть, строки и байты - только длина"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    if isinstance(value, dict):
+        return {str(key): redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redact(item) for item in value[:10]]
+        if len(value) > 10:
+            items.append(f"<+{len(value) - 10}>")
+        return items
+    return f"<{type(value).__name__}>"
+
+
+class SlowQuery:
+    """Сводка по одному тексту SQL"""
+
+    def __init__(self, fingerprint: str, statement: str, pool: str):
+        self.fingerprint = fingerprint
+        self.statement = statement[:MAX_STATEMENT_LENGTH]
+        self.pool = pool
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+        self.last_seen: Optional[datetime] = None
+        self.routes: Counter = Counter()
+        self.users: List[str] = []
+        self.parameters: Any = None
+        self.plan: Any = None
+        self.plan_captured_at: Optional[datetime] = None
+        self.plan_error: Optional[str] = None
+        self.explain_requested_at: Optional[float] = None
+
+    def record(self, seconds: float, parameters: Any, query_scope: Optional[QueryScope]):
+        self.calls += 1
+        self.total_seconds += seconds
+        self.last_seconds = seconds
+        self.last_seen = datetime.now(timezone.utc)
+        if seconds >= self.max_seconds:
+            self.max_seconds = seconds
+            self.parameters = redact(parameters)
+
+        route = query_scope.route if query_scope else "background"
+        if route in self.routes or len(self.routes) < MAX_ROUTES:
+            self.routes[route] += 1
+        user_id = query_scope.user_id if query_scope else None
+        if user_id and user_id not in self.users:
+            self.users = (self.users + [user_id])[-MAX_USERS:]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.statement,
+            "pool": self.pool,
+            "calls": self.calls,
+            "total_ms": round(self.total_seconds * 1000, 3),
+            "avg_ms": round(self.total_seconds / self.calls * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "last_ms": round(self.last_seconds * 1000, 3),
+            "last_seen": self.last_seen,
+            "routes": dict(self.routes.most_common()),
+            "users": self.users,
+            "parameters": self.parameters,
+            "plan": self.plan,
+            "plan_captured_at": self.plan_captured_at,
+            "plan_error": self.plan_error,
+        }
+
+
+class SlowQueryLog:
+    """Медленные запросы процесса и фоновый сбор их планов"""
+
+    def __init__(self, engines: List[AsyncEngine]):
+        self.engines = {db_engine.sync_engine.pool.logging_name: db_engine for db_engine in engines}
+        self.queries: Dict[str, SlowQuery] = {}
+        self.slow_queries = 0
+        self.explains = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    def install(self):
+        """Подключить замер запросов к движкам"""
+        for db_engine in self.engines.values():
+            if not event.contains(db_engine.sync_engine, "after_cursor_execute", self._after_cursor_execute):
+                event.listen(db_engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(db_engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["slow_query_started"] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("slow_query_started", None)
+        if started is None or _explaining.get():
+            return
+        seconds = time.perf_counter() - started
+        if seconds * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.record(statement, parameters, seconds, conn.engine.pool.logging_name, executemany)
+
+    def record(self, statement: str, parameters: Any, seconds: float, pool: str, executemany: bool = False):
+        self.slow_queries += 1
+        normalized = _PARAM.sub("$?", _IN_LIST.sub("IN ($…)", statement))
+        fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:16]
+        query = self.queries.get(fingerprint)
+        if query is None:
+            if len(self.queries) >= settings.SLOW_QUERY_MAX_STATEMENTS:
+                # Вытесняется запрос с наименьшим суммарным временем
+                del self.queries[min(self.queries.values(), key=lambda item: item.total_seconds).fingerprint]
+            query = self.queries[fingerprint] = SlowQuery(fingerprint, normalized, pool)
+        query_scope = _query_scope.get()
+        query.record(seconds, parameters, query_scope)
+
+        route = query_scope.route if query_scope else "background"
+        logger.warning(f"Медленный запрос {seconds * 1000:.0f} мс [{pool}, {route}] {fingerprint}: {normalized[:200]}")
+
+        if settings.SLOW_QUERY_EXPLAIN and not executemany:
+            self._maybe_explain(query, statement, parameters)
+
+    def _maybe_explain(self, query: SlowQuery, statement: str, parameters: Any):
+        now = time.monotonic()
+        if (
+            not _EXPLAINABLE.match(statement)
+            or len(self._tasks) >= MAX_CONCURRENT_EXPLAINS
+            or (
+                query.explain_requested_at is not None
+                and now - query.explain_requested_at < settings.SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS
+            )
+        ):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # вне цикла событий (синхронный код) план не снимается
+        query.explain_requested_at = now
+        # Чистый контекст: запросы EXPLAIN не относятся к HTTP-запросу
+        task = loop.create_task(self._explain(query, statement, parameters), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, query: SlowQuery, statement: str, parameters: Any):
+        _explaining.set(True)
+        timeout_ms = int(settings.SLOW_QUERY_EXPLAIN_TIMEOUT_SECONDS * 1000)
+        try:
+            async with self.engines[query.pool].connect() as conn:
+                await conn.execute(text("SET TRANSACTION READ ONLY"))
+                await conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+                plan = (await conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters or ()
+                )).scalar()
+                await conn.rollback()
+            query.plan = json.loads(plan) if isinstance(plan, str) else plan
+            query.plan_error = None
+            self.explains += 1
+        except Exception as e:
+            query.plan_error = str(e)[:500]
+            logger.warning(f"Не удалось снять план медленного запроса {query.fingerprint}: {e}")
+        query.plan_captured_at = datetime.now(timezone.utc)
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        """Запросы по убыванию суммарного времени"""
+        queries = sorted(self.queries.values(), key=lambda item: item.total_seconds, reverse=True)
+        return [query.to_dict() for query in queries[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+            "slow_queries": self.slow_queries,
+            "statements": len(self.queries),
+            "explains": self.explains,
+        }
+
+    def reset(self):
+        self.queries.clear()
+        self.slow_queries = 0
+        self.explains = 0
+
+
+slow_query_log = SlowQueryLog([engine, *replica_engines])
+
+
+def install_slow_query_log(app):
+    """Замер запросов к БД и контекст HTTP-запросов для журнала"""
+    slow_query_log.install()
+    app.add_middleware(QueryScopeMiddleware)
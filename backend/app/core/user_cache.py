@@ -0,0 +1,193 @@
+"""
+Кэш аутентифицированных пользователей (principal)
+
+Два уровня: LRU с TTL в памяти процесса и общий для воркеров Redis
+(необязательный). Запись сбрасывается после commit изменения пользователя через ORM;
+в остальных воркерах локальная копия живёт не дольше USER_CACHE_TTL_SECONDS.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.core.cache import cache_delete, cache_get_json, cache_set_json
+from app.core.config import settings
+from app.models.user import User
+
+REDIS_PREFIX = "auth:user:"
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """
+    Данные пользователя, нужные для авторизации и /me
+
+    Атрибуты совпадают с User, поэтому principal подставляется вместо модели
+    """
+    id: UUID
+    email: str
+    role: Optional[str]
+    factory_id: Optional[UUID]
+    is_active: bool
+    is_verified: bool
+    full_name: Optional[str] = None
+    phone: Optional[str] = None
+    position: Optional[str] = None
+    language: Optional[str] = None
+    timezone: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(**{f.name: getattr(user, f.name) for f in fields(cls)})
+
+    def to_json(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["id"] = str(self.id)
+        data["factory_id"] = str(self.factory_id) if self.factory_id else None
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "UserPrincipal":
+        data = dict(data)
+        data["id"] = UUID(data["id"])
+        data["factory_id"] = UUID(data["factory_id"]) if data.get("factory_id") else None
+        return cls(**data)
+
+
+PRINCIPAL_FIELDS = tuple(f.name for f in fields(UserPrincipal))
+
+
+class UserCache:
+    """LRU с TTL поверх необязательного Redis"""
+
+    def __init__(
+        self,
+        max_entries: int = settings.USER_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = settings.USER_CACHE_TTL_SECONDS,
+        use_redis: bool = settings.USER_CACHE_REDIS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_redis = use_redis
+        self._entries: "OrderedDict[UUID, Tuple[float, UserPrincipal]]" = OrderedDict()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _get_local(self, user_id: UUID) -> Optional[UserPrincipal]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return principal
+
+    def _put_local(self, principal: UserPrincipal):
+        self._entries[principal.id] = (time.monotonic() + self.ttl_seconds, principal)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: UUID) -> Optional[UserPrincipal]:
+        if self.ttl_seconds <= 0:
+            return None
+        principal = self._get_local(user_id)
+        if principal is not None:
+            self.hits += 1
+            return principal
+        if self.use_redis:
+            data = await cache_get_json(f"{REDIS_PREFIX}{user_id}")
+            if data is not None:
+                principal = UserPrincipal.from_json(data)
+                self._put_local(principal)
+                self.redis_hits += 1
+                return principal
+        self.misses += 1
+        return None
+
+    async def put(self, principal: UserPrincipal):
+        if self.ttl_seconds <= 0:
+            return
+        self._put_local(principal)
+        if self.use_redis:
+            await cache_set_json(f"{REDIS_PREFIX}{principal.id}", principal.to_json(), self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+        }
+
+    def invalidate_local(self, user_id: UUID):
+        self._entries.pop(user_id, None)
+
+    async def invalidate(self, user_id: UUID):
+        self.invalidate_local(user_id)
+        if self.use_redis:
+            await cache_delete(f"{REDIS_PREFIX}{user_id}")
+
+
+user_cache = UserCache()
+
+# Ссылки на фоновые удаления из Redis, чтобы задачи не собрал GC
+_pending: Set[asyncio.Task] = set()
+
+
+def _drop(user_id: UUID):
+    user_cache.invalidate_local(user_id)
+    if not user_cache.use_redis:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(cache_delete(f"{REDIS_PREFIX}{user_id}"))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+# Сброс после commit: при сбросе во время flush параллельный запрос успел бы
+# прочитать ещё не изменённую строку и вернуть её в кэш
+PENDING_KEY = "user_cache_invalidate"
+
+
+def _defer_drop(target: User):
+    session = object_session(target)
+    if session is None:
+        _drop(target.id)
+    else:
+        session.info.setdefault(PENDING_KEY, set()).add(target.id)
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_on_update(mapper, connection, target: User):
+    """Сбросить кэш, если изменились поля principal (last_login_at не в счёт)"""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in PRINCIPAL_FIELDS):
+        _defer_drop(target)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target: User):
+    _defer_drop(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    for user_id in session.info.pop(PENDING_KEY, ()):
+        _drop(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(PENDING_KEY, None)
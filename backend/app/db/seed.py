@@ -3,7 +3,7 @@
 """
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text
 from sqlalchemy.sql import func
 from app.core.database import AsyncSessionLocal, engine, Base
 from app.models.factory import Industry, Factory
@@ -24,7 +24,13 @@ import uuid
 async def create_tables():
     """Создание всех таблиц"""
     async with engine.begin() as conn:
+        # Индекс ix_equipment_name_trgm использует gin_trgm_ops
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+    
+    # metrics_data секционирована - без секций вставка невозможна
+    from app.services.metrics_partitions import maintain_partitions
+    await maintain_partitions()
 
 
 async def seed_industries(db: AsyncSession):
@@ -1,10 +1,21 @@
 """
 Главный файл приложения FastAPI
 """
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.core.config import settings
+from app.core.instrumentation import instrument_app
+from app.core.responses import FastJSONResponse
+from app.core.replicas import replica_router, run_replica_lag_monitor
+from app.core.security import PasswordHashingBusy
+from app.core.slow_queries import install_slow_query_log
 from app.api.v1.api import api_router
+from app.services.kpi_rollup import run_rollup_loop
+from app.services.metrics_partitions import run_partition_maintenance
+from app.services.metrics_pubsub import metrics_broker
+from app.services.report_scheduler import run_report_schedule_loop
 
 app = FastAPI(
     title="Промышленная аналитика Казахстана",
@@ -12,6 +23,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    default_response_class=FastJSONResponse,
 )
 
 # CORS настройки
@@ -23,9 +35,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики Prometheus: задержка, размер ответов и запросы к БД по маршрутам
+if settings.PROMETHEUS_ENABLED:
+    instrument_app(app)
+
+# Журнал медленных запросов к БД с планами EXPLAIN
+if settings.SLOW_QUERY_LOG_ENABLED:
+    install_slow_query_log(app)
+
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    """Очередь bcrypt переполнена: клиенту стоит повторить позже"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Слишком много одновременных входов, повторите попытку"},
+        headers={"Retry-After": "1"},
+    )
+
 # Подключение роутеров
 app.include_router(api_router, prefix="/api/v1")
 
+# Фоновые задачи процесса
+background_tasks: list[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Запуск фоновых задач обслуживания"""
+    background_tasks.append(asyncio.create_task(run_partition_maintenance()))
+    background_tasks.append(asyncio.create_task(run_rollup_loop()))
+    if settings.REPORT_SCHEDULE_ENABLED:
+        background_tasks.append(asyncio.create_task(run_report_schedule_loop()))
+    if replica_router.replicas:
+        background_tasks.append(asyncio.create_task(run_replica_lag_monitor()))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Остановка фоновых задач"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await metrics_broker.close()
+
 
 @app.get("/")
 async def root():
@@ -5,7 +5,7 @@ from app.models.factory import Factory, Industry
 from app.models.equipment import Equipment, EquipmentType
 from app.models.metrics import MetricsCatalog, MetricsData
 from app.models.user import User
-from app.models.analytics import KPICalculation, Anomaly, Prediction, Recommendation
+from app.models.analytics import KPICalculation, KPIRollupState, Anomaly, Prediction, Recommendation
 from app.models.subscription import Subscription
 from app.models.production import ProductionCycle, MaintenanceLog
 from app.models.management import AccessRight, AuditLog
@@ -22,6 +22,7 @@ __all__ = [
     "MetricsData",
     "User",
     "KPICalculation",
+    "KPIRollupState",
     "Anomaly",
     "Prediction",
     "Recommendation",
@@ -1,7 +1,7 @@
 """
 Модели для аналитики и ML
 """
-from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func, text
@@ -52,6 +52,24 @@ class KPICalculation(Base):
     profit_margin = Column(Numeric(5, 2))
     
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
+    
+    __table_args__ = (
+        Index("ix_kpi_calculations_entity_period", "entity_type", "entity_id", "period_type", "period_start"),
+        Index("ix_kpi_calculations_period_start", "period_type", "period_start"),
+    )
+
+
+class KPIRollupState(Base):
+    """Водяные знаки инкрементального пересчёта KPI"""
+    __tablename__ = "kpi_rollup_state"
+    
+    name = Column(String(100), primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
+    
+    # Статистика последнего запуска
+    last_run_at = Column(DateTime(timezone=True))
+    last_dirty_hours = Column(Integer)
+    last_rows_written = Column(Integer)
 
 
 class Anomaly(Base):
@@ -73,7 +91,7 @@ class Anomaly(Base):
     deviation_percentage = Column(Numeric(7, 2))
     
     # Классификация
-    anomaly_type = Column(String(100))  # spike, drop, drift, oscillation, flatline
+    anomaly_type = Column(String(100))  # spike, drop, drift, oscillation, flatline, multivariate
     pattern = Column(Text)
     
     # Контекст
@@ -87,6 +105,14 @@ class Anomaly(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
     
+    # Индексы для keyset-пагинации списков (ключ сортировки, id)
+    __table_args__ = (
+        Index("ix_anomalies_detected_at_id", "detected_at", "id"),
+        Index("ix_anomalies_equipment_detected_at_id", "equipment_id", "detected_at", "id"),
+        # Фильтр по статусу в списке и на дашборде
+        Index("ix_anomalies_status_detected_at_id", "status", "detected_at", "id"),
+    )
+    
     # Связи
     equipment = relationship("Equipment")
     metric = relationship("MetricsCatalog")
@@ -123,6 +149,10 @@ class Prediction(Base):
     actual_occurred_at = Column(DateTime(timezone=True))
     prediction_accuracy = Column(Numeric(5, 4))
     
+    __table_args__ = (
+        Index("ix_predictions_equipment_created_at", "equipment_id", "created_at"),
+    )
+    
     # Связи
     equipment = relationship("Equipment")
 
@@ -163,4 +193,9 @@ class Recommendation(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_recommendations_target_created_at", "target_type", "target_id", "created_at"),
+        Index("ix_recommendations_status_created_at", "status", "created_at"),
+    )
 
@@ -1,13 +1,25 @@
 """
 Модели для оборудования
 """
-from sqlalchemy import Column, String, Integer, Numeric, Date, ForeignKey, Text, CheckConstraint, DateTime
+from sqlalchemy import Column, String, Integer, Numeric, Date, ForeignKey, Text, CheckConstraint, DateTime, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func, text
 import uuid
 from app.core.database import Base
 
+# Документ полнотекстового поиска оборудования. Запрос должен использовать
+# это же выражение символ в символ, иначе планировщик не возьмёт индекс.
+# Конфигурация 'simple': без стемминга, номера и марки остаются как есть
+SEARCH_DOCUMENT_SQL = (
+    "to_tsvector('simple'::regconfig, "
+    "coalesce(equipment.name, '') || ' ' || "
+    "coalesce(equipment.serial_number, '') || ' ' || "
+    "coalesce(equipment.inventory_number, '') || ' ' || "
+    "coalesce(equipment.manufacturer, '') || ' ' || "
+    "coalesce(equipment.model, ''))"
+)
+
 
 class EquipmentType(Base):
     """Типы оборудования"""
@@ -78,6 +90,14 @@ class Equipment(Base):
     # Ограничения
     __table_args__ = (
         CheckConstraint('health_score >= 0 AND health_score <= 100', name='check_health_score'),
+        # Keyset-пагинация списка (ключ сортировки, id)
+        Index("ix_equipment_name_id", "name", "id"),
+        Index("ix_equipment_factory_name_id", "factory_id", "name", "id"),
+        # Фильтр по статусу в списке и статистике завода
+        Index("ix_equipment_factory_status", "factory_id", "status"),
+        # Поиск: подстрока и нечёткое совпадение названия (pg_trgm), полнотекстовый документ
+        Index("ix_equipment_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_equipment_search_document", text(SEARCH_DOCUMENT_SQL), postgresql_using="gin"),
     )
     
     # Связи
@@ -1,7 +1,7 @@
 """
 Модели для заводов и отраслей
 """
-from sqlalchemy import Column, String, Integer, Numeric, Date, ForeignKey, Text, Boolean, DateTime
+from sqlalchemy import Column, String, Integer, Numeric, Date, ForeignKey, Text, Boolean, DateTime, Index
 from sqlalchemy.dialects.postgresql import UUID
 # POINT требует PostGIS расширение, закомментировано для базовой установки
 # from sqlalchemy.dialects.postgresql import POINT
@@ -58,6 +58,11 @@ class Factory(Base):
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Индексы для keyset-пагинации списков (ключ сортировки, id)
+    __table_args__ = (
+        Index("ix_factories_name_id", "name", "id"),
+    )
+    
     # Связи
     industry = relationship("Industry", backref="factories")
     equipment = relationship("Equipment", back_populates="factory", cascade="all, delete-orphan")
@@ -1,7 +1,7 @@
 """
 Модели для интеграций и отчетов
 """
-from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Text, Date, Integer
+from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Text, Date, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func, text
@@ -80,11 +80,34 @@ class GeneratedReport(Base):
     period_start = Column(Date)
     period_end = Column(Date)
     
+    report_type = Column(String(100))  # oee, downtime, energy, production, quality
+    format = Column(String(50))  # pdf, excel, csv
+    
     file_url = Column(String(500))
     file_size_bytes = Column(Integer)
     
+    # Задание генерации
+    status = Column(String(20), nullable=False, server_default="queued")  # queued, running, completed, failed
+    error = Column(Text)
+    row_count = Column(Integer)
+    duration_ms = Column(Integer)
+    scheduled = Column(Boolean, nullable=False, server_default=text("false"))  # запуск по расписанию шаблона
+    
     generated_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     generated_at = Column(DateTime(timezone=True), server_default=text("now()"))
+    completed_at = Column(DateTime(timezone=True))
+    
+    # Индексы для keyset-пагинации списков (ключ сортировки, id)
+    __table_args__ = (
+        Index("ix_generated_reports_generated_at_id", "generated_at", "id"),
+        Index("ix_generated_reports_factory_generated_at_id", "factory_id", "generated_at", "id"),
+        # Плановый отчёт создаётся один раз на (шаблон, завод, период)
+        Index(
+            "uq_generated_reports_scheduled_period",
+            "template_id", "factory_id", "period_start", "period_end",
+            unique=True, postgresql_where=text("scheduled"),
+        ),
+    )
     
     # Связи
     template = relationship("ReportTemplate")
@@ -1,7 +1,7 @@
 """
 Модели для метрик и измерений
 """
-from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, String, BigInteger, Numeric, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func, text
@@ -45,14 +45,15 @@ class MetricsCatalog(Base):
 
 
 class MetricsData(Base):
-    """Временные ряды метрик"""
+    """Временные ряды метрик (секционированы по timestamp)"""
     __tablename__ = "metrics_data"
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Ключ секционирования должен входить в первичный ключ
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
     equipment_id = Column(UUID(as_uuid=True), ForeignKey("equipment.id", ondelete="CASCADE"), nullable=False)
     metric_id = Column(UUID(as_uuid=True), ForeignKey("metrics_catalog.id"), nullable=False)
     
-    timestamp = Column(DateTime(timezone=True), nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False)
     value = Column(Numeric(20, 6))
     
     # Статус
@@ -65,6 +66,14 @@ class MetricsData(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
     
+    # Секции создаются и удаляются в app.services.metrics_partitions
+    __table_args__ = (
+        Index("ix_metrics_data_equipment_metric_timestamp", "equipment_id", "metric_id", "timestamp"),
+        # Поиск новых строк для инкрементального пересчёта KPI
+        Index("ix_metrics_data_created_at_brin", "created_at", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+    
     # Связи
     equipment = relationship("Equipment")
     metric = relationship("MetricsCatalog")
@@ -1,7 +1,7 @@
 """
 Модели для производственных циклов и обслуживания
 """
-from sqlalchemy import Column, String, Integer, Numeric, Date, ForeignKey, Text, DateTime
+from sqlalchemy import Column, String, Integer, Numeric, Date, ForeignKey, Text, DateTime, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func, text
@@ -52,6 +52,13 @@ class ProductionCycle(Base):
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Индексы для keyset-пагинации списков (ключ сортировки, id)
+    __table_args__ = (
+        Index("ix_production_cycles_start_time_id", "start_time", "id"),
+        Index("ix_production_cycles_factory_start_time_id", "factory_id", "start_time", "id"),
+        Index("ix_production_cycles_equipment_start_time_id", "equipment_id", "start_time", "id"),
+    )
+    
     # Связи
     factory = relationship("Factory")
     equipment = relationship("Equipment")
@@ -94,6 +101,12 @@ class MaintenanceLog(Base):
     created_at = Column(DateTime(timezone=True), server_default=text("now()"))
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Индексы для keyset-пагинации списков (ключ сортировки, id)
+    __table_args__ = (
+        Index("ix_maintenance_log_scheduled_date_id", "scheduled_date", "id"),
+        Index("ix_maintenance_log_equipment_scheduled_date_id", "equipment_id", "scheduled_date", "id"),
+    )
+    
     # Связи
     equipment = relationship("Equipment")
 
@@ -0,0 +1,320 @@
+"""
+Потоковый детектор аномалий для принимаемой телеметрии
+
+Каждое показание проверяется по границам MetricsCatalog (optimal_*/critical_*)
+и по состоянию ряда (оборудование, метрика): EWMA среднего и дисперсии,
+медленная EWMA для дрейфа и счётчик одинаковых значений для «залипания».
+Состояние ряда - несколько чисел, обновление O(1) на показание.
+"""
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.metrics import MetricsCatalog
+
+# Сглаживание быстрой EWMA (среднее и дисперсия для z-score)
+FAST_ALPHA = 0.05
+# Сглаживание медленной EWMA (базовый уровень для дрейфа)
+SLOW_ALPHA = 0.002
+# Сколько показаний нужно ряду до статистических проверок
+WARMUP_READINGS = 30
+# Дрейф: расхождение быстрой и медленной EWMA в сигмах медленной дисперсии
+DRIFT_SIGMAS = 3.0
+# Залипание: столько подряд одинаковых значений у ряда, который раньше менялся
+FLATLINE_READINGS = 30
+FLATLINE_EPSILON = 1e-9
+# Как часто перечитывать границы из справочника метрик (секунды)
+BOUNDS_REFRESH_SECONDS = 300.0
+
+_SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+
+class SeriesState:
+    """Состояние одного ряда (оборудование, метрика)"""
+    __slots__ = (
+        "count", "mean", "var", "slow_mean", "slow_var",
+        "last_value", "last_ts", "flat_count", "drifting", "last_alert_ts", "last_alert_rank",
+    )
+
+    def __init__(self, value: float, ts: float):
+        self.count = 1
+        self.mean = value
+        self.var = 0.0
+        self.slow_mean = value
+        self.slow_var = 0.0
+        self.last_value = value
+        self.last_ts = ts
+        self.flat_count = 1
+        self.drifting = False
+        self.last_alert_ts = -math.inf
+        self.last_alert_rank = -1
+
+    def update(self, value: float, ts: float):
+        # Инкрементальные EWMA среднего и дисперсии (West, 1979)
+        diff = value - self.mean
+        incr = FAST_ALPHA * diff
+        self.mean += incr
+        self.var = (1 - FAST_ALPHA) * (self.var + diff * incr)
+
+        slow_diff = value - self.slow_mean
+        slow_incr = SLOW_ALPHA * slow_diff
+        self.slow_mean += slow_incr
+        self.slow_var = (1 - SLOW_ALPHA) * (self.slow_var + slow_diff * slow_incr)
+
+        if abs(value - self.last_value) <= FLATLINE_EPSILON:
+            self.flat_count += 1
+        else:
+            self.flat_count = 1
+        self.last_value = value
+        self.last_ts = ts
+        self.count += 1
+
+
+@dataclass
+class Bounds:
+    """Границы метрики из справочника"""
+    optimal_min: Optional[float] = None
+    optimal_max: Optional[float] = None
+    critical_min: Optional[float] = None
+    critical_max: Optional[float] = None
+
+
+@dataclass
+class Detection:
+    """Срабатывание детектора на одном показании"""
+    anomaly_type: str  # spike, drop, drift, flatline
+    severity: str  # low, medium, high, critical
+    score: float  # 0-1
+    expected_value: Optional[float]
+    rule: str
+    is_critical: bool = False
+
+
+def _float(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _direction(value: float, reference: float) -> str:
+    return "spike" if value >= reference else "drop"
+
+
+class AnomalyDetector:
+    """Онлайн-детектор, состояние живёт в памяти процесса"""
+
+    def __init__(
+        self,
+        z_threshold: float = settings.ANOMALY_Z_THRESHOLD,
+        cooldown_seconds: float = settings.ANOMALY_COOLDOWN_SECONDS,
+        max_series: int = settings.ANOMALY_MAX_SERIES,
+    ):
+        self.z_threshold = z_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.max_series = max_series
+        self._series: Dict[Tuple[UUID, UUID], SeriesState] = {}
+        self._bounds: Dict[UUID, Bounds] = {}
+        self._bounds_loaded_at = -math.inf
+
+    @property
+    def series_count(self) -> int:
+        return len(self._series)
+
+    def set_bounds(self, bounds: Dict[UUID, Bounds]):
+        self._bounds = bounds
+        self._bounds_loaded_at = time.monotonic()
+
+    async def refresh_bounds(self, db: AsyncSession, force: bool = False):
+        """Перечитать границы метрик, если кэш устарел"""
+        if not force and time.monotonic() - self._bounds_loaded_at < BOUNDS_REFRESH_SECONDS:
+            return
+        rows = await db.execute(
+            select(
+                MetricsCatalog.id,
+                MetricsCatalog.optimal_min,
+                MetricsCatalog.optimal_max,
+                MetricsCatalog.critical_min,
+                MetricsCatalog.critical_max,
+            )
+        )
+        self.set_bounds({
+            row.id: Bounds(
+                optimal_min=_float(row.optimal_min),
+                optimal_max=_float(row.optimal_max),
+                critical_min=_float(row.critical_min),
+                critical_max=_float(row.critical_max),
+            )
+            for row in rows
+        })
+
+    def _check_bounds(self, value: float, bounds: Optional[Bounds]) -> Optional[Detection]:
+        if bounds is None:
+            return None
+        if bounds.critical_max is not None and value > bounds.critical_max:
+            return Detection("spike", "critical", 1.0, bounds.critical_max, "critical_max", is_critical=True)
+        if bounds.critical_min is not None and value < bounds.critical_min:
+            return Detection("drop", "critical", 1.0, bounds.critical_min, "critical_min", is_critical=True)
+        if bounds.optimal_max is not None and value > bounds.optimal_max:
+            return Detection("spike", "low", 0.5, bounds.optimal_max, "optimal_max")
+        if bounds.optimal_min is not None and value < bounds.optimal_min:
+            return Detection("drop", "low", 0.5, bounds.optimal_min, "optimal_min")
+        return None
+
+    def _check_series(self, value: float, state: SeriesState) -> Optional[Detection]:
+        if state.count < WARMUP_READINGS:
+            return None
+
+        std = math.sqrt(state.var)
+        if std > 0:
+            z = (value - state.mean) / std
+            if abs(z) >= self.z_threshold:
+                severity = "high" if abs(z) >= 2 * self.z_threshold else "medium"
+                score = min(abs(z) / (2 * self.z_threshold), 1.0)
+                return Detection(_direction(value, state.mean), severity, score, state.mean, f"z={z:.2f}")
+
+        slow_std = math.sqrt(state.slow_var)
+        # Ряд, который раньше менялся, перестал меняться
+        if (
+            state.flat_count + 1 == FLATLINE_READINGS
+            and slow_std > 0
+            and abs(value - state.last_value) <= FLATLINE_EPSILON
+        ):
+            return Detection("flatline", "medium", 0.5, state.slow_mean, f"flat={FLATLINE_READINGS}")
+
+        if slow_std > 0:
+            shift = abs(state.mean - state.slow_mean) / slow_std
+            drifting = shift >= DRIFT_SIGMAS
+            entered = drifting and not state.drifting
+            state.drifting = drifting
+            if entered:
+                score = min(shift / (2 * DRIFT_SIGMAS), 1.0)
+                return Detection("drift", "medium", score, state.slow_mean, f"drift={shift:.2f}σ")
+        return None
+
+    def _state(self, key: Tuple[UUID, UUID], value: float, ts: float) -> Optional[SeriesState]:
+        """Состояние ряда; новый ряд инициализируется первым значением и возвращается None"""
+        state = self._series.get(key)
+        if state is None:
+            if len(self._series) >= self.max_series:
+                # Вытесняется самый давно созданный ряд
+                self._series.pop(next(iter(self._series)))
+            self._series[key] = SeriesState(value, ts)
+        return state
+
+    def observe(
+        self,
+        equipment_id: UUID,
+        metric_id: UUID,
+        timestamp: datetime,
+        value: float,
+    ) -> Optional[Detection]:
+        """
+        Проверить показание и обновить состояние ряда
+
+        Показания старше последнего по ряду проверяются только по границам
+        """
+        key = (equipment_id, metric_id)
+        ts = timestamp.timestamp()
+        detection = self._check_bounds(value, self._bounds.get(metric_id))
+
+        state = self._state(key, value, ts)
+        if state is not None and ts >= state.last_ts:
+            statistical = self._check_series(value, state)
+            if statistical and (
+                detection is None or _SEVERITY_RANK[statistical.severity] > _SEVERITY_RANK[detection.severity]
+            ):
+                detection = statistical
+            state.update(value, ts)
+        return detection
+
+    def should_record(self, equipment_id: UUID, metric_id: UUID, timestamp: datetime, detection: Detection) -> bool:
+        """
+        Не чаще одной записи Anomaly на ряд за cooldown_seconds
+
+        Рост серьёзности (например, переход в критическую зону) записывается сразу
+        """
+        state = self._series.get((equipment_id, metric_id))
+        if state is None:
+            return True
+        ts = timestamp.timestamp()
+        rank = _SEVERITY_RANK[detection.severity]
+        if ts - state.last_alert_ts < self.cooldown_seconds and rank <= state.last_alert_rank:
+            return False
+        state.last_alert_ts = ts
+        state.last_alert_rank = rank
+        return True
+
+
+# Границы колонок anomalies: Numeric(15, 4) для значений, Numeric(7, 2) для отклонения
+VALUE_LIMIT = 99999999999.9999
+DEVIATION_LIMIT = 99999.99
+
+
+def _clamp(value: float, limit: float) -> float:
+    return max(min(value, limit), -limit)
+
+
+def build_anomaly_row(
+    equipment_id: UUID,
+    metric_id: UUID,
+    timestamp: datetime,
+    value: float,
+    detection: Detection,
+) -> Dict[str, Any]:
+    """
+    Параметры INSERT в anomalies для одного срабатывания
+
+    Значения за пределами колонок ограничиваются их границами: иначе одно
+    экстремальное показание откатило бы запись всего пакета
+    """
+    deviation = None
+    if detection.expected_value:
+        deviation = (value - detection.expected_value) / abs(detection.expected_value) * 100
+        deviation = _clamp(deviation, DEVIATION_LIMIT)
+    expected_value = detection.expected_value
+    if expected_value is not None:
+        expected_value = round(_clamp(expected_value, VALUE_LIMIT), 4)
+    return {
+        "equipment_id": equipment_id,
+        "metric_id": metric_id,
+        "detected_at": timestamp,
+        "severity": detection.severity,
+        "anomaly_score": round(detection.score, 4),
+        "expected_value": expected_value,
+        "actual_value": round(_clamp(value, VALUE_LIMIT), 4),
+        "deviation_percentage": round(deviation, 2) if deviation is not None else None,
+        "anomaly_type": detection.anomaly_type,
+        "pattern": detection.rule,
+        "status": "new",
+    }
+
+
+def detect_batch(detector: AnomalyDetector, readings: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Прогнать пакет показаний через детектор
+
+    Выставляет is_anomaly/is_critical у показаний, возвращает строки для anomalies
+    """
+    anomalies = []
+    for reading in readings:
+        if reading.value is None:
+            continue
+        value = float(reading.value)
+        detection = detector.observe(reading.equipment_id, reading.metric_id, reading.timestamp, value)
+        if detection is None:
+            continue
+        reading.is_anomaly = True
+        reading.is_critical = detection.is_critical
+        if detector.should_record(reading.equipment_id, reading.metric_id, reading.timestamp, detection):
+            anomalies.append(build_anomaly_row(
+                reading.equipment_id, reading.metric_id, reading.timestamp, value, detection
+            ))
+    return anomalies
+
+
+anomaly_detector = AnomalyDetector()
@@ -0,0 +1,111 @@
+"""
+Статистика дашборда: один SQL-запрос и кэш в Redis по области видимости завода
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+from uuid import UUID
+
+from sqlalchemy import Select, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import cache_delete, cache_delete_prefix, cache_get_json, cache_set_json
+from app.core.config import settings
+from app.models.analytics import Anomaly, KPICalculation, Recommendation
+from app.models.equipment import Equipment
+from app.models.factory import Factory
+
+CACHE_PREFIX = "dashboard:stats:"
+# Область видимости администратора (все заводы)
+ALL_FACTORIES = "all"
+
+
+def cache_key(factory_id: Optional[UUID]) -> str:
+    return f"{CACHE_PREFIX}{factory_id or ALL_FACTORIES}"
+
+
+def build_stats_query(factory_id: Optional[UUID], today: datetime) -> Select:
+    """
+    Все показатели дашборда одним запросом
+
+    Оборудование считается одним проходом с FILTER, остальное -
+    скалярными подзапросами в том же SELECT
+    """
+    equipment = select(
+        func.count(Equipment.id).label("total"),
+        func.count(Equipment.id).filter(Equipment.status == "operational").label("active"),
+    )
+    if factory_id:
+        equipment = equipment.where(Equipment.factory_id == factory_id)
+    equipment = equipment.cte("equipment_stats")
+
+    if factory_id:
+        factories_count = literal(1)
+    else:
+        factories_count = select(func.count(Factory.id)).scalar_subquery()
+
+    anomalies = (
+        select(func.count(Anomaly.id))
+        .join(Equipment, Anomaly.equipment_id == Equipment.id)
+        .where(Anomaly.status.in_(["new", "acknowledged"]))
+    )
+    if factory_id:
+        anomalies = anomalies.where(Equipment.factory_id == factory_id)
+
+    recommendations = select(func.count(Recommendation.id)).where(Recommendation.status == "new")
+    if factory_id:
+        recommendations = recommendations.where(
+            Recommendation.target_type == "factory"
+        ).where(Recommendation.target_id == factory_id)
+
+    # Средний OEE дневных KPI за сегодня
+    avg_oee = (
+        select(func.avg(KPICalculation.oee_score))
+        .where(KPICalculation.period_type == "daily")
+        .where(KPICalculation.period_start >= today)
+    )
+    if factory_id:
+        avg_oee = avg_oee.where(
+            KPICalculation.entity_type == "factory"
+        ).where(KPICalculation.entity_id == factory_id)
+
+    return select(
+        factories_count.label("factories_count"),
+        equipment.c.total.label("equipment_count"),
+        equipment.c.active.label("active_equipment"),
+        anomalies.scalar_subquery().label("active_alerts"),
+        recommendations.scalar_subquery().label("new_recommendations"),
+        avg_oee.scalar_subquery().label("average_oee"),
+    )
+
+
+async def get_dashboard_stats(db: AsyncSession, factory_id: Optional[UUID]) -> Dict[str, Any]:
+    """Статистика из кэша или из БД с записью в кэш на DASHBOARD_CACHE_TTL_SECONDS"""
+    key = cache_key(factory_id)
+    cached = await cache_get_json(key)
+    if cached is not None:
+        return cached
+
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    row = (await db.execute(build_stats_query(factory_id, today))).one()
+    stats = {
+        "factories_count": row.factories_count or 0,
+        "equipment_count": row.equipment_count or 0,
+        "active_equipment": row.active_equipment or 0,
+        "active_alerts": row.active_alerts or 0,
+        "new_recommendations": row.new_recommendations or 0,
+        "average_oee": round(float(row.average_oee), 2) if row.average_oee else None,
+    }
+    await cache_set_json(key, stats, settings.DASHBOARD_CACHE_TTL_SECONDS)
+    return stats
+
+
+async def invalidate_dashboard_stats(factory_ids: Optional[Iterable[UUID]] = None):
+    """
+    Сбросить кэш после изменения аномалий или KPI
+
+    Область администратора сбрасывается всегда; factory_ids=None - сбросить всё
+    """
+    if factory_ids is None:
+        await cache_delete_prefix(CACHE_PREFIX)
+        return
+    await cache_delete(cache_key(None), *{cache_key(factory_id) for factory_id in factory_ids})
@@ -0,0 +1,88 @@
+"""
+Поиск оборудования: нечёткий по названию (pg_trgm) и полнотекстовый по
+названию, серийному и инвентарному номерам, производителю и модели
+
+Оба условия обслуживаются GIN-индексами (ix_equipment_name_trgm,
+ix_equipment_search_document), поэтому поиск не сканирует таблицу.
+Результаты упорядочены по релевантности: сходство названия по триграммам
+или ранг полнотекстового совпадения, что больше.
+"""
+import re
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Select, func, literal, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.equipment import SEARCH_DOCUMENT_SQL, Equipment
+
+search_document = literal_column(SEARCH_DOCUMENT_SQL)
+
+# Лексемы запроса: буквы и цифры, остальное (включая синтаксис tsquery) - разделители
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def _prefix_term(token: str) -> str:
+    # Парсер PostgreSQL читает «PM-5000» как «pm» и «-5000» (число со знаком),
+    # поэтому число ищется в обоих вариантах
+    if token.isdigit():
+        return f"({token}:* | '-{token}':*)"
+    return f"{token}:*"
+
+
+def prefix_tsquery(q: str) -> Optional[str]:
+    """
+    Текст запроса -> tsquery с префиксным совпадением каждого слова
+
+    «pm 50» -> «pm:* & (50:* | '-50':*)»; None, если в запросе нет слов
+    """
+    tokens = _TOKEN_RE.findall(q.lower())
+    if not tokens:
+        return None
+    return " & ".join(_prefix_term(token) for token in tokens)
+
+
+def escape_like(value: str) -> str:
+    return value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def build_search_query(q: str, factory_id: Optional[UUID], limit: int) -> Select:
+    """
+    Запрос поиска: строки Equipment и оценка релевантности score (0..1)
+
+    Совпадением считается подстрока названия, нечёткое совпадение названия
+    (word_similarity выше порога pg_trgm) или все слова запроса как префиксы
+    слов документа
+    """
+    name_score = func.word_similarity(q, Equipment.name)
+    conditions = [
+        Equipment.name.ilike(f"%{escape_like(q)}%", escape="!"),
+        literal(q).op("<%")(Equipment.name),
+    ]
+    score = name_score
+
+    tsquery_text = prefix_tsquery(q)
+    if tsquery_text:
+        tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), tsquery_text)
+        conditions.append(search_document.op("@@")(tsquery))
+        score = func.greatest(name_score, func.ts_rank(search_document, tsquery))
+
+    query = select(Equipment, score.label("score")).where(or_(*conditions))
+    if factory_id:
+        query = query.where(Equipment.factory_id == factory_id)
+    return query.order_by(score.desc(), Equipment.name, Equipment.id).limit(limit)
+
+
+async def search_equipment(db: AsyncSession, q: str, factory_id: Optional[UUID], limit: int):
+    """Найти оборудование; возвращает строки (Equipment, score)"""
+    # Порог оператора <% только для текущей транзакции
+    await db.execute(
+        select(func.set_config(
+            "pg_trgm.word_similarity_threshold",
+            str(settings.EQUIPMENT_SEARCH_SIMILARITY),
+            True,
+        ))
+    )
+    result = await db.execute(build_search_query(q, factory_id, limit))
+    return result.all()
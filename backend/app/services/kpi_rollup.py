@@ -0,0 +1,364 @@
+"""
+Инкрементальный пересчёт KPI (rollup) в kpi_calculations
+
+Почасовые KPI оборудования и заводов считаются из production_cycles,
+maintenance_log и metrics_data. Дневные строятся из почасовых, недельные
+и месячные - из дневных, без повторного чтения сырых данных.
+
+Пересчитываются только (завод, час), в которых появились или изменились
+данные после водяного знака предыдущего запуска. Одновременно работает
+только один экземпляр (advisory lock), поэтому задачу можно запускать
+на всех репликах API.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+from app.services.dashboard_stats import invalidate_dashboard_stats
+
+ROLLUP_NAME = "kpi"
+
+# Ключ pg_advisory_xact_lock для пересчёта KPI
+ROLLUP_LOCK_KEY = 72_001
+
+# Начальный водяной знак: первый запуск пересчитывает всю историю
+INITIAL_WATERMARK = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# (period_type, единица date_trunc, длина периода, источник)
+ROLLUP_LEVELS = (
+    ("hourly", "hour", "1 hour", None),
+    ("daily", "day", "1 day", "hourly"),
+    ("weekly", "week", "1 week", "daily"),
+    ("monthly", "month", "1 month", "daily"),
+)
+
+KPI_COLUMNS = """
+    id, entity_type, entity_id, period_type, period_start, period_end,
+    oee_score, availability, performance, quality,
+    total_production, planned_production, production_variance,
+    downtime_minutes, downtime_percentage, unplanned_downtime_minutes,
+    energy_consumption_kwh, specific_energy, defect_rate
+"""
+
+CREATE_DIRTY_TABLES_SQL = (
+    "CREATE TEMP TABLE kpi_dirty_hours ("
+    " factory_id uuid NOT NULL, hour_start timestamptz NOT NULL, PRIMARY KEY (factory_id, hour_start)"
+    ") ON COMMIT DROP",
+    "CREATE TEMP TABLE kpi_dirty_periods ("
+    " entity_type varchar(50) NOT NULL, entity_id uuid NOT NULL, period_start timestamptz NOT NULL"
+    ") ON COMMIT DROP",
+)
+
+# Часы, затронутые изменениями в источниках за окно (since, until]
+COLLECT_DIRTY_HOURS_SQL = """
+INSERT INTO kpi_dirty_hours (factory_id, hour_start)
+SELECT c.factory_id, h.hour_start
+FROM production_cycles c
+CROSS JOIN LATERAL generate_series(
+    date_trunc('hour', c.start_time, 'UTC'), c.end_time - INTERVAL '1 microsecond', INTERVAL '1 hour'
+) AS h(hour_start)
+WHERE c.end_time > c.start_time
+  AND COALESCE(c.updated_at, c.created_at) > :since
+  AND COALESCE(c.updated_at, c.created_at) <= :until
+UNION
+SELECT e.factory_id, h.hour_start
+FROM maintenance_log m
+JOIN equipment e ON e.id = m.equipment_id
+CROSS JOIN LATERAL generate_series(
+    date_trunc('hour', m.start_time, 'UTC'), m.end_time - INTERVAL '1 microsecond', INTERVAL '1 hour'
+) AS h(hour_start)
+WHERE m.end_time > m.start_time
+  AND COALESCE(m.updated_at, m.created_at) > :since
+  AND COALESCE(m.updated_at, m.created_at) <= :until
+UNION
+SELECT e.factory_id, date_trunc('hour', md.timestamp, 'UTC')
+FROM metrics_data md
+JOIN equipment e ON e.id = md.equipment_id
+WHERE md.created_at > :since
+  AND md.created_at <= :until
+"""
+
+# Периоды уровня, затронутые грязными часами: сам завод и всё его оборудование
+COLLECT_DIRTY_PERIODS_SQL = """
+INSERT INTO kpi_dirty_periods (entity_type, entity_id, period_start)
+SELECT 'factory', d.factory_id, date_trunc('{unit}', d.hour_start, 'UTC')
+FROM kpi_dirty_hours d
+UNION
+SELECT 'equipment', e.id, date_trunc('{unit}', d.hour_start, 'UTC')
+FROM kpi_dirty_hours d
+JOIN equipment e ON e.factory_id = d.factory_id
+"""
+
+DELETE_DIRTY_PERIODS_SQL = """
+DELETE FROM kpi_calculations k
+USING kpi_dirty_periods p
+WHERE k.period_type = :period_type
+  AND k.entity_type = p.entity_type
+  AND k.entity_id = p.entity_id
+  AND k.period_start = p.period_start
+"""
+
+# Почасовые KPI: доли циклов и обслуживания, попавшие в час, плюс
+# энергопотребление по метрикам категории energy (средняя мощность кВт за час = кВт·ч).
+# GROUPING SETS даёт строки оборудования и завода за один проход
+HOURLY_INSERT_SQL = f"""
+WITH cycle_facts AS (
+    SELECT d.factory_id, c.equipment_id, d.hour_start,
+           EXTRACT(EPOCH FROM LEAST(c.end_time, d.hour_start + INTERVAL '1 hour') - GREATEST(c.start_time, d.hour_start)) AS overlap_s,
+           EXTRACT(EPOCH FROM c.end_time - c.start_time) AS cycle_s,
+           c.planned_quantity, c.actual_quantity, c.defect_quantity, c.energy_consumed_kwh,
+           c.oee_score, c.availability, c.performance, c.quality
+    FROM kpi_dirty_hours d
+    JOIN production_cycles c
+      ON c.factory_id = d.factory_id
+     AND c.start_time < d.hour_start + INTERVAL '1 hour'
+     AND c.end_time > d.hour_start
+),
+maintenance_facts AS (
+    SELECT d.factory_id, m.equipment_id, d.hour_start,
+           EXTRACT(EPOCH FROM LEAST(m.end_time, d.hour_start + INTERVAL '1 hour') - GREATEST(m.start_time, d.hour_start)) / 60 AS minutes,
+           m.type IN ('unplanned', 'repair') AS is_unplanned
+    FROM kpi_dirty_hours d
+    JOIN equipment e ON e.factory_id = d.factory_id
+    JOIN maintenance_log m
+      ON m.equipment_id = e.id
+     AND m.start_time < d.hour_start + INTERVAL '1 hour'
+     AND m.end_time > d.hour_start
+    WHERE m.status IS DISTINCT FROM 'cancelled'
+),
+energy_facts AS (
+    SELECT d.factory_id, md.equipment_id, d.hour_start, AVG(md.value) AS avg_kw
+    FROM kpi_dirty_hours d
+    JOIN equipment e ON e.factory_id = d.factory_id
+    JOIN metrics_data md
+      ON md.equipment_id = e.id
+     AND md.timestamp >= d.hour_start
+     AND md.timestamp < d.hour_start + INTERVAL '1 hour'
+    JOIN metrics_catalog mc ON mc.id = md.metric_id AND mc.category = 'energy'
+    GROUP BY d.factory_id, md.equipment_id, d.hour_start
+),
+facts AS (
+    SELECT factory_id, equipment_id, hour_start, overlap_s,
+           planned_quantity * overlap_s / cycle_s AS planned,
+           actual_quantity * overlap_s / cycle_s AS actual,
+           defect_quantity * overlap_s / cycle_s AS defects,
+           energy_consumed_kwh * overlap_s / cycle_s AS cycle_energy,
+           oee_score, availability, performance, quality,
+           0::numeric AS downtime, 0::numeric AS unplanned_downtime, NULL::numeric AS metered_energy
+    FROM cycle_facts
+    UNION ALL
+    SELECT factory_id, equipment_id, hour_start, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+           minutes, CASE WHEN is_unplanned THEN minutes ELSE 0 END, NULL
+    FROM maintenance_facts
+    UNION ALL
+    SELECT factory_id, equipment_id, hour_start, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+           0, 0, avg_kw
+    FROM energy_facts
+),
+grouped AS (
+    SELECT factory_id, equipment_id, GROUPING(equipment_id) AS is_factory, hour_start,
+           SUM(oee_score * overlap_s) / NULLIF(SUM(overlap_s) FILTER (WHERE oee_score IS NOT NULL), 0) AS oee_score,
+           SUM(availability * overlap_s) / NULLIF(SUM(overlap_s) FILTER (WHERE availability IS NOT NULL), 0) AS availability,
+           SUM(performance * overlap_s) / NULLIF(SUM(overlap_s) FILTER (WHERE performance IS NOT NULL), 0) AS performance,
+           SUM(quality * overlap_s) / NULLIF(SUM(overlap_s) FILTER (WHERE quality IS NOT NULL), 0) AS quality,
+           SUM(actual) AS total_production,
+           SUM(planned) AS planned_production,
+           SUM(defects) AS defects,
+           SUM(downtime) AS downtime,
+           SUM(unplanned_downtime) AS unplanned_downtime,
+           COALESCE(SUM(cycle_energy), SUM(metered_energy)) AS energy
+    FROM facts
+    GROUP BY GROUPING SETS ((factory_id, hour_start), (factory_id, equipment_id, hour_start))
+),
+equipment_counts AS (
+    SELECT factory_id, COUNT(*) AS n FROM equipment GROUP BY factory_id
+),
+sized AS (
+    SELECT g.*, 60 * CASE WHEN g.is_factory = 1 THEN GREATEST(COALESCE(ec.n, 1), 1) ELSE 1 END AS capacity_minutes
+    FROM grouped g
+    LEFT JOIN equipment_counts ec ON ec.factory_id = g.factory_id
+    WHERE g.is_factory = 1 OR g.equipment_id IS NOT NULL
+)
+INSERT INTO kpi_calculations ({KPI_COLUMNS})
+SELECT gen_random_uuid(),
+       CASE WHEN is_factory = 1 THEN 'factory' ELSE 'equipment' END,
+       CASE WHEN is_factory = 1 THEN factory_id ELSE equipment_id END,
+       'hourly', hour_start, hour_start + INTERVAL '1 hour' - INTERVAL '1 second',
+       ROUND(oee_score, 2), ROUND(availability, 2), ROUND(performance, 2), ROUND(quality, 2),
+       ROUND(total_production, 2), ROUND(planned_production, 2),
+       ROUND(LEAST(GREATEST((total_production - planned_production) / NULLIF(planned_production, 0) * 100, -999.99), 999.99), 2),
+       ROUND(LEAST(downtime, capacity_minutes)),
+       ROUND(LEAST(downtime, capacity_minutes) / capacity_minutes * 100, 2),
+       ROUND(LEAST(unplanned_downtime, capacity_minutes)),
+       ROUND(energy, 2),
+       ROUND(energy / NULLIF(total_production, 0), 4),
+       ROUND(LEAST(defects / NULLIF(total_production, 0) * 100, 999.99), 2)
+FROM sized
+"""
+
+# Производный уровень из более мелкого: суммы складываются, проценты усредняются
+DERIVED_INSERT_SQL = f"""
+WITH equipment_counts AS (
+    SELECT factory_id, COUNT(*) AS n FROM equipment GROUP BY factory_id
+),
+rolled AS (
+    SELECT k.entity_type, k.entity_id, p.period_start,
+           AVG(k.oee_score) AS oee_score,
+           AVG(k.availability) AS availability,
+           AVG(k.performance) AS performance,
+           AVG(k.quality) AS quality,
+           SUM(k.total_production) AS total_production,
+           SUM(k.planned_production) AS planned_production,
+           SUM(k.downtime_minutes) AS downtime,
+           SUM(k.unplanned_downtime_minutes) AS unplanned_downtime,
+           SUM(k.energy_consumption_kwh) AS energy,
+           SUM(k.defect_rate * k.total_production)
+               / NULLIF(SUM(k.total_production) FILTER (WHERE k.defect_rate IS NOT NULL), 0) AS defect_rate
+    FROM kpi_dirty_periods p
+    JOIN kpi_calculations k
+      ON k.entity_type = p.entity_type
+     AND k.entity_id = p.entity_id
+     AND k.period_type = :source_period_type
+     AND k.period_start >= p.period_start
+     AND k.period_start < p.period_start + INTERVAL '{{length}}'
+    GROUP BY k.entity_type, k.entity_id, p.period_start
+),
+sized AS (
+    SELECT r.*,
+           EXTRACT(EPOCH FROM INTERVAL '{{length}}') / 60
+               * CASE WHEN r.entity_type = 'factory' THEN GREATEST(COALESCE(ec.n, 1), 1) ELSE 1 END AS capacity_minutes
+    FROM rolled r
+    LEFT JOIN equipment_counts ec ON r.entity_type = 'factory' AND ec.factory_id = r.entity_id
+)
+INSERT INTO kpi_calculations ({KPI_COLUMNS})
+SELECT gen_random_uuid(), entity_type, entity_id,
+       :period_type, period_start, period_start + INTERVAL '{{length}}' - INTERVAL '1 second',
+       ROUND(oee_score, 2), ROUND(availability, 2), ROUND(performance, 2), ROUND(quality, 2),
+       ROUND(total_production, 2), ROUND(planned_production, 2),
+       ROUND(LEAST(GREATEST((total_production - planned_production) / NULLIF(planned_production, 0) * 100, -999.99), 999.99), 2),
+       downtime,
+       ROUND(LEAST(downtime / capacity_minutes * 100, 100), 2),
+       unplanned_downtime,
+       ROUND(energy, 2),
+       ROUND(energy / NULLIF(total_production, 0), 4),
+       ROUND(LEAST(defect_rate, 999.99), 2)
+FROM sized
+"""
+
+
+@dataclass
+class RollupResult:
+    """Итоги одного запуска пересчёта"""
+    since: datetime
+    until: datetime
+    dirty_hours: int = 0
+    factory_ids: List[UUID] = field(default_factory=list)
+    rows_written: Dict[str, int] = field(default_factory=dict)
+    duration_seconds: float = 0.0
+
+    @property
+    def total_rows(self) -> int:
+        return sum(self.rows_written.values())
+
+
+async def _read_watermark(conn) -> datetime:
+    watermark = await conn.scalar(
+        text("SELECT watermark FROM kpi_rollup_state WHERE name = :name FOR UPDATE"),
+        {"name": ROLLUP_NAME},
+    )
+    return watermark or INITIAL_WATERMARK
+
+
+async def _save_state(conn, result: RollupResult):
+    await conn.execute(
+        text(
+            "INSERT INTO kpi_rollup_state (name, watermark, last_run_at, last_dirty_hours, last_rows_written) "
+            "VALUES (:name, :watermark, now(), :dirty_hours, :rows_written) "
+            "ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, "
+            "last_run_at = EXCLUDED.last_run_at, last_dirty_hours = EXCLUDED.last_dirty_hours, "
+            "last_rows_written = EXCLUDED.last_rows_written"
+        ),
+        {
+            "name": ROLLUP_NAME,
+            "watermark": result.until,
+            "dirty_hours": result.dirty_hours,
+            "rows_written": result.total_rows,
+        },
+    )
+
+
+async def run_rollup(full: bool = False) -> Optional[RollupResult]:
+    """
+    Один инкрементальный запуск
+
+    full=True пересчитывает всю историю. Возвращает None, если пересчёт
+    уже выполняется в другом процессе
+    """
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        locked = await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+        if not locked:
+            return None
+
+        watermark = INITIAL_WATERMARK if full else await _read_watermark(conn)
+        until = await conn.scalar(text("SELECT now()"))
+        since = watermark
+        if watermark > INITIAL_WATERMARK:
+            since = watermark - timedelta(seconds=settings.KPI_ROLLUP_LATE_DATA_SECONDS)
+        result = RollupResult(since=since, until=until)
+
+        for statement in CREATE_DIRTY_TABLES_SQL:
+            await conn.execute(text(statement))
+        dirty = await conn.execute(text(COLLECT_DIRTY_HOURS_SQL), {"since": since, "until": until})
+        result.dirty_hours = dirty.rowcount
+
+        if result.dirty_hours:
+            result.factory_ids = (
+                await conn.execute(text("SELECT DISTINCT factory_id FROM kpi_dirty_hours"))
+            ).scalars().all()
+            for period_type, unit, length, source in ROLLUP_LEVELS:
+                await conn.execute(text("TRUNCATE kpi_dirty_periods"))
+                await conn.execute(text(COLLECT_DIRTY_PERIODS_SQL.format(unit=unit)))
+                await conn.execute(text(DELETE_DIRTY_PERIODS_SQL), {"period_type": period_type})
+                if source is None:
+                    inserted = await conn.execute(text(HOURLY_INSERT_SQL))
+                else:
+                    inserted = await conn.execute(
+                        text(DERIVED_INSERT_SQL.format(length=length)),
+                        {"period_type": period_type, "source_period_type": source},
+                    )
+                result.rows_written[period_type] = inserted.rowcount
+
+        await _save_state(conn, result)
+
+    result.duration_seconds = time.perf_counter() - started
+    if result.dirty_hours:
+        await invalidate_dashboard_stats(result.factory_ids)
+        logger.info(
+            f"Пересчёт KPI: {result.dirty_hours} часов, строк {result.rows_written}, "
+            f"{result.duration_seconds:.2f} с"
+        )
+    return result
+
+
+async def run_rollup_loop():
+    """Фоновый цикл пересчёта KPI"""
+    while True:
+        try:
+            await run_rollup()
+        except Exception as e:
+            logger.error(f"Ошибка пересчёта KPI: {e}")
+        await asyncio.sleep(settings.KPI_ROLLUP_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(run_rollup(full="--full" in sys.argv))
@@ -0,0 +1,98 @@
+"""
+Общее количество строк для списков: точное, оценочное или без подсчёта
+
+Оценка берётся из кэша точных подсчётов по сигнатуре фильтра (Redis).
+Если кэша нет или он устарел, сразу возвращается оценка планировщика
+(EXPLAIN), а точный count(*) пересчитывается в фоне.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import cache_get_json, cache_set_json
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+TOTAL_MODES = ("exact", "estimate", "none")
+CACHE_PREFIX = "list_total:"
+
+# Сигнатуры, для которых фоновый подсчёт уже запущен
+_refreshing: Set[str] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+def count_query(query: Select) -> Select:
+    """count(*) по тем же условиям, что и запрос страницы (без сортировки и лимита)"""
+    return select(func.count()).select_from(query.order_by(None).limit(None).offset(None).subquery())
+
+
+def _render(query: Select, dialect) -> str:
+    return str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def filter_signature(query: Select, dialect) -> str:
+    return hashlib.sha1(_render(query, dialect).encode()).hexdigest()
+
+
+async def planner_estimate(db: AsyncSession, query: Select) -> int:
+    """Число строк по оценке планировщика (без выполнения запроса)"""
+    connection = await db.connection()
+    sql = _render(query.order_by(None).limit(None).offset(None), connection.dialect)
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def _refresh(signature: str, query: Select):
+    try:
+        async with AsyncSessionLocal() as db:
+            total = await db.scalar(count_query(query)) or 0
+        await cache_set_json(
+            f"{CACHE_PREFIX}{signature}",
+            {"total": total, "counted_at": time.time()},
+            # Запись живёт дольше TTL: устаревшее значение лучше оценки планировщика
+            settings.LIST_TOTAL_CACHE_TTL_SECONDS * 10,
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось пересчитать total списка: {e}")
+    finally:
+        _refreshing.discard(signature)
+
+
+def _schedule_refresh(signature: str, query: Select):
+    if signature in _refreshing:
+        return
+    _refreshing.add(signature)
+    task = asyncio.create_task(_refresh(signature, query))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def list_total(db: AsyncSession, query: Select, mode: str) -> Tuple[Optional[int], bool]:
+    """
+    Общее количество строк запроса страницы
+
+    Возвращает (total, оценка ли это); при mode="none" - (None, False)
+    """
+    if mode == "none":
+        return None, False
+    if mode == "exact":
+        return await db.scalar(count_query(query)) or 0, False
+
+    signature = filter_signature(query.order_by(None).limit(None).offset(None), (await db.connection()).dialect)
+    cached = await cache_get_json(f"{CACHE_PREFIX}{signature}")
+    if cached is not None:
+        if time.time() - cached["counted_at"] > settings.LIST_TOTAL_CACHE_TTL_SECONDS:
+            _schedule_refresh(signature, query)
+        return cached["total"], True
+
+    _schedule_refresh(signature, query)
+    return await planner_estimate(db, query), True
@@ -0,0 +1,105 @@
+"""
+Агрегация временных рядов metrics_data по временным корзинам (date_bin)
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import Select, func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg
+
+from app.models.metrics import MetricsData
+
+# Допустимые размеры корзин
+BUCKETS: Dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# Допустимые агрегаты
+AGGREGATES = ("avg", "min", "max", "last", "count")
+
+# Точка отсчёта корзин: границы не зависят от запрошенного интервала
+BUCKET_ORIGIN = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+# Максимум корзин в одном ответе
+MAX_BUCKETS = 10000
+
+
+def parse_aggregates(agg: str) -> List[str]:
+    """Разобрать список агрегатов вида "avg,min,max" """
+    aggregates = [a.strip() for a in agg.split(",") if a.strip()]
+    unknown = [a for a in aggregates if a not in AGGREGATES]
+    if unknown or not aggregates:
+        raise ValueError(f"Допустимые агрегаты: {', '.join(AGGREGATES)}")
+    # Порядок сохраняется, дубликаты убираются
+    return list(dict.fromkeys(aggregates))
+
+
+def _aggregate_column(name: str):
+    value = MetricsData.value
+    if name == "avg":
+        return func.avg(value)
+    if name == "min":
+        return func.min(value)
+    if name == "max":
+        return func.max(value)
+    if name == "last":
+        return array_agg(aggregate_order_by(value, MetricsData.timestamp.desc()))[1]
+    return func.count(value)
+
+
+def build_bucket_query(
+    equipment_id: UUID,
+    bucket: str,
+    aggregates: List[str],
+    metric_id: Optional[UUID] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    max_buckets: int = MAX_BUCKETS,
+) -> Select:
+    """
+    Один запрос: по строке на (корзину, метрику), самые свежие корзины первыми
+    """
+    bucket_column = func.date_bin(
+        literal(BUCKETS[bucket]), MetricsData.timestamp, literal(BUCKET_ORIGIN)
+    ).label("bucket")
+
+    query = select(
+        bucket_column,
+        MetricsData.metric_id,
+        *[_aggregate_column(name).label(name) for name in aggregates],
+    ).where(MetricsData.equipment_id == equipment_id)
+
+    if metric_id:
+        query = query.where(MetricsData.metric_id == metric_id)
+    if start_time:
+        query = query.where(MetricsData.timestamp >= start_time)
+    if end_time:
+        query = query.where(MetricsData.timestamp <= end_time)
+
+    return (
+        query.group_by(bucket_column, MetricsData.metric_id)
+        .order_by(bucket_column.desc(), MetricsData.metric_id)
+        .limit(max_buckets)
+    )
+
+
+def serialize_buckets(rows, aggregates: List[str]) -> List[Dict[str, Any]]:
+    """Строки корзин в JSON, по возрастанию времени (удобно для графиков)"""
+    points = []
+    for row in reversed(rows):
+        point = {
+            "timestamp": row.bucket.isoformat(),
+            "metric_id": str(row.metric_id),
+        }
+        for name in aggregates:
+            value = getattr(row, name)
+            if name == "count":
+                point[name] = int(value)
+            else:
+                point[name] = float(value) if value is not None else None
+        points.append(point)
+    return points
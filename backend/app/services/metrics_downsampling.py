@@ -0,0 +1,164 @@
+"""
+Визуальное прореживание временных рядов (Largest-Triangle-Three-Buckets)
+
+Ряд читается из БД порциями и обрабатывается потоково: в памяти держатся
+только текущая и следующая корзины, поэтому 5М точек сводятся к N
+без загрузки всего диапазона.
+"""
+from typing import Tuple
+
+import numpy as np
+from sqlalchemy import Float, Select, cast, extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.metrics import MetricsData
+
+# Размер порции при чтении из БД (строк)
+CHUNK_SIZE = 50000
+
+_EMPTY = np.empty(0, dtype=np.float64)
+
+
+class StreamingLTTB:
+    """
+    Потоковый LTTB для заранее известного числа точек
+
+    Точки подаются порциями по возрастанию x через feed(), результат
+    забирается через finish(). Первая и последняя точки всегда сохраняются
+    """
+
+    def __init__(self, total: int, threshold: int):
+        self.total = total
+        self.threshold = threshold
+        self._passthrough = threshold < 3 or threshold >= total
+        self._buckets = threshold - 2
+        self._bucket = 0
+        self._seen = 0
+        self._offset = 0  # глобальный индекс первой точки буфера
+        self._bx = _EMPTY
+        self._by = _EMPTY
+        self._out_x: list = []
+        self._out_y: list = []
+
+    def _bucket_bounds(self, i: int) -> Tuple[int, int]:
+        """Глобальные индексы [start, end) корзины i (без первой и последней точек)"""
+        if i >= self._buckets:
+            return self.total - 1, self.total
+        n = self.total - 2
+        return (i * n) // self._buckets + 1, ((i + 1) * n) // self._buckets + 1
+
+    def feed(self, x: np.ndarray, y: np.ndarray):
+        # Строки сверх ожидаемого числа (досланные после подсчёта) отбрасываются
+        remaining = self.total - self._seen
+        if remaining <= 0:
+            return
+        x, y = x[:remaining], y[:remaining]
+        if not len(x):
+            return
+
+        if self._passthrough:
+            self._out_x.append(x)
+            self._out_y.append(y)
+            self._seen += len(x)
+            return
+
+        if self._seen == 0:
+            self._out_x.append(x[:1])
+            self._out_y.append(y[:1])
+        self._seen += len(x)
+        self._bx = np.concatenate((self._bx, x))
+        self._by = np.concatenate((self._by, y))
+        self._drain()
+
+    def _select(self, cx: np.ndarray, cy: np.ndarray, avg_x: float, avg_y: float):
+        """Выбрать точку корзины с наибольшей площадью треугольника (a, точка, среднее)"""
+        ax = self._out_x[-1][-1]
+        ay = self._out_y[-1][-1]
+        area = np.abs((ax - avg_x) * (cy - ay) - (ax - cx) * (avg_y - ay))
+        j = int(np.argmax(area))
+        self._out_x.append(cx[j:j + 1])
+        self._out_y.append(cy[j:j + 1])
+
+    def _drain(self):
+        while self._bucket < self._buckets:
+            start, end = self._bucket_bounds(self._bucket)
+            next_start, next_end = self._bucket_bounds(self._bucket + 1)
+            if self._seen < next_end:
+                return
+
+            o = self._offset
+            cx, cy = self._bx[start - o:end - o], self._by[start - o:end - o]
+            nx, ny = self._bx[next_start - o:next_end - o], self._by[next_start - o:next_end - o]
+            self._select(cx, cy, float(nx.mean()), float(ny.mean()))
+
+            self._bx, self._by = self._bx[end - o:], self._by[end - o:]
+            self._offset = end
+            self._bucket += 1
+
+    def finish(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self._passthrough and self._seen:
+            if self._bucket < self._buckets and len(self._bx) > 1:
+                # Строк оказалось меньше ожидаемого: остаток буфера сводится
+                # к одной точке относительно последней фактической
+                self._select(self._bx[:-1], self._by[:-1], float(self._bx[-1]), float(self._by[-1]))
+            if len(self._bx):
+                self._out_x.append(self._bx[-1:])
+                self._out_y.append(self._by[-1:])
+        if not self._out_x:
+            return _EMPTY, _EMPTY
+        return np.concatenate(self._out_x), np.concatenate(self._out_y)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """LTTB для ряда, уже находящегося в памяти"""
+    sampler = StreamingLTTB(len(x), threshold)
+    sampler.feed(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    return sampler.finish()
+
+
+def build_series_query(equipment_id, metric_id, start_time=None, end_time=None) -> Select:
+    """Ряд (epoch-секунды, значение) как float8 без загрузки ORM-объектов"""
+    query = (
+        select(
+            cast(extract("epoch", MetricsData.timestamp), Float).label("x"),
+            cast(MetricsData.value, Float).label("y"),
+        )
+        .where(MetricsData.equipment_id == equipment_id)
+        .where(MetricsData.metric_id == metric_id)
+        .where(MetricsData.value.isnot(None))
+    )
+    if start_time:
+        query = query.where(MetricsData.timestamp >= start_time)
+    if end_time:
+        query = query.where(MetricsData.timestamp <= end_time)
+    return query
+
+
+async def downsample_series(
+    db: AsyncSession,
+    equipment_id,
+    metric_id,
+    points: int,
+    start_time=None,
+    end_time=None,
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Прочитать ряд порциями через серверный курсор и свести его к points точкам
+
+    Возвращает (число исходных точек, x, y)
+    """
+    query = build_series_query(equipment_id, metric_id, start_time, end_time)
+    total = await db.scalar(select(func.count()).select_from(query.subquery())) or 0
+    if total == 0:
+        return 0, _EMPTY, _EMPTY
+
+    sampler = StreamingLTTB(total, points)
+    result = await db.stream(
+        query.order_by(MetricsData.timestamp).execution_options(yield_per=CHUNK_SIZE)
+    )
+    async for rows in result.partitions():
+        chunk = np.array(rows, dtype=np.float64)
+        sampler.feed(chunk[:, 0], chunk[:, 1])
+
+    x, y = sampler.finish()
+    return total, x, y
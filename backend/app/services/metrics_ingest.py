@@ -0,0 +1,325 @@
+"""
+Пакетный приём телеметрии в metrics_data через COPY
+"""
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.analytics import Anomaly
+from app.models.equipment import Equipment
+from app.models.metrics import MetricsCatalog, MetricsData
+from app.services.anomaly_detector import anomaly_detector, detect_batch
+from app.services.dashboard_stats import invalidate_dashboard_stats
+from app.services.metrics_partitions import partition_manager, retention_cutoff
+from app.services.metrics_pubsub import build_messages, metrics_broker
+
+# Колонки, которые заполняются при COPY (id и created_at берутся из server default)
+COPY_COLUMNS = ["equipment_id", "metric_id", "timestamp", "value", "is_anomaly", "is_critical"]
+
+# Сколько ошибок валидации возвращать клиенту в ответе
+MAX_REPORTED_ERRORS = 100
+
+# Границы metrics_data.value Numeric(20, 6)
+VALUE_LIMIT = Decimal(10) ** 14
+VALUE_QUANTUM = Decimal("1e-6")
+
+# Окно для расчёта устойчивой скорости приёма (секунды)
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+@dataclass
+class Reading:
+    """Нормализованное показание датчика"""
+    index: int
+    equipment_id: UUID
+    metric_code: str
+    timestamp: datetime
+    value: Optional[Decimal]
+    metric_id: Optional[UUID] = None
+    is_anomaly: bool = False
+    is_critical: bool = False
+
+
+@dataclass
+class IngestResult:
+    """Результат обработки одного пакета"""
+    received: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    anomalies: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    duration_seconds: float = 0.0
+
+    def reject(self, index: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"index": index, "reason": reason})
+
+    def as_dict(self) -> Dict[str, Any]:
+        rows_per_sec = self.accepted / self.duration_seconds if self.duration_seconds > 0 else None
+        return {
+            "received": self.received,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "anomalies": self.anomalies,
+            "errors": self.errors,
+            "duration_ms": round(self.duration_seconds * 1000, 2),
+            "rows_per_sec": round(rows_per_sec, 1) if rows_per_sec else None,
+            "sustained_rows_per_sec": ingest_stats.sustained_rows_per_sec(),
+        }
+
+
+class IngestStats:
+    """Скользящая статистика пропускной способности приёма в рамках процесса"""
+
+    def __init__(self, window_seconds: float = THROUGHPUT_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.total_rows = 0
+        self.total_batches = 0
+        self._samples: deque = deque()
+
+    def record(self, rows: int):
+        now = time.monotonic()
+        self.total_rows += rows
+        self.total_batches += 1
+        self._samples.append((now, rows))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+
+    def sustained_rows_per_sec(self) -> Optional[float]:
+        now = time.monotonic()
+        self._trim(now)
+        if not self._samples:
+            return None
+        span = max(now - self._samples[0][0], 1.0)
+        return round(sum(rows for _, rows in self._samples) / span, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.total_rows,
+            "batches": self.total_batches,
+            "sustained_rows_per_sec": self.sustained_rows_per_sec(),
+        }
+
+
+ingest_stats = IngestStats()
+
+
+def _parse_timestamp(raw: Any) -> datetime:
+    """Метка времени: ISO 8601 или Unix epoch (секунды). Без зоны считается UTC"""
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        return datetime.fromtimestamp(raw, tz=timezone.utc)
+    if isinstance(raw, str):
+        ts = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts
+    raise ValueError("неверный формат timestamp")
+
+
+def _parse_value(raw: Any) -> Optional[Decimal]:
+    if raw is None:
+        return None
+    if isinstance(raw, bool):
+        raise ValueError("неверное значение value")
+    try:
+        value = Decimal(str(raw))
+    except InvalidOperation:
+        raise ValueError("неверное значение value")
+    if not value.is_finite():
+        raise ValueError("value должно быть конечным числом")
+    # metrics_data.value - Numeric(20, 6): дробная часть округляется, как в PostgreSQL,
+    # а значение вне диапазона колонки сорвало бы COPY всего пакета
+    if abs(value) >= VALUE_LIMIT:
+        raise ValueError("value вне допустимого диапазона")
+    value = value.quantize(VALUE_QUANTUM, rounding=ROUND_HALF_UP)
+    if abs(value) >= VALUE_LIMIT:
+        raise ValueError("value вне допустимого диапазона")
+    return value
+
+
+def normalize_reading(index: int, item: Any) -> Reading:
+    """
+    Привести элемент пакета к Reading
+
+    Поддерживаются объекты {equipment_id, metric_code, timestamp, value}
+    и компактные массивы [equipment_id, metric_code, timestamp, value]
+    """
+    if isinstance(item, dict):
+        try:
+            equipment_id = item["equipment_id"]
+            metric_code = item["metric_code"]
+            timestamp = item["timestamp"]
+        except KeyError as e:
+            raise ValueError(f"отсутствует поле {e.args[0]}")
+        value = item.get("value")
+    elif isinstance(item, (list, tuple)) and len(item) == 4:
+        equipment_id, metric_code, timestamp, value = item
+    else:
+        raise ValueError("ожидается объект или массив из 4 элементов")
+
+    try:
+        equipment_uuid = UUID(str(equipment_id))
+    except ValueError:
+        raise ValueError("неверный формат equipment_id")
+    if not isinstance(metric_code, str) or not metric_code:
+        raise ValueError("неверный metric_code")
+    try:
+        ts = _parse_timestamp(timestamp)
+    except (ValueError, OverflowError, OSError):
+        raise ValueError("неверный формат timestamp")
+
+    return Reading(
+        index=index,
+        equipment_id=equipment_uuid,
+        metric_code=metric_code,
+        timestamp=ts,
+        value=_parse_value(value),
+    )
+
+
+def parse_json_payload(body: bytes) -> List[Any]:
+    """Тело JSON: массив показаний или объект {"readings": [...]}"""
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Некорректный JSON")
+    if isinstance(payload, dict):
+        payload = payload.get("readings")
+    if not isinstance(payload, list):
+        raise ValueError("Ожидается массив показаний")
+    return payload
+
+
+def parse_ndjson_payload(body: bytes) -> List[Any]:
+    """Тело NDJSON: по одному показанию (объект или массив) на строку"""
+    items = []
+    for line_no, line in enumerate(body.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Некорректный JSON в строке {line_no}")
+    return items
+
+
+async def copy_readings(db: AsyncSession, readings: List[Reading]):
+    """Запись показаний одним COPY через asyncpg (без построчных INSERT)"""
+    records = [
+        (r.equipment_id, r.metric_id, r.timestamp, r.value, r.is_anomaly, r.is_critical)
+        for r in readings
+    ]
+    connection = await db.connection()
+    # Секции под опоздавшие или опережающие показания, если их ещё нет
+    await partition_manager.ensure_for_timestamps(connection, (r.timestamp for r in readings))
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        MetricsData.__tablename__,
+        records=records,
+        columns=COPY_COLUMNS,
+    )
+
+
+async def _resolve_references(
+    db: AsyncSession,
+    readings: List[Reading],
+    user_factory_id: Optional[UUID],
+) -> Tuple[Dict[UUID, UUID], Dict[str, UUID]]:
+    """Одним запросом на таблицу получить factory_id оборудования и id метрик по кодам"""
+    equipment_ids = {r.equipment_id for r in readings}
+    metric_codes = {r.metric_code for r in readings}
+
+    equipment_query = select(Equipment.id, Equipment.factory_id).where(Equipment.id.in_(equipment_ids))
+    if user_factory_id:
+        equipment_query = equipment_query.where(Equipment.factory_id == user_factory_id)
+    equipment_rows = await db.execute(equipment_query)
+    equipment_factories = {row.id: row.factory_id for row in equipment_rows}
+
+    metric_rows = await db.execute(
+        select(MetricsCatalog.code, MetricsCatalog.id).where(MetricsCatalog.code.in_(metric_codes))
+    )
+    metric_ids = {row.code: row.id for row in metric_rows}
+
+    return equipment_factories, metric_ids
+
+
+async def ingest_readings(
+    db: AsyncSession,
+    items: List[Any],
+    user_factory_id: Optional[UUID] = None,
+) -> IngestResult:
+    """
+    Провалидировать пакет и записать принятые показания
+
+    Оборудование чужого завода отклоняется так же, как несуществующее.
+    Принятые показания проходят через детектор аномалий до записи
+    """
+    started = time.perf_counter()
+    result = IngestResult(received=len(items))
+
+    cutoff = retention_cutoff()
+    # Верхняя граница: иначе одно показание из далёкого будущего создало бы секции на годы вперёд
+    horizon = datetime.now(timezone.utc) + timedelta(seconds=settings.METRICS_INGEST_MAX_FUTURE_SECONDS)
+    readings: List[Reading] = []
+    for index, item in enumerate(items):
+        try:
+            reading = normalize_reading(index, item)
+        except ValueError as e:
+            result.reject(index, str(e))
+            continue
+        if cutoff and reading.timestamp < cutoff:
+            result.reject(index, "timestamp за пределами срока хранения")
+            continue
+        if reading.timestamp > horizon:
+            result.reject(index, "timestamp в будущем")
+            continue
+        readings.append(reading)
+
+    if readings:
+        equipment_factories, metric_ids = await _resolve_references(db, readings, user_factory_id)
+
+        accepted: List[Reading] = []
+        for reading in readings:
+            if reading.equipment_id not in equipment_factories:
+                result.reject(reading.index, "оборудование не найдено или нет доступа")
+                continue
+            metric_id = metric_ids.get(reading.metric_code)
+            if metric_id is None:
+                result.reject(reading.index, f"неизвестный metric_code: {reading.metric_code}")
+                continue
+            reading.metric_id = metric_id
+            accepted.append(reading)
+
+        if accepted:
+            anomalies = []
+            if settings.ANOMALY_DETECTION_ENABLED:
+                await anomaly_detector.refresh_bounds(db)
+                anomalies = detect_batch(anomaly_detector, accepted)
+            await copy_readings(db, accepted)
+            if anomalies:
+                await db.execute(insert(Anomaly), anomalies)
+                result.anomalies = len(anomalies)
+            await db.commit()
+            result.accepted = len(accepted)
+            if anomalies:
+                await invalidate_dashboard_stats({equipment_factories[a["equipment_id"]] for a in anomalies})
+            if settings.REALTIME_ENABLED:
+                await metrics_broker.publish(build_messages(accepted, anomalies))
+
+    result.duration_seconds = time.perf_counter() - started
+    ingest_stats.record(result.accepted)
+    return result
@@ -0,0 +1,185 @@
+"""
+Обслуживание секций (partitions) таблицы metrics_data
+
+metrics_data секционирована по RANGE (timestamp) с шагом день или неделя
+(METRICS_PARTITION_INTERVAL). Здесь создаются будущие секции и удаляются
+секции старше срока хранения - вместо массового DELETE.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+
+PARENT_TABLE = "metrics_data"
+PARTITION_PREFIX = f"{PARENT_TABLE}_p"
+
+# Как часто фоновая задача проверяет секции (секунды)
+MAINTENANCE_INTERVAL_SECONDS = 3600
+
+
+def partition_step() -> timedelta:
+    if settings.METRICS_PARTITION_INTERVAL == "weekly":
+        return timedelta(weeks=1)
+    return timedelta(days=1)
+
+
+def partition_start(ts: datetime) -> datetime:
+    """Начало секции, в которую попадает метка времени (UTC)"""
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    start = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if settings.METRICS_PARTITION_INTERVAL == "weekly":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def partition_starts(start: datetime, end: datetime) -> List[datetime]:
+    """Начала всех секций, покрывающих интервал [start, end]"""
+    step = partition_step()
+    current = partition_start(start)
+    last = partition_start(end)
+    starts = []
+    while current <= last:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def retention_cutoff(now: Optional[datetime] = None) -> Optional[datetime]:
+    """Граница хранения: данные раньше неё удаляются. None - хранить бессрочно"""
+    if settings.METRICS_RETENTION_DAYS <= 0:
+        return None
+    now = now or datetime.now(timezone.utc)
+    return now - timedelta(days=settings.METRICS_RETENTION_DAYS)
+
+
+class PartitionManager:
+    """Создание и удаление секций с кэшем уже известных секций в процессе"""
+
+    def __init__(self):
+        self._known: Set[str] = set()
+
+    async def is_partitioned(self, conn) -> bool:
+        result = await conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace"
+            ),
+            {"table": PARENT_TABLE},
+        )
+        return result.scalar() is not None
+
+    async def list_partitions(self, conn) -> List[str]:
+        result = await conn.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = :table AND parent.relnamespace = 'public'::regnamespace"
+            ),
+            {"table": PARENT_TABLE},
+        )
+        return [row[0] for row in result]
+
+    async def partition_range(self, conn) -> Optional[Tuple[datetime, datetime]]:
+        """Интервал [начало первой секции, конец последней) или None, если секций нет"""
+        starts = []
+        for name in await self.list_partitions(conn):
+            try:
+                starts.append(datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").replace(tzinfo=timezone.utc))
+            except ValueError:
+                continue
+        if not starts:
+            return None
+        return min(starts), max(starts) + partition_step()
+
+    async def ensure_partitions(self, conn, start: datetime, end: datetime) -> List[str]:
+        """
+        Создать недостающие секции для интервала [start, end]
+
+        Возвращает имена созданных секций. Повторные вызовы для уже
+        покрытого интервала не обращаются к каталогу PostgreSQL
+        """
+        return await self._ensure(conn, partition_starts(start, end))
+
+    async def ensure_for_timestamps(self, conn, timestamps: Iterable[datetime]) -> List[str]:
+        """Создать только секции, в которые попадают метки времени"""
+        return await self._ensure(conn, sorted({partition_start(ts) for ts in timestamps}))
+
+    async def _ensure(self, conn, starts: List[datetime]) -> List[str]:
+        if all(partition_name(s) in self._known for s in starts):
+            return []
+
+        # В кэш попадают только секции из каталога: созданные здесь откатятся
+        # вместе с транзакцией вызывающего, если она не завершится, и будут
+        # добавлены при следующем чтении каталога
+        self._known.update(await self.list_partitions(conn))
+        step = partition_step()
+        created = []
+        for s in starts:
+            name = partition_name(s)
+            if name in self._known:
+                continue
+            await conn.execute(
+                text(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {PARENT_TABLE} '
+                    f"FOR VALUES FROM ('{s.isoformat()}') TO ('{(s + step).isoformat()}')"
+                )
+            )
+            created.append(name)
+        return created
+
+    async def drop_expired_partitions(self, conn, now: Optional[datetime] = None) -> List[str]:
+        """Удалить секции, целиком лежащие раньше границы хранения"""
+        cutoff = retention_cutoff(now)
+        if cutoff is None:
+            return []
+
+        step = partition_step()
+        dropped = []
+        for name in await self.list_partitions(conn):
+            suffix = name[len(PARTITION_PREFIX):]
+            if not name.startswith(PARTITION_PREFIX) or not suffix.isdigit():
+                continue
+            start = datetime.strptime(suffix, "%Y%m%d").replace(tzinfo=timezone.utc)
+            if start + step <= cutoff:
+                await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                self._known.discard(name)
+                dropped.append(name)
+        return dropped
+
+
+partition_manager = PartitionManager()
+
+
+async def maintain_partitions(now: Optional[datetime] = None):
+    """Создать секции на METRICS_PARTITION_PREMAKE интервалов вперёд и удалить устаревшие"""
+    now = now or datetime.now(timezone.utc)
+    async with engine.begin() as conn:
+        if not await partition_manager.is_partitioned(conn):
+            logger.warning("metrics_data не секционирована, обслуживание секций пропущено")
+            return
+        horizon = now + partition_step() * settings.METRICS_PARTITION_PREMAKE
+        created = await partition_manager.ensure_partitions(conn, now, horizon)
+        dropped = await partition_manager.drop_expired_partitions(conn, now)
+    if created or dropped:
+        logger.info(f"Секции metrics_data: создано {len(created)}, удалено {len(dropped)}")
+
+
+async def run_partition_maintenance():
+    """Фоновый цикл обслуживания секций"""
+    while True:
+        try:
+            await maintain_partitions()
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания секций metrics_data: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
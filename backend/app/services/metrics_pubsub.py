@@ -0,0 +1,234 @@
+"""
+Рассылка новых показаний подписчикам (WebSocket / SSE)
+
+Приём телеметрии публикует по сообщению на оборудование в канал
+metrics:equipment:{id}. Между воркерами сообщения идут через Redis pub/sub;
+при REALTIME_BACKEND=memory или недоступном Redis - только внутри процесса.
+В каждом воркере одно соединение Redis подписано лишь на каналы, у которых
+есть локальные подписчики, и раскладывает сообщения по их очередям.
+Сообщение сериализуется один раз и отдаётся всем подписчикам как есть.
+
+Медленный подписчик не тормозит остальных: его очередь ограничена, при
+переполнении выбрасывается самое старое сообщение, а клиент следующим
+получает событие gap с числом пропущенных (пора перечитать /metrics/data).
+"""
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+import redis.asyncio as redis
+from loguru import logger
+
+from app.core.config import settings
+from app.core.responses import dumps
+
+CHANNEL_PREFIX = "metrics:equipment:"
+# Пауза перед переподключением слушателя после ошибки Redis (секунды)
+RECONNECT_SECONDS = 5.0
+
+
+def channel_name(equipment_id: UUID) -> str:
+    return f"{CHANNEL_PREFIX}{equipment_id}"
+
+
+class Subscriber:
+    """Подписка одного соединения: ограниченная очередь сообщений"""
+
+    __slots__ = ("channels", "queue", "dropped", "_broker")
+
+    def __init__(self, broker: "MetricsBroker", channels: Set[str], max_queue: int):
+        self._broker = broker
+        self.channels = channels
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(max_queue)
+        self.dropped = 0
+
+    def offer(self, message: bytes):
+        """Положить сообщение; при полной очереди вытеснить самое старое"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self._broker.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self) -> bytes:
+        """Следующее сообщение; после вытеснений сначала приходит gap"""
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return dumps({"type": "gap", "dropped": dropped})
+        return await self.queue.get()
+
+
+class MetricsBroker:
+    """Подписки процесса по каналам оборудования"""
+
+    def __init__(self, backend: str = settings.REALTIME_BACKEND, max_queue: int = settings.REALTIME_QUEUE_SIZE):
+        self.backend = backend
+        self.max_queue = max_queue
+        self._channels: Dict[str, Set[Subscriber]] = {}
+        self._redis: Optional[redis.Redis] = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def uses_redis(self) -> bool:
+        return self.backend == "redis"
+
+    def _client(self) -> redis.Redis:
+        # Отдельный клиент без короткого socket_timeout кэша: слушатель ждёт сообщений долго
+        if self._redis is None:
+            self._redis = redis.from_url(settings.REDIS_URL, socket_connect_timeout=1.0)
+        return self._redis
+
+    async def subscribe(self, equipment_ids: Iterable[UUID]) -> Subscriber:
+        channels = {channel_name(equipment_id) for equipment_id in equipment_ids}
+        subscriber = Subscriber(self, channels, self.max_queue)
+        new_channels = [channel for channel in channels if channel not in self._channels]
+        for channel in channels:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        if self.uses_redis:
+            self._ensure_listener()
+            if new_channels and self._pubsub is not None:
+                await self._redis_call("subscribe", new_channels)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Синхронно: вызывается и из finally отменённых задач"""
+        empty = []
+        for channel in subscriber.channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._channels[channel]
+                empty.append(channel)
+        if empty and self.uses_redis and self._pubsub is not None:
+            task = asyncio.get_running_loop().create_task(self._unsubscribe_idle(empty))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _unsubscribe_idle(self, channels: List[str]):
+        # До запуска задачи на канал могли подписаться снова: его не трогаем
+        idle = [channel for channel in channels if channel not in self._channels]
+        if idle and self._pubsub is not None:
+            await self._redis_call("unsubscribe", idle)
+
+    async def _redis_call(self, method: str, channels: List[str]):
+        try:
+            await getattr(self._pubsub, method)(*channels)
+        except (redis.RedisError, OSError) as e:
+            # Слушатель переподключится и подпишется на актуальный набор каналов
+            logger.warning(f"Realtime: не удалось выполнить {method} в Redis: {e}")
+
+    def _dispatch(self, channel: str, message: bytes):
+        for subscriber in self._channels.get(channel, ()):
+            subscriber.offer(message)
+            self.delivered += 1
+
+    async def publish(self, messages: Dict[UUID, Dict[str, Any]]):
+        """Опубликовать сообщения: {equipment_id: сообщение}"""
+        if not messages:
+            return
+        encoded = {channel_name(equipment_id): dumps(message) for equipment_id, message in messages.items()}
+        self.published += len(encoded)
+        if self.uses_redis:
+            try:
+                async with self._client().pipeline(transaction=False) as pipe:
+                    for channel, data in encoded.items():
+                        pipe.publish(channel, data)
+                    await pipe.execute()
+                return
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f"Realtime: Redis недоступен, рассылка только внутри процесса: {e}")
+        for channel, data in encoded.items():
+            self._dispatch(channel, data)
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        """Читать сообщения Redis и раскладывать по локальным подпискам"""
+        while True:
+            try:
+                self._pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+                if self._channels:
+                    await self._pubsub.subscribe(*self._channels)
+                while True:
+                    if not self._pubsub.subscribed:
+                        # Без подписок get_message сразу возвращает None
+                        await asyncio.sleep(0.1)
+                        continue
+                    message = await self._pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._dispatch(message["channel"].decode(), message["data"])
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f"Realtime: соединение с Redis потеряно, повтор через {RECONNECT_SECONDS:.0f} с: {e}")
+            finally:
+                if self._pubsub is not None:
+                    await self._pubsub.aclose()
+                    self._pubsub = None
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "channels": len(self._channels),
+            "subscribers": len({s for subscribers in self._channels.values() for s in subscribers}),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+metrics_broker = MetricsBroker()
+
+
+def build_messages(readings, anomalies: List[Dict[str, Any]]) -> Dict[UUID, Dict[str, Any]]:
+    """
+    Сообщения по оборудованию из принятого пакета: показания и найденные аномалии
+    """
+    messages: Dict[UUID, Dict[str, Any]] = {}
+    for reading in readings:
+        message = messages.get(reading.equipment_id)
+        if message is None:
+            message = messages[reading.equipment_id] = {
+                "type": "readings",
+                "equipment_id": reading.equipment_id,
+                "readings": [],
+                "anomalies": [],
+            }
+        message["readings"].append({
+            "metric": reading.metric_code,
+            "metric_id": reading.metric_id,
+            "timestamp": reading.timestamp,
+            "value": reading.value,
+            "is_anomaly": reading.is_anomaly,
+            "is_critical": reading.is_critical,
+        })
+    for anomaly in anomalies:
+        message = messages.get(anomaly["equipment_id"])
+        if message is not None:
+            message["anomalies"].append({
+                "metric_id": anomaly.get("metric_id"),
+                "detected_at": anomaly["detected_at"],
+                "anomaly_type": anomaly["anomaly_type"],
+                "severity": anomaly["severity"],
+                "anomaly_score": anomaly.get("anomaly_score"),
+            })
+    return messages
@@ -0,0 +1,268 @@
+"""
+Пакетная оценка аномалий IsolationForest по окнам metrics_data
+
+Для каждого типа оборудования строится матрица признаков «окно × метрика»
+(avg/std/min/max за окно), модель обучается на выборке окон и оценивает
+все окна типа. Обучение и оценка идут в ProcessPoolExecutor порциями
+(шардами), чтобы загрузить все ядра; чтение признаков и запись результатов
+выполняются в основном процессе параллельно с расчётом.
+
+Запуск (ночной, по cron):
+    python -m app.services.ml_anomaly_scoring
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sklearn.ensemble import IsolationForest
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+from app.services.dashboard_stats import invalidate_dashboard_stats
+
+# Имя модели в anomalies.pattern: по нему находятся записи этого задания
+MODEL_NAME = "isolation_forest"
+N_ESTIMATORS = 200
+# Сколько окон максимум отдавать на обучение одной модели
+MAX_TRAIN_WINDOWS = 100000
+# Тип с меньшим числом окон не оценивается
+MIN_TRAIN_WINDOWS = 50
+# Размер шарда при оценке (окон)
+SHARD_WINDOWS = 50000
+# Признак отбрасывается, если его нет больше чем в половине окон
+MAX_MISSING_SHARE = 0.5
+# Оценка, начиная с которой аномалия считается высокой
+HIGH_SEVERITY_SCORE = 0.75
+
+FEATURE_COLUMNS = ["avg", "std", "min", "max"]
+
+SELECT_TYPES_SQL = "SELECT DISTINCT equipment_type_id FROM equipment"
+
+SELECT_FEATURES_SQL = """
+SELECT m.equipment_id,
+       date_bin(CAST(:window AS interval), m.timestamp, CAST(:origin AS timestamptz)) AS window_start,
+       m.metric_id::text AS metric_id,
+       avg(m.value)::float8 AS avg,
+       COALESCE(stddev_pop(m.value), 0)::float8 AS std,
+       min(m.value)::float8 AS min,
+       max(m.value)::float8 AS max
+FROM metrics_data m
+JOIN equipment e ON e.id = m.equipment_id
+WHERE e.equipment_type_id IS NOT DISTINCT FROM CAST(:equipment_type_id AS uuid)
+  AND m.timestamp >= :since
+  AND m.timestamp < :until
+  AND m.value IS NOT NULL
+GROUP BY 1, 2, 3
+"""
+
+# Повторный запуск обновляет оценку ранее найденных окон
+UPDATE_SCORES_SQL = """
+UPDATE anomalies a
+SET anomaly_score = round(v.score::numeric, 4),
+    severity = CASE WHEN v.score >= :high THEN 'high' ELSE 'medium' END
+FROM unnest(
+    CAST(:equipment_ids AS uuid[]),
+    CAST(:window_starts AS timestamptz[]),
+    CAST(:scores AS float8[])
+) AS v(equipment_id, window_start, score)
+WHERE a.equipment_id = v.equipment_id
+  AND a.detected_at = v.window_start
+  AND a.pattern = :model
+"""
+
+INSERT_ANOMALIES_SQL = """
+INSERT INTO anomalies (id, equipment_id, detected_at, severity, anomaly_score, anomaly_type, pattern, related_metrics, status)
+SELECT gen_random_uuid(), v.equipment_id, v.window_start,
+       CASE WHEN v.score >= :high THEN 'high' ELSE 'medium' END,
+       round(v.score::numeric, 4), 'multivariate', :model,
+       jsonb_build_object('window_minutes', CAST(:window_minutes AS int), 'features', CAST(:features AS int)),
+       'new'
+FROM unnest(
+    CAST(:equipment_ids AS uuid[]),
+    CAST(:window_starts AS timestamptz[]),
+    CAST(:scores AS float8[])
+) AS v(equipment_id, window_start, score)
+WHERE v.score >= :threshold
+  AND NOT EXISTS (
+      SELECT 1 FROM anomalies a
+      WHERE a.equipment_id = v.equipment_id
+        AND a.detected_at = v.window_start
+        AND a.pattern = :model
+  )
+"""
+
+# Точка отсчёта окон, чтобы границы не зависели от момента запуска
+WINDOW_ORIGIN = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class ShardTiming:
+    """Время обработки одного шарда"""
+    equipment_type_id: Optional[UUID]
+    stage: str  # fit, score
+    shard: int
+    windows: int
+    seconds: float
+    pid: int
+
+
+@dataclass
+class ScoringResult:
+    """Итоги запуска"""
+    equipment_types: int = 0
+    windows: int = 0
+    scores_updated: int = 0
+    anomalies_inserted: int = 0
+    duration_seconds: float = 0.0
+    shards: List[ShardTiming] = field(default_factory=list)
+
+
+def build_feature_matrix(rows) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Строки (оборудование, окно, метрика, агрегаты) -> матрица признаков
+
+    Возвращает индекс окон (equipment_id, window_start) и матрицу float64;
+    пропуски заполняются медианой признака
+    """
+    df = pd.DataFrame.from_records(rows, columns=["equipment_id", "window_start", "metric_id", *FEATURE_COLUMNS])
+    wide = df.pivot(index=["equipment_id", "window_start"], columns="metric_id", values=FEATURE_COLUMNS)
+    wide = wide.loc[:, wide.isna().mean() <= MAX_MISSING_SHARE]
+    wide = wide.fillna(wide.median())
+    return wide.index.to_frame(index=False), wide.to_numpy(dtype=np.float64)
+
+
+def _fit_model(X: np.ndarray, seed: int) -> Tuple[IsolationForest, float, int]:
+    started = time.perf_counter()
+    model = IsolationForest(n_estimators=N_ESTIMATORS, random_state=seed, n_jobs=1).fit(X)
+    return model, time.perf_counter() - started, os.getpid()
+
+
+def _score_shard(model: IsolationForest, X: np.ndarray) -> Tuple[np.ndarray, float, int]:
+    started = time.perf_counter()
+    # score_samples возвращает -s(x, n); s в (0, 1], близко к 1 - аномалия
+    scores = -model.score_samples(X)
+    return scores, time.perf_counter() - started, os.getpid()
+
+
+async def _score_type(
+    pool: ProcessPoolExecutor,
+    equipment_type_id: Optional[UUID],
+    windows: pd.DataFrame,
+    X: np.ndarray,
+    result: ScoringResult,
+):
+    """Обучить модель типа, оценить окна шардами и записать результаты"""
+    loop = asyncio.get_running_loop()
+    rng = np.random.default_rng(0)
+    train = X if len(X) <= MAX_TRAIN_WINDOWS else X[rng.choice(len(X), MAX_TRAIN_WINDOWS, replace=False)]
+
+    model, seconds, pid = await loop.run_in_executor(pool, _fit_model, train, 0)
+    result.shards.append(ShardTiming(equipment_type_id, "fit", 0, len(train), seconds, pid))
+
+    bounds = np.linspace(0, len(X), math.ceil(len(X) / SHARD_WINDOWS) + 1, dtype=int)
+    shards = await asyncio.gather(*[
+        loop.run_in_executor(pool, _score_shard, model, X[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ])
+    for i, (shard_scores, seconds, pid) in enumerate(shards):
+        timing = ShardTiming(equipment_type_id, "score", i, len(shard_scores), seconds, pid)
+        result.shards.append(timing)
+        logger.info(
+            f"ML-оценка: тип {equipment_type_id}, шард {i}: {timing.windows} окон "
+            f"за {timing.seconds:.2f} с (pid {timing.pid})"
+        )
+    scores = np.concatenate([shard[0] for shard in shards])
+
+    params = {
+        "equipment_ids": list(windows["equipment_id"]),
+        "window_starts": list(windows["window_start"]),
+        "scores": scores.tolist(),
+        "model": MODEL_NAME,
+        "high": HIGH_SEVERITY_SCORE,
+    }
+    async with engine.begin() as conn:
+        updated = await conn.execute(text(UPDATE_SCORES_SQL), params)
+        inserted = await conn.execute(text(INSERT_ANOMALIES_SQL), {
+            **params,
+            "threshold": settings.ML_ANOMALY_SCORE_THRESHOLD,
+            "window_minutes": settings.ML_SCORING_WINDOW_MINUTES,
+            "features": X.shape[1],
+        })
+    result.windows += len(X)
+    result.scores_updated += updated.rowcount
+    result.anomalies_inserted += inserted.rowcount
+
+
+async def run_ml_scoring(
+    lookback_days: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> ScoringResult:
+    """Оценить окна за последние lookback_days по всему парку оборудования"""
+    lookback_days = lookback_days or settings.ML_SCORING_LOOKBACK_DAYS
+    workers = workers or settings.ML_SCORING_WORKERS or os.cpu_count() or 1
+    window = timedelta(minutes=settings.ML_SCORING_WINDOW_MINUTES)
+
+    # Только закрытые окна
+    now = datetime.now(timezone.utc)
+    until = WINDOW_ORIGIN + ((now - WINDOW_ORIGIN) // window) * window
+    since = until - timedelta(days=lookback_days)
+
+    result = ScoringResult()
+    started = time.perf_counter()
+    # spawn: дочерние процессы не наследуют event loop и соединения с БД
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        async with engine.connect() as conn:
+            equipment_types = (await conn.execute(text(SELECT_TYPES_SQL))).scalars().all()
+
+        tasks = []
+        for equipment_type_id in equipment_types:
+            async with engine.connect() as conn:
+                rows = (await conn.execute(text(SELECT_FEATURES_SQL), {
+                    "window": window,
+                    "origin": WINDOW_ORIGIN,
+                    "equipment_type_id": equipment_type_id,
+                    "since": since,
+                    "until": until,
+                })).all()
+            if not rows:
+                continue
+            windows, X = build_feature_matrix(rows)
+            if len(X) < MIN_TRAIN_WINDOWS or X.shape[1] == 0:
+                logger.info(f"ML-оценка: тип {equipment_type_id} пропущен, окон: {len(X)}")
+                continue
+            result.equipment_types += 1
+            # Пока пул считает этот тип, читаются признаки следующего
+            tasks.append(asyncio.create_task(_score_type(pool, equipment_type_id, windows, X, result)))
+        await asyncio.gather(*tasks)
+
+    if result.scores_updated or result.anomalies_inserted:
+        await invalidate_dashboard_stats()
+
+    result.duration_seconds = time.perf_counter() - started
+    logger.info(
+        f"ML-оценка завершена: типов {result.equipment_types}, окон {result.windows}, "
+        f"новых аномалий {result.anomalies_inserted}, обновлено {result.scores_updated}, "
+        f"{result.duration_seconds:.1f} с на {workers} процессах"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    result = asyncio.run(run_ml_scoring())
+    print(f"{'тип оборудования':<38} {'этап':<6} {'шард':>5} {'окон':>8} {'сек':>8} {'pid':>8}")
+    for shard in result.shards:
+        print(
+            f"{str(shard.equipment_type_id):<38} {shard.stage:<6} {shard.shard:>5} "
+            f"{shard.windows:>8} {shard.seconds:>8.2f} {shard.pid:>8}"
+        )
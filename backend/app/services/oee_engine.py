@@ -0,0 +1,229 @@
+"""
+Векторизованный расчёт OEE для производственных циклов
+
+Циклы читаются порциями в столбцовом виде (float8 вместо Decimal),
+OEE = доступность × производительность × качество считается операциями
+NumPy над всей порцией, простои берутся из пересечений с maintenance_log
+(перекрывающиеся окна обслуживания объединяются). Порции идут по
+(start_time, id), так что каждая покрывает ограниченный отрезок времени.
+Результат записывается одним UPDATE ... FROM unnest(...) на порцию.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sqlalchemy import text
+
+from app.core.database import engine
+
+# Размер порции циклов
+CHUNK_SIZE = 20000
+
+CYCLE_COLUMNS = [
+    "id", "equipment_id", "start_ts", "end_ts", "planned_quantity", "actual_quantity", "defect_quantity", "start_time",
+]
+MAINTENANCE_COLUMNS = ["equipment_id", "m_start_ts", "m_end_ts"]
+
+SELECT_CYCLES_SQL = """
+SELECT id, equipment_id::text,
+       EXTRACT(EPOCH FROM start_time)::float8,
+       EXTRACT(EPOCH FROM end_time)::float8,
+       planned_quantity::float8, actual_quantity::float8, COALESCE(defect_quantity, 0)::float8,
+       start_time
+FROM production_cycles
+WHERE (start_time, id) > (:after_start, :after_id)
+  AND end_time > start_time
+  {filters}
+ORDER BY start_time, id
+LIMIT :limit
+"""
+
+SELECT_MAINTENANCE_SQL = """
+SELECT equipment_id::text,
+       EXTRACT(EPOCH FROM start_time)::float8,
+       EXTRACT(EPOCH FROM end_time)::float8
+FROM maintenance_log
+WHERE equipment_id = ANY(CAST(:equipment_ids AS uuid[]))
+  AND start_time < to_timestamp(:max_end)
+  AND end_time > to_timestamp(:min_start)
+  AND status IS DISTINCT FROM 'cancelled'
+"""
+
+# updated_at выставляется явно, чтобы пересчёт KPI увидел изменения
+BULK_UPDATE_SQL = """
+UPDATE production_cycles c
+SET availability = v.availability::numeric(5, 2),
+    performance = v.performance::numeric(5, 2),
+    quality = v.quality::numeric(5, 2),
+    oee_score = v.oee_score::numeric(5, 2),
+    updated_at = now()
+FROM unnest(
+    CAST(:ids AS uuid[]),
+    CAST(:availability AS float8[]),
+    CAST(:performance AS float8[]),
+    CAST(:quality AS float8[]),
+    CAST(:oee_score AS float8[])
+) AS v(id, availability, performance, quality, oee_score)
+WHERE c.id = v.id
+"""
+
+
+def merge_intervals(maintenance: pd.DataFrame) -> pd.DataFrame:
+    """Объединить перекрывающиеся окна обслуживания одного оборудования"""
+    if len(maintenance) < 2:
+        return maintenance
+    df = maintenance.sort_values(["equipment_id", "m_start_ts"], kind="mergesort").reset_index(drop=True)
+    # Окно начинает новую группу, если оно позже конца всех предыдущих окон оборудования
+    reach = df.groupby("equipment_id", sort=False)["m_end_ts"].cummax()
+    previous_reach = reach.groupby(df["equipment_id"], sort=False).shift()
+    group = (previous_reach.isna() | (df["m_start_ts"] > previous_reach)).cumsum()
+    merged = df.groupby(group, sort=False).agg(
+        equipment_id=("equipment_id", "first"), m_start_ts=("m_start_ts", "min"), m_end_ts=("m_end_ts", "max"),
+    )
+    return merged.reset_index(drop=True)[MAINTENANCE_COLUMNS]
+
+
+def compute_oee(cycles: pd.DataFrame, maintenance: pd.DataFrame) -> pd.DataFrame:
+    """
+    Расчёт OEE для порции циклов
+
+    cycles: CYCLE_COLUMNS (время в epoch-секундах), maintenance: MAINTENANCE_COLUMNS
+(окна одного оборудования могут перекрываться).
+    Возвращает availability, performance, quality, oee_score в процентах;
+    NaN там, где входных данных недостаточно
+    """
+    n = len(cycles)
+    start = cycles["start_ts"].to_numpy(dtype=np.float64)
+    end = cycles["end_ts"].to_numpy(dtype=np.float64)
+    planned_s = end - start
+
+    # Простой: суммарное пересечение окон обслуживания того же оборудования с циклом
+    downtime_s = np.zeros(n)
+    maintenance = merge_intervals(maintenance)
+    if len(maintenance) and n:
+        left = pd.DataFrame({
+            "row": np.arange(n),
+            "equipment_id": cycles["equipment_id"].to_numpy(),
+            "start_ts": start,
+            "end_ts": end,
+        })
+        pairs = left.merge(maintenance, on="equipment_id", how="inner")
+        if len(pairs):
+            overlap = (
+                np.minimum(pairs["end_ts"].to_numpy(), pairs["m_end_ts"].to_numpy())
+                - np.maximum(pairs["start_ts"].to_numpy(), pairs["m_start_ts"].to_numpy())
+            ).clip(min=0)
+            downtime_s = np.bincount(pairs["row"].to_numpy(), weights=overlap, minlength=n)
+
+    run_s = np.clip(planned_s - downtime_s, 0, planned_s)
+    planned_qty = cycles["planned_quantity"].to_numpy(dtype=np.float64)
+    actual_qty = cycles["actual_quantity"].to_numpy(dtype=np.float64)
+    defects = cycles["defect_quantity"].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        availability = run_s / planned_s
+        # Плановое количество рассчитано на всё время цикла, ожидаемое - на время работы
+        expected_qty = planned_qty * availability
+        performance = np.where(expected_qty > 0, np.minimum(actual_qty / expected_qty, 1.0), np.nan)
+        quality = np.where(actual_qty > 0, np.clip((actual_qty - defects) / actual_qty, 0.0, 1.0), np.nan)
+    oee = availability * performance * quality
+
+    return pd.DataFrame({
+        "availability": np.round(availability * 100, 2),
+        "performance": np.round(performance * 100, 2),
+        "quality": np.round(quality * 100, 2),
+        "oee_score": np.round(oee * 100, 2),
+    }, index=cycles.index)
+
+
+def _to_param(values: np.ndarray) -> list:
+    """float8[] для asyncpg: NaN -> NULL"""
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+@dataclass
+class OEERunResult:
+    """Итоги пересчёта OEE"""
+    cycles: int = 0
+    chunks: int = 0
+    duration_seconds: float = 0.0
+
+    @property
+    def cycles_per_second(self) -> Optional[float]:
+        if not self.duration_seconds:
+            return None
+        return self.cycles / self.duration_seconds
+
+
+async def run_oee(
+    factory_id: Optional[UUID] = None,
+    only_missing: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> OEERunResult:
+    """
+    Пересчитать OEE завершённых циклов порциями, каждая порция - отдельная транзакция
+
+    only_missing=False пересчитывает и циклы, у которых OEE уже заполнен
+    """
+    filters = []
+    params = {"limit": chunk_size}
+    if factory_id:
+        filters.append("AND factory_id = :factory_id")
+        params["factory_id"] = factory_id
+    if only_missing:
+        filters.append("AND oee_score IS NULL")
+    select_cycles = text(SELECT_CYCLES_SQL.format(filters="\n  ".join(filters)))
+
+    result = OEERunResult()
+    started = time.perf_counter()
+    after_start, after_id = datetime.min.replace(tzinfo=timezone.utc), UUID(int=0)
+    while True:
+        async with engine.begin() as conn:
+            rows = (await conn.execute(select_cycles, {**params, "after_start": after_start, "after_id": after_id})).all()
+            if not rows:
+                break
+            cycles = pd.DataFrame.from_records(rows, columns=CYCLE_COLUMNS)
+
+            equipment_ids = [UUID(e) for e in cycles["equipment_id"].dropna().unique()]
+            maintenance = pd.DataFrame(columns=MAINTENANCE_COLUMNS)
+            if equipment_ids:
+                maintenance_rows = (await conn.execute(text(SELECT_MAINTENANCE_SQL), {
+                    "equipment_ids": equipment_ids,
+                    "min_start": float(cycles["start_ts"].min()),
+                    "max_end": float(cycles["end_ts"].max()),
+                })).all()
+                maintenance = pd.DataFrame.from_records(maintenance_rows, columns=MAINTENANCE_COLUMNS)
+
+            oee = compute_oee(cycles, maintenance)
+            await conn.execute(text(BULK_UPDATE_SQL), {
+                "ids": list(cycles["id"]),
+                "availability": _to_param(oee["availability"].to_numpy()),
+                "performance": _to_param(oee["performance"].to_numpy()),
+                "quality": _to_param(oee["quality"].to_numpy()),
+                "oee_score": _to_param(oee["oee_score"].to_numpy()),
+            })
+
+        result.cycles += len(cycles)
+        result.chunks += 1
+        after_start, after_id = rows[-1].start_time, rows[-1].id
+        if len(rows) < chunk_size:
+            break
+
+    result.duration_seconds = time.perf_counter() - started
+    if result.cycles:
+        logger.info(
+            f"OEE пересчитан для {result.cycles} циклов за {result.duration_seconds:.2f} с "
+            f"({result.cycles_per_second:.0f} циклов/с)"
+        )
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(run_oee(only_missing="--all" not in sys.argv))
@@ -0,0 +1,301 @@
+"""
+Генерация отчётов по заданиям из очереди
+
+POST /reports/generate создаёт запись generated_reports в статусе queued и
+ставит задание в очередь Celery; воркер (app/worker.py) вызывает
+run_report_job: данные отчёта агрегируются в SQL, файл пишется в
+REPORTS_DIR, в запись сохраняются размер файла, число строк и длительность.
+API-процессы отчёты не рендерят; пропускная способность растёт с числом
+процессов воркера (--concurrency) и числом воркеров.
+
+Плановые отчёты (report_scheduler) приходят пачкой run_report_batch: отчёты
+одного типа и периода для всех заводов шаблона строятся из одного запроса.
+"""
+import os
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import select, text, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.factory import Factory
+from app.models.integrations import GeneratedReport
+from app.utils.report_writers import FORMAT_EXTENSIONS, write_csv, write_excel, write_pdf
+
+REPORT_FORMATS = tuple(FORMAT_EXTENSIONS)
+
+
+@dataclass(frozen=True)
+class ReportDefinition:
+    """
+    Отчёт: заголовок, колонки (ключ, подпись) и запрос с :factory_ids, :start, :end
+
+    Первая колонка запроса - factory_id (в файл не попадает), строки
+    отсортированы по ней: один проход по данным строит отчёты всех заводов
+    """
+    title: str
+    columns: Tuple[Tuple[str, str], ...]
+    sql: str
+
+
+# Циклы и обслуживание за период [start, end) по оборудованию заводов
+REPORTS: Dict[str, ReportDefinition] = {
+    "oee": ReportDefinition(
+        "OEE оборудования по дням",
+        (("day", "Дата"), ("equipment", "Оборудование"), ("cycles", "Циклов"), ("oee", "OEE, %"),
+         ("availability", "Доступность, %"), ("performance", "Производительность, %"), ("quality", "Качество, %")),
+        """
+        SELECT c.factory_id, c.start_time::date AS day, e.name AS equipment, count(*) AS cycles,
+               round(avg(c.oee_score), 2)::float8 AS oee,
+               round(avg(c.availability), 2)::float8 AS availability,
+               round(avg(c.performance), 2)::float8 AS performance,
+               round(avg(c.quality), 2)::float8 AS quality
+        FROM production_cycles c
+        JOIN equipment e ON e.id = c.equipment_id
+        WHERE c.factory_id = ANY(:factory_ids) AND c.start_time >= :start AND c.start_time < :end
+        GROUP BY 1, 2, e.name
+        ORDER BY 1, 2, 3
+        """,
+    ),
+    "downtime": ReportDefinition(
+        "Простои и обслуживание оборудования",
+        (("equipment", "Оборудование"), ("type", "Тип работ"), ("events", "Событий"),
+         ("downtime_minutes", "Простой, мин"), ("downtime_cost", "Потери от простоя"), ("cost", "Стоимость работ")),
+        """
+        SELECT e.factory_id, e.name AS equipment, m.type, count(*) AS events,
+               coalesce(sum(m.duration_minutes), 0) AS downtime_minutes,
+               coalesce(sum(m.downtime_cost), 0)::float8 AS downtime_cost,
+               coalesce(sum(m.cost), 0)::float8 AS cost
+        FROM maintenance_log m
+        JOIN equipment e ON e.id = m.equipment_id
+        WHERE e.factory_id = ANY(:factory_ids) AND m.start_time >= :start AND m.start_time < :end
+        GROUP BY e.factory_id, e.name, m.type
+        ORDER BY 1, downtime_minutes DESC, 2, 3
+        """,
+    ),
+    "energy": ReportDefinition(
+        "Энергопотребление по дням",
+        (("day", "Дата"), ("equipment", "Оборудование"), ("energy_kwh", "Энергия, кВт·ч"),
+         ("output", "Выпуск"), ("kwh_per_unit", "кВт·ч на единицу")),
+        """
+        SELECT c.factory_id, c.start_time::date AS day, e.name AS equipment,
+               coalesce(sum(c.energy_consumed_kwh), 0)::float8 AS energy_kwh,
+               coalesce(sum(c.actual_quantity), 0)::float8 AS output,
+               round(sum(c.energy_consumed_kwh) / nullif(sum(c.actual_quantity), 0), 4)::float8 AS kwh_per_unit
+        FROM production_cycles c
+        JOIN equipment e ON e.id = c.equipment_id
+        WHERE c.factory_id = ANY(:factory_ids) AND c.start_time >= :start AND c.start_time < :end
+        GROUP BY 1, 2, e.name
+        ORDER BY 1, 2, 3
+        """,
+    ),
+    "production": ReportDefinition(
+        "Выпуск продукции по дням",
+        (("day", "Дата"), ("product", "Продукт"), ("cycles", "Циклов"), ("planned", "План"),
+         ("actual", "Факт"), ("completion", "Выполнение, %"), ("unit", "Ед.")),
+        """
+        SELECT c.factory_id, c.start_time::date AS day, coalesce(c.product_name, '-') AS product, count(*) AS cycles,
+               coalesce(sum(c.planned_quantity), 0)::float8 AS planned,
+               coalesce(sum(c.actual_quantity), 0)::float8 AS actual,
+               round(sum(c.actual_quantity) * 100 / nullif(sum(c.planned_quantity), 0), 2)::float8 AS completion,
+               max(c.quantity_unit) AS unit
+        FROM production_cycles c
+        WHERE c.factory_id = ANY(:factory_ids) AND c.start_time >= :start AND c.start_time < :end
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        """,
+    ),
+    "quality": ReportDefinition(
+        "Качество продукции по оборудованию",
+        (("equipment", "Оборудование"), ("product", "Продукт"), ("actual", "Выпуск"), ("defects", "Брак"),
+         ("defect_rate", "Доля брака, %"), ("quality", "Качество, %")),
+        """
+        SELECT c.factory_id, e.name AS equipment, coalesce(c.product_name, '-') AS product,
+               coalesce(sum(c.actual_quantity), 0)::float8 AS actual,
+               coalesce(sum(c.defect_quantity), 0)::float8 AS defects,
+               round(sum(c.defect_quantity) * 100 / nullif(sum(c.actual_quantity), 0), 2)::float8 AS defect_rate,
+               round(avg(c.quality_percentage), 2)::float8 AS quality
+        FROM production_cycles c
+        JOIN equipment e ON e.id = c.equipment_id
+        WHERE c.factory_id = ANY(:factory_ids) AND c.start_time >= :start AND c.start_time < :end
+        GROUP BY c.factory_id, e.name, 3
+        ORDER BY 1, defect_rate DESC NULLS LAST, 2, 3
+        """,
+    ),
+}
+
+
+def report_path(report_id: UUID, report_format: str) -> str:
+    return os.path.join(settings.REPORTS_DIR, f"{report_id}.{FORMAT_EXTENSIONS[report_format]}")
+
+
+def render_report(
+    path: str, report_format: str, definition: ReportDefinition, subtitle: str, rows: List[tuple]
+) -> int:
+    """Записать строки отчёта в файл; возвращает число строк"""
+    headers = [label for _, label in definition.columns]
+    if report_format == "csv":
+        return write_csv(path, headers, rows)
+    if report_format == "excel":
+        return write_excel(path, definition.title, headers, rows)
+    return write_pdf(
+        path, definition.title, subtitle, headers, rows,
+        font_path=settings.REPORT_PDF_FONT, max_rows=settings.REPORT_PDF_MAX_ROWS,
+    )
+
+
+async def _set_status(report_id: UUID, **values):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(GeneratedReport).where(GeneratedReport.id == report_id).values(**values))
+        await db.commit()
+
+
+async def _set_many(report_ids: List[UUID], **values):
+    if not report_ids:
+        return
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(GeneratedReport).where(GeneratedReport.id.in_(report_ids)).values(**values))
+        await db.commit()
+
+
+def _period_params(report: GeneratedReport) -> dict:
+    return {
+        "start": datetime.combine(report.period_start, datetime.min.time(), tzinfo=timezone.utc),
+        "end": datetime.combine(report.period_end + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc),
+    }
+
+
+def _complete(report: GeneratedReport, factory_name: Optional[str], rows: List[tuple], query_ms: int) -> dict:
+    """Записать файл отчёта завода; возвращает значения для _set_status"""
+    started = time.perf_counter()
+    definition = REPORTS[report.report_type]
+    path = report_path(report.id, report.format)
+    subtitle = f"{factory_name or ''}, {report.period_start:%d.%m.%Y} - {report.period_end:%d.%m.%Y}"
+    os.makedirs(settings.REPORTS_DIR, exist_ok=True)
+    row_count = render_report(path, report.format, definition, subtitle, rows)
+    return {
+        "status": "completed",
+        "error": None,
+        "file_url": f"{settings.API_V1_STR}/reports/generated/{report.id}/file",
+        "file_size_bytes": os.path.getsize(path),
+        "row_count": row_count,
+        # Общий проход по данным группы и запись своего файла
+        "duration_ms": query_ms + int((time.perf_counter() - started) * 1000),
+        "completed_at": datetime.now(timezone.utc),
+    }
+
+
+async def _finish(report: GeneratedReport, factory_name: Optional[str], rows: List[tuple], query_ms: int) -> str:
+    try:
+        values = _complete(report, factory_name, rows, query_ms)
+    except Exception as e:
+        logger.exception(f"Ошибка генерации отчёта {report.id}")
+        await _set_status(report.id, status="failed", error=str(e)[:1000], completed_at=datetime.now(timezone.utc))
+        return "failed"
+    await _set_status(report.id, **values)
+    return "completed"
+
+
+async def _run_group(db, reports: List[GeneratedReport], factory_names: Dict[UUID, str]) -> Dict[str, int]:
+    """Отчёты одного типа и периода: один запрос по всем заводам, файл на каждый завод"""
+    first = reports[0]
+    by_factory: Dict[UUID, List[GeneratedReport]] = {}
+    for report in reports:
+        by_factory.setdefault(report.factory_id, []).append(report)
+    counts = {"completed": 0, "failed": 0}
+    started = time.perf_counter()
+
+    async def finish_factory(factory_id: UUID, rows: List[tuple]):
+        query_ms = int((time.perf_counter() - started) * 1000)
+        for report in by_factory.pop(factory_id, ()):
+            counts[await _finish(report, factory_names.get(factory_id), rows, query_ms)] += 1
+
+    try:
+        result = await db.stream(
+            text(REPORTS[first.report_type].sql), {"factory_ids": list(by_factory), **_period_params(first)}
+        )
+        # Строки упорядочены по factory_id: отчёт завода пишется, как только его строки закончились
+        current, rows = None, []
+        async for row in result:
+            if row[0] != current:
+                if current is not None:
+                    await finish_factory(current, rows)
+                current, rows = row[0], []
+            rows.append(tuple(row)[1:])
+        if current is not None:
+            await finish_factory(current, rows)
+    except Exception as e:
+        await db.rollback()
+        logger.exception(f"Ошибка выборки отчёта {first.report_type} за {first.period_start} - {first.period_end}")
+        failed = [report.id for group in by_factory.values() for report in group]
+        await _set_many(failed, status="failed", error=str(e)[:1000], completed_at=datetime.now(timezone.utc))
+        counts["failed"] += len(failed)
+        return counts
+
+    # Заводы без данных за период получают пустой отчёт
+    for factory_id in list(by_factory):
+        await finish_factory(factory_id, [])
+    return counts
+
+
+async def run_report_batch(report_ids: List[UUID]) -> Dict[str, int]:
+    """
+    Сгенерировать отчёты generated_reports пачкой
+
+    Отчёты группируются по (тип, период); на группу - один запрос по всем
+    её заводам, так что шаблон на 300 заводов читает данные один раз, а не
+    300. Завершённые отчёты пропускаются. Возвращает число отчётов по
+    итоговым статусам
+    """
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    async with AsyncSessionLocal() as db:
+        reports = (await db.scalars(select(GeneratedReport).where(GeneratedReport.id.in_(report_ids)))).all()
+        counts["skipped"] = len(report_ids) - len(reports)
+        groups: Dict[tuple, List[GeneratedReport]] = {}
+        for report in reports:
+            if report.status == "completed":
+                counts["skipped"] += 1
+                continue
+            if report.report_type not in REPORTS:
+                await _set_status(report.id, status="failed", error=f"Неизвестный тип отчёта: {report.report_type}")
+                counts["failed"] += 1
+                continue
+            groups.setdefault((report.report_type, report.period_start, report.period_end), []).append(report)
+        if not groups:
+            return counts
+
+        pending = [report.id for group in groups.values() for report in group]
+        await _set_many(pending, status="running")
+        factory_ids = {report.factory_id for group in groups.values() for report in group}
+        factory_names = dict((await db.execute(select(Factory.id, Factory.name).where(Factory.id.in_(factory_ids)))).all())
+        await db.commit()
+
+        for group in groups.values():
+            for status, count in (await _run_group(db, group, factory_names)).items():
+                counts[status] += count
+
+    logger.info(f"Отчёты: {len(report_ids)} в пачке, {counts}")
+    return counts
+
+
+async def run_report_job(report_id: UUID) -> Optional[str]:
+    """
+    Сгенерировать отчёт по записи generated_reports
+
+    Возвращает итоговый статус (None, если записи нет). Повторный запуск
+    завершённого задания ничего не делает
+    """
+    await run_report_batch([report_id])
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(GeneratedReport.status).where(GeneratedReport.id == report_id))
+
+
+def default_period(today: Optional[date] = None) -> Tuple[date, date]:
+    """Период по умолчанию: последние 30 дней, включая сегодня"""
+    today = today or datetime.now(timezone.utc).date()
+    return today - timedelta(days=29), today
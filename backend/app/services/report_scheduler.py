@@ -0,0 +1,163 @@
+"""
+Отчёты по расписанию шаблонов (ReportTemplate.schedule)
+
+Для шаблонов с расписанием daily, weekly или monthly по завершении периода
+(вчера, прошлая неделя, прошлый месяц) создаются записи generated_reports
+со scheduled = true - по одной на завод шаблона - и ставятся в очередь
+Celery пачками: на пачку одно задание reports.generate_batch и один проход
+по данным. Заводы шаблона - filters.factory_ids; иначе завод автора
+закрытого шаблона; иначе все активные заводы.
+
+Задача работает на всех репликах API: создаёт записи только тот процесс,
+что взял advisory lock, а уникальный индекс (шаблон, завод, период) не
+даёт создать плановый отчёт дважды. Записи, оставшиеся в queued дольше
+REPORT_SCHEDULE_REQUEUE_MINUTES (процесс остановился между commit и
+постановкой в очередь, сообщение потеряно), ставятся в очередь повторно.
+"""
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import select, text
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.models.integrations import ReportTemplate
+from app.models.user import User
+from app.services.report_jobs import REPORT_FORMATS, REPORTS
+from app.worker import generate_report_batch
+
+# Ключ pg_advisory_xact_lock для планировщика отчётов (72_001 - пересчёт KPI)
+SCHEDULE_LOCK_KEY = 72_002
+
+SCHEDULES = ("daily", "weekly", "monthly")
+
+# Плановые отчёты шаблона за период; уже созданные пропускаются
+MATERIALIZE_SQL = """
+INSERT INTO generated_reports (
+    id, template_id, factory_id, period_start, period_end, report_type, format, status, scheduled
+)
+SELECT gen_random_uuid(), :template_id, f.id, :period_start, :period_end, :report_type, :format, 'queued', true
+FROM factories f
+WHERE (CAST(:factory_ids AS uuid[]) IS NULL AND f.status = 'active') OR f.id = ANY(CAST(:factory_ids AS uuid[]))
+ON CONFLICT (template_id, factory_id, period_start, period_end) WHERE scheduled DO NOTHING
+RETURNING id
+"""
+
+# Зависшие плановые отчёты; generated_at сдвигается, чтобы повтор был не чаще раза в интервал
+REQUEUE_SQL = """
+UPDATE generated_reports SET generated_at = now()
+WHERE scheduled AND status = 'queued' AND generated_at < now() - make_interval(mins => :minutes)
+RETURNING template_id, id
+"""
+
+
+def last_period(schedule: str, today: date) -> Tuple[date, date]:
+    """Последний завершённый период расписания: [начало, конец] включительно"""
+    if schedule == "daily":
+        day = today - timedelta(days=1)
+        return day, day
+    if schedule == "weekly":
+        monday = today - timedelta(days=today.weekday())
+        return monday - timedelta(days=7), monday - timedelta(days=1)
+    month_start = today.replace(day=1)
+    previous_end = month_start - timedelta(days=1)
+    return previous_end.replace(day=1), previous_end
+
+
+def _template_factories(template: ReportTemplate, creator_factory_id: Optional[UUID]) -> Optional[List[UUID]]:
+    """Заводы шаблона; None - все активные заводы"""
+    factory_ids = (template.filters or {}).get("factory_ids")
+    if factory_ids:
+        return [UUID(str(factory_id)) for factory_id in factory_ids]
+    if creator_factory_id and not template.is_public:
+        return [creator_factory_id]
+    return None
+
+
+async def materialize_due_reports(today: Optional[date] = None) -> Optional[Dict[UUID, List[UUID]]]:
+    """
+    Создать записи плановых отчётов за завершённые периоды
+
+    Возвращает id отчётов для постановки в очередь по шаблонам - новые и
+    зависшие в queued (None - планировщик уже работает в другом процессе)
+    """
+    today = today or datetime.now(timezone.utc).date()
+    created: Dict[UUID, List[UUID]] = {}
+    async with AsyncSessionLocal() as db:
+        locked = await db.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": SCHEDULE_LOCK_KEY})
+        if not locked:
+            return None
+
+        templates = (await db.execute(
+            select(ReportTemplate, User.factory_id)
+            .outerjoin(User, ReportTemplate.created_by == User.id)
+            .where(ReportTemplate.schedule.in_(SCHEDULES))
+        )).all()
+        for template, creator_factory_id in templates:
+            if template.report_type not in REPORTS:
+                continue
+            period_start, period_end = last_period(template.schedule, today)
+            report_format = template.format if template.format in REPORT_FORMATS else "pdf"
+            ids = (await db.execute(text(MATERIALIZE_SQL), {
+                "template_id": template.id,
+                "factory_ids": _template_factories(template, creator_factory_id),
+                "period_start": period_start,
+                "period_end": period_end,
+                "report_type": template.report_type,
+                "format": report_format,
+            })).scalars().all()
+            if ids:
+                created[template.id] = list(ids)
+
+        stale = (await db.execute(
+            text(REQUEUE_SQL), {"minutes": settings.REPORT_SCHEDULE_REQUEUE_MINUTES}
+        )).all()
+        for template_id, report_id in stale:
+            created.setdefault(template_id, []).append(report_id)
+        if stale:
+            logger.warning(f"Плановые отчёты, не взятые в работу: {len(stale)}, повторная постановка в очередь")
+        await db.commit()
+    return created
+
+
+async def _enqueue(template_id: UUID, report_ids: List[UUID]):
+    """Поставить отчёты шаблона в очередь пачками по REPORT_SCHEDULE_BATCH_SIZE"""
+    size = settings.REPORT_SCHEDULE_BATCH_SIZE
+    for i in range(0, len(report_ids), size):
+        batch = report_ids[i:i + size]
+        try:
+            await asyncio.to_thread(generate_report_batch.apply_async, ([str(report_id) for report_id in batch],), retry=False)
+        except Exception as e:
+            # Не поставленные в очередь записи удаляются: следующий запуск создаст их заново
+            logger.error(f"Очередь отчётов недоступна, плановые отчёты шаблона {template_id} отложены: {e}")
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text("DELETE FROM generated_reports WHERE id = ANY(:ids)"), {"ids": report_ids[i:]}
+                )
+            return
+    logger.info(f"Плановые отчёты шаблона {template_id}: {len(report_ids)} в очереди")
+
+
+async def run_report_schedule() -> Optional[Dict[UUID, List[UUID]]]:
+    """Один запуск: создать плановые отчёты и поставить их в очередь"""
+    created = await materialize_due_reports()
+    for template_id, report_ids in (created or {}).items():
+        await _enqueue(template_id, report_ids)
+    return created
+
+
+async def run_report_schedule_loop():
+    """Фоновый цикл планировщика отчётов"""
+    while True:
+        try:
+            await run_report_schedule()
+        except Exception as e:
+            logger.error(f"Ошибка планировщика отчётов: {e}")
+        await asyncio.sleep(settings.REPORT_SCHEDULE_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_report_schedule())
@@ -0,0 +1,180 @@
+"""
+Запись табличных отчётов в CSV, Excel и PDF
+
+Строки принимаются итератором и пишутся в файл по мере поступления:
+CSV и Excel (XlsxWriter в режиме constant_memory) не держат таблицу в
+памяти целиком. PDF собирается reportlab из таблицы, поэтому число строк
+в нём ограничено max_rows.
+"""
+import csv
+import io
+import os
+from datetime import date, datetime
+from typing import Any, Iterable, List, Optional, Sequence
+
+import xlsxwriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+FORMAT_EXTENSIONS = {"csv": "csv", "excel": "xlsx", "pdf": "pdf"}
+FORMAT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "excel": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+# Предел строк на листе xlsx; дальше строки переносятся на следующий лист
+XLSX_MAX_ROWS = 1048576
+
+# Встроенные шрифты PDF не содержат кириллицы
+PDF_FONT_NAME = "ReportFont"
+PDF_FALLBACK_FONT = "Helvetica"
+
+
+def write_csv(path: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+    """CSV с BOM (Excel иначе не распознаёт UTF-8); возвращает число строк"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def csv_chunk(rows: Iterable[Sequence[Any]]) -> bytes:
+    """Строки в байты CSV (тот же диалект, что у write_csv) - для потоковой выдачи"""
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=";").writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def csv_header(headers: Sequence[str]) -> bytes:
+    return "\ufeff".encode("utf-8") + csv_chunk([headers])
+
+
+class ExcelStreamWriter:
+    """
+    Запись xlsx порциями строк
+
+    В режиме constant_memory XlsxWriter сбрасывает каждую строку во
+    временный файл, так что память не растёт с числом строк. После
+    XLSX_MAX_ROWS строк начинается новый лист с той же шапкой
+    """
+
+    def __init__(self, path: str, title: str, headers: Sequence[str]):
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "remove_timezone": True})
+        self.title = title[:28]
+        self.headers = list(headers)
+        self.header_format = self.workbook.add_format({"bold": True, "bg_color": "#DDDDDD"})
+        self.date_format = self.workbook.add_format({"num_format": "yyyy-mm-dd"})
+        self.datetime_format = self.workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        self.rows = 0
+        self.sheet = None
+        self.sheet_row = XLSX_MAX_ROWS
+
+    def _next_sheet(self):
+        number = len(self.workbook.worksheets()) + 1
+        self.sheet = self.workbook.add_worksheet(self.title if number == 1 else f"{self.title} {number}")
+        self.sheet.write_row(0, 0, self.headers, self.header_format)
+        self.sheet.freeze_panes(1, 0)
+        self.sheet_row = 1
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]):
+        for row in rows:
+            if self.sheet_row >= XLSX_MAX_ROWS:
+                self._next_sheet()
+            for col, value in enumerate(row):
+                if isinstance(value, datetime):
+                    self.sheet.write_datetime(self.sheet_row, col, value, self.datetime_format)
+                elif isinstance(value, date):
+                    self.sheet.write_datetime(
+                        self.sheet_row, col, datetime(value.year, value.month, value.day), self.date_format
+                    )
+                elif value is not None:
+                    self.sheet.write(self.sheet_row, col, value)
+            self.sheet_row += 1
+            self.rows += 1
+
+    def close(self) -> int:
+        """Собрать файл; возвращает число строк"""
+        if self.sheet is None:
+            self._next_sheet()
+        self.workbook.close()
+        return self.rows
+
+
+def write_excel(path: str, title: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+    """Лист xlsx, строки сбрасываются на диск по одной; возвращает число строк"""
+    writer = ExcelStreamWriter(path, title, headers)
+    try:
+        writer.write_rows(rows)
+    finally:
+        count = writer.close()
+    return count
+
+
+def _pdf_font(font_path: Optional[str]) -> str:
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if font_path and os.path.exists(font_path):
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+        return PDF_FONT_NAME
+    return PDF_FALLBACK_FONT
+
+
+def _pdf_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def write_pdf(
+    path: str,
+    title: str,
+    subtitle: str,
+    headers: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    font_path: Optional[str] = None,
+    max_rows: int = 5000,
+) -> int:
+    """Таблица на страницах A4 (альбомная) с повтором шапки; возвращает число строк"""
+    font = _pdf_font(font_path)
+    styles = getSampleStyleSheet()
+    for style in (styles["Title"], styles["Normal"]):
+        style.fontName = font
+
+    data: List[List[str]] = [list(headers)]
+    truncated = False
+    for row in rows:
+        if len(data) > max_rows:
+            truncated = True
+            break
+        data.append([_pdf_cell(value) for value in row])
+
+    table = LongTable(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, -1), font),
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+    ]))
+    story = [Paragraph(title, styles["Title"]), Paragraph(subtitle, styles["Normal"]), Spacer(1, 0.4 * cm), table]
+    if truncated:
+        story += [Spacer(1, 0.4 * cm), Paragraph(f"Показаны первые {max_rows} строк, полные данные - в CSV или Excel", styles["Normal"])]
+
+    doc = SimpleDocTemplate(
+        path, pagesize=landscape(A4), title=title,
+        leftMargin=1.5 * cm, rightMargin=1.5 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm,
+    )
+    doc.build(story)
+    return len(data) - 1
@@ -0,0 +1,68 @@
+"""
+Воркер Celery для фоновых заданий (генерация отчётов)
+
+Запуск из каталога backend:
+    celery -A app.worker worker -Q reports --concurrency 4
+
+Задания выполняются в процессах воркера (prefork): каждый процесс держит
+свой цикл событий и пул соединений с БД. Масштабирование - параметром
+--concurrency и запуском воркеров на других машинах с тем же брокером.
+"""
+import asyncio
+from typing import List
+from uuid import UUID
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+from app.core.config import settings
+from app.core.database import engine
+from app.services.report_jobs import run_report_batch, run_report_job
+
+REPORTS_QUEUE = "reports"
+
+celery_app = Celery(
+    "factory_analytics",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+)
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    task_ignore_result=True,
+    # Задание подтверждается после выполнения: при падении воркера оно вернётся в очередь
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Отчёты долгие: процесс не берёт задания впрок, пока занят
+    worker_prefetch_multiplier=1,
+    task_routes={"reports.*": {"queue": REPORTS_QUEUE}},
+)
+
+# Цикл событий процесса: соединения asyncpg привязаны к циклу, в котором созданы
+_loop = None
+
+
+def run_async(coro):
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+@worker_process_init.connect
+def _reset_engine(**kwargs):
+    # Соединения, унаследованные от родителя при fork, не переиспользуются
+    engine.sync_engine.dispose(close=False)
+
+
+@celery_app.task(name="reports.generate", time_limit=settings.REPORT_JOB_TIME_LIMIT_SECONDS)
+def generate_report(report_id: str):
+    """Сгенерировать отчёт generated_reports.id"""
+    return run_async(run_report_job(UUID(report_id)))
+
+
+@celery_app.task(name="reports.generate_batch", time_limit=settings.REPORT_BATCH_TIME_LIMIT_SECONDS)
+def generate_report_batch(report_ids: List[str]):
+    """Сгенерировать пачку отчётов одного шаблона и периода (один проход по данным)"""
+    return run_async(run_report_batch([UUID(report_id) for report_id in report_ids]))
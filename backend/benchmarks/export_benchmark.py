@@ -0,0 +1,154 @@
+"""
+Бенчмарк выгрузки метрик: потоковый CSV и xlsx (constant_memory) против
+сборки CSV в памяти
+
+Создаётся временное оборудование с N показаниями за последние дни (после
+прогона удаляется вместе с показаниями). Каждый способ выполняется в
+отдельном процессе через обработчик GET /metrics/export; печатаются строки
+в секунду, размер файла и прирост пикового RSS процесса. Нужна БД хотя бы
+с одним заводом и метрикой. Запуск из каталога backend:
+    python -m benchmarks.export_benchmark --rows 500000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import multiprocessing
+import resource
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy import select, text
+
+from app.api.v1.endpoints.metrics import EXPORT_COLUMNS, export_metrics_data
+from app.core.database import AsyncSessionLocal, engine
+from app.models.equipment import Equipment
+from app.models.factory import Factory
+from app.models.metrics import MetricsCatalog, MetricsData
+from app.services.metrics_partitions import partition_manager
+
+ADMIN = SimpleNamespace(role="admin", factory_id=None)
+
+SEED_SQL = """
+INSERT INTO metrics_data (equipment_id, metric_id, timestamp, value, is_anomaly, is_critical)
+SELECT :equipment_id, (CAST(:metric_ids AS uuid[]))[1 + g % :metric_count],
+       CAST(:start AS timestamptz) + g * CAST(:step AS interval), 50 + (g % 1000) / 10.0, g % 500 = 0, false
+FROM generate_series(1, :rows) AS g
+"""
+
+
+def _peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def _stream_case(equipment_id, export_format: str) -> dict:
+    size = 0
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        response = await export_metrics_data(
+            equipment_id=equipment_id, factory_id=None, metric_id=None, start_time=None, end_time=None,
+            format=export_format, current_user=ADMIN, db=db,
+        )
+        async for chunk in response.body_iterator:
+            size += len(chunk)
+        elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "bytes": size}
+
+
+async def _in_memory_case(equipment_id, export_format: str) -> dict:
+    # Как без потоковой выдачи: все строки в списке, весь файл в одной строке
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        rows = (await db.execute(
+            select(*EXPORT_COLUMNS)
+            .join(Equipment, MetricsData.equipment_id == Equipment.id)
+            .join(MetricsCatalog, MetricsData.metric_id == MetricsCatalog.id)
+            .where(MetricsData.equipment_id == equipment_id)
+            .order_by(MetricsData.timestamp)
+        )).all()
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=";").writerows(rows)
+        body = buffer.getvalue().encode("utf-8")
+        elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "bytes": len(body)}
+
+
+CASES = {
+    "CSV потоком": (_stream_case, "csv"),
+    "xlsx constant_memory": (_stream_case, "excel"),
+    "CSV в памяти": (_in_memory_case, "csv"),
+}
+
+
+def _run_case(name: str, equipment_id, queue):
+    case, export_format = CASES[name]
+    baseline = _peak_rss_kb()
+    result = asyncio.run(case(equipment_id, export_format))
+    result["rss_growth_mb"] = (_peak_rss_kb() - baseline) / 1024
+    queue.put(result)
+
+
+async def _seed(rows: int, days: int):
+    now = datetime.now(timezone.utc)
+    start = now - timedelta(days=days)
+    async with engine.begin() as conn:
+        factory_id = await conn.scalar(select(Factory.id).limit(1))
+        metric_ids = (await conn.execute(text("SELECT id FROM metrics_catalog ORDER BY code LIMIT 4"))).scalars().all()
+        if factory_id is None or not metric_ids:
+            return None
+        if await partition_manager.is_partitioned(conn):
+            await partition_manager.ensure_partitions(conn, start, now)
+        equipment_id = uuid.uuid4()
+        await conn.execute(
+            text("INSERT INTO equipment (id, factory_id, name, status) VALUES (:id, :factory_id, :name, 'operational')"),
+            {"id": equipment_id, "factory_id": factory_id, "name": "Бенчмарк выгрузки"},
+        )
+        await conn.execute(text(SEED_SQL), {
+            "equipment_id": equipment_id, "metric_ids": list(metric_ids), "metric_count": len(metric_ids), "rows": rows,
+            "start": start, "step": timedelta(seconds=days * 86400 / rows),
+        })
+    # Соединения пула привязаны к циклу событий этого asyncio.run
+    await engine.dispose()
+    return equipment_id
+
+
+async def _cleanup(equipment_id):
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM metrics_data WHERE equipment_id = :id"), {"id": equipment_id})
+        await conn.execute(text("DELETE FROM equipment WHERE id = :id"), {"id": equipment_id})
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=20, help="за сколько последних дней создать показания")
+    args = parser.parse_args()
+
+    equipment_id = asyncio.run(_seed(args.rows, args.days))
+    if equipment_id is None:
+        print("Нет завода или метрик: заполните БД")
+        return
+    try:
+        # Отдельный процесс на способ: пиковый RSS не переходит между прогонами
+        context = multiprocessing.get_context("spawn")
+        print(f"Строк: {args.rows} за {args.days} дн.")
+        print(f"{'способ':<22} {'строк/с':>10} {'секунд':>8} {'размер МБ':>10} {'прирост RSS МБ':>15}")
+        for name in CASES:
+            queue = context.Queue()
+            process = context.Process(target=_run_case, args=(name, equipment_id, queue))
+            process.start()
+            r = queue.get()
+            process.join()
+            print(
+                f"{name:<22} {args.rows / r['seconds']:>10.0f} {r['seconds']:>8.2f} "
+                f"{r['bytes'] / 2**20:>10.1f} {r['rss_growth_mb']:>15.1f}"
+            )
+    finally:
+        asyncio.run(_cleanup(equipment_id))
+
+
+if __name__ == "__main__":
+    main()
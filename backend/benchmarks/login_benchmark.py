@@ -0,0 +1,107 @@
+"""
+Бенчмарк входа: пропускная способность /auth/login и задержка других
+запросов того же воркера во время «шторма» входов
+
+Приложение запускается в процессе (ASGI, один event loop - как один воркер
+uvicorn), нужна заполненная БД. Запуск из каталога backend:
+    python -m benchmarks.login_benchmark --logins 200 --concurrency 50
+    python -m benchmarks.login_benchmark --inline   # bcrypt прямо в event loop, для сравнения
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core import security
+from app.main import app
+
+EMAIL = "admin@factory.kz"
+PASSWORD = "admin123"
+
+
+async def _login(client: httpx.AsyncClient) -> int:
+    response = await client.post("/api/v1/auth/login", data={"username": EMAIL, "password": PASSWORD})
+    return response.status_code
+
+
+async def _probe(client: httpx.AsyncClient, token: str, stop: asyncio.Event, latencies: list):
+    """Лёгкий запрос авторизованного пользователя в цикле"""
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/api/v1/users/me", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+
+def _summary(latencies: list) -> str:
+    if not latencies:
+        return "нет данных"
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) > 1 else ordered[0]
+    return (
+        f"n={len(ordered)}, p50={statistics.median(ordered):.1f} мс, "
+        f"p95={p95:.1f} мс, max={ordered[-1]:.1f} мс"
+    )
+
+
+async def run(logins: int, concurrency: int, baseline_seconds: float):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/v1/auth/login", data={"username": EMAIL, "password": PASSWORD})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+        # Задержка без нагрузки
+        baseline: list = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, token, stop, baseline))
+        await asyncio.sleep(baseline_seconds)
+        stop.set()
+        await probe
+
+        # Задержка во время шторма входов
+        during: list = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, token, stop, during))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited_login():
+            async with semaphore:
+                return await _login(client)
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*[limited_login() for _ in range(logins)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    ok = sum(1 for s in statuses if s == 200)
+    busy = sum(1 for s in statuses if s == 503)
+    print(f"Входов: {logins} (успешно {ok}, 503: {busy}), параллельно {concurrency}")
+    print(f"Пропускная способность: {ok / elapsed:.1f} входов/с за {elapsed:.2f} с")
+    print(f"/users/me без нагрузки:   {_summary(baseline)}")
+    print(f"/users/me во время входов: {_summary(during)}")
+    print(f"Пул хеширования: {security.password_hasher.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    parser.add_argument("--inline", action="store_true", help="выполнять bcrypt в event loop (как до пула)")
+    args = parser.parse_args()
+
+    if args.inline:
+        async def run_inline(func, *func_args):
+            return func(*func_args)
+        security.password_hasher.run = run_inline
+
+    asyncio.run(run(args.logins, args.concurrency, args.baseline_seconds))
+
+
+if __name__ == "__main__":
+    main()
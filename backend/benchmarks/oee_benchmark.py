@@ -0,0 +1,114 @@
+"""
+Бенчмарк расчёта OEE: векторизованный compute_oee против построчного Decimal
+
+Запуск из каталога backend:
+    python -m benchmarks.oee_benchmark --cycles 1000000
+"""
+import argparse
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from app.services.oee_engine import compute_oee
+
+
+def make_dataset(cycles: int, equipment: int, maintenance_per_equipment: int, seed: int = 42):
+    """Синтетические циклы по 4 часа и окна обслуживания по 1-3 часа"""
+    rng = np.random.default_rng(seed)
+    equipment_ids = np.array([f"eq-{i}" for i in range(equipment)])
+    horizon = 365 * 24 * 3600.0
+
+    # Циклы по времени начала, как их читает run_oee
+    start = np.sort(rng.uniform(0, horizon, cycles))
+    planned = rng.uniform(900, 1100, cycles)
+    actual = planned * rng.uniform(0.7, 1.0, cycles)
+    cycles_df = pd.DataFrame({
+        "id": np.arange(cycles),
+        "equipment_id": equipment_ids[rng.integers(0, equipment, cycles)],
+        "start_ts": start,
+        "end_ts": start + 4 * 3600,
+        "planned_quantity": planned,
+        "actual_quantity": actual,
+        "defect_quantity": actual * rng.uniform(0, 0.05, cycles),
+    })
+
+    m = equipment * maintenance_per_equipment
+    m_start = rng.uniform(0, horizon, m)
+    maintenance_df = pd.DataFrame({
+        "equipment_id": np.repeat(equipment_ids, maintenance_per_equipment),
+        "m_start_ts": m_start,
+        "m_end_ts": m_start + rng.uniform(3600, 3 * 3600, m),
+    })
+    return cycles_df, maintenance_df
+
+
+def rowwise_oee(cycles: pd.DataFrame, maintenance: pd.DataFrame) -> list:
+    """Эталон: по одному циклу на Decimal, как если бы считать через ORM-объекты"""
+    windows = {}
+    for row in maintenance.sort_values("m_start_ts").itertuples(index=False):
+        merged = windows.setdefault(row.equipment_id, [])
+        m_start, m_end = Decimal(row.m_start_ts), Decimal(row.m_end_ts)
+        # Перекрывающиеся окна объединяются, чтобы простой не считался дважды
+        if merged and m_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], m_end))
+        else:
+            merged.append((m_start, m_end))
+
+    results = []
+    for row in cycles.itertuples(index=False):
+        start, end = Decimal(row.start_ts), Decimal(row.end_ts)
+        planned_s = end - start
+        downtime = sum(
+            (max(min(end, m_end) - max(start, m_start), Decimal(0)) for m_start, m_end in windows.get(row.equipment_id, [])),
+            Decimal(0),
+        )
+        run_s = min(max(planned_s - downtime, Decimal(0)), planned_s)
+        availability = run_s / planned_s
+        expected = Decimal(row.planned_quantity) * availability
+        actual = Decimal(row.actual_quantity)
+        performance = min(actual / expected, Decimal(1)) if expected > 0 else None
+        quality = (actual - Decimal(row.defect_quantity)) / actual if actual > 0 else None
+        oee = availability * performance * quality if performance is not None and quality is not None else None
+        results.append(oee)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cycles", type=int, default=1_000_000)
+    parser.add_argument("--equipment", type=int, default=5000)
+    parser.add_argument("--maintenance", type=int, default=12, help="окон обслуживания на единицу оборудования")
+    parser.add_argument("--chunk", type=int, default=20000)
+    parser.add_argument("--rowwise-sample", type=int, default=20000, help="сколько циклов прогнать построчно")
+    args = parser.parse_args()
+
+    cycles, maintenance = make_dataset(args.cycles, args.equipment, args.maintenance)
+
+    started = time.perf_counter()
+    for offset in range(0, len(cycles), args.chunk):
+        chunk = cycles.iloc[offset:offset + args.chunk]
+        chunk_maintenance = maintenance[
+            maintenance["equipment_id"].isin(chunk["equipment_id"].unique())
+            & (maintenance["m_start_ts"] < chunk["end_ts"].max())
+            & (maintenance["m_end_ts"] > chunk["start_ts"].min())
+        ]
+        compute_oee(chunk, chunk_maintenance)
+    vectorized = time.perf_counter() - started
+
+    sample = cycles.iloc[:args.rowwise_sample]
+    started = time.perf_counter()
+    rowwise_oee(sample, maintenance[maintenance["equipment_id"].isin(sample["equipment_id"].unique())])
+    rowwise = time.perf_counter() - started
+
+    vectorized_rate = len(cycles) / vectorized
+    rowwise_rate = len(sample) / rowwise
+    print(f"Циклов: {len(cycles)}, оборудования: {args.equipment}, окон обслуживания: {len(maintenance)}")
+    print(f"Векторизованно (порции по {args.chunk}): {vectorized:.2f} с, {vectorized_rate:,.0f} циклов/с")
+    print(f"Построчно на Decimal ({len(sample)} циклов): {rowwise:.2f} с, {rowwise_rate:,.0f} циклов/с")
+    print(f"Ускорение: x{vectorized_rate / rowwise_rate:.0f}")
+
+
+if __name__ == "__main__":
+    main()
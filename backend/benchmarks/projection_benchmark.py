@@ -0,0 +1,159 @@
+"""
+Бенчмарк чтения списков: сущности ORM + jsonable_encoder против проекции
+колонок + orjson
+
+Во временной транзакции (откатывается в конце) создаётся N единиц
+оборудования с заполненными custom_fields и notes, затем список читается
+обоими способами. Для каждого печатаются время чтения и сериализации, пик
+памяти (tracemalloc, отдельный прогон) и число блоков памяти на строку,
+которые занимают прочитанные строки. Нужна БД хотя бы с одним заводом.
+Запуск из каталога backend:
+    python -m benchmarks.projection_benchmark --rows 20000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.v1.endpoints.equipment import EQUIPMENT_LIST_COLUMNS
+from app.api.v1.projection import rows_as_dicts
+from app.core.database import engine
+from app.models.equipment import Equipment
+from app.models.factory import Factory
+
+SERIAL_PREFIX = "BENCH-"
+
+SEED_SQL = """
+INSERT INTO equipment (id, factory_id, name, serial_number, status, health_score,
+                       workshop, line, manufacturer, model, custom_fields, notes)
+SELECT gen_random_uuid(), :factory_id, 'Оборудование ' || g, :prefix || g, 'operational',
+       50 + (g % 50) + 0.25, 'Цех ' || (g % 10), 'Линия ' || (g % 5), 'Siemens', 'PM-' || (g % 100),
+       jsonb_build_object('vendor_code', 'V' || g, 'tags', jsonb_build_array('a', 'b', 'c'),
+                          'limits', jsonb_build_object('min', 0, 'max', 100, 'unit', 'kW')),
+       repeat('Примечание к оборудованию. ', 20)
+FROM generate_series(1, :rows) AS g
+"""
+
+
+def _orm_items(entities) -> list:
+    return [
+        {
+            "id": str(e.id),
+            "name": e.name,
+            "factory_id": str(e.factory_id),
+            "status": e.status,
+            "health_score": float(e.health_score) if e.health_score else None,
+            "workshop": e.workshop,
+            "line": e.line,
+        }
+        for e in entities
+    ]
+
+
+def _default_json(items) -> bytes:
+    # Как JSONResponse FastAPI для dict без response_model
+    return json.dumps(jsonable_encoder({"items": items}), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# (чтение строк, строки -> элементы ответа, сериализация)
+METHODS = {
+    "ORM + jsonable_encoder": (
+        select(Equipment),
+        lambda result: result.scalars().all(),
+        _orm_items,
+        _default_json,
+    ),
+    "проекция + orjson": (
+        select(*EQUIPMENT_LIST_COLUMNS),
+        lambda result: result.all(),
+        rows_as_dicts,
+        lambda items: orjson.dumps({"items": items}),
+    ),
+}
+
+
+async def _measure(conn, method, rows: int, trace: bool) -> dict:
+    """
+    Один прогон. С trace=True считается память (время при этом искажено
+    tracemalloc), без него - только время
+    """
+    query, fetch, build, serialize = method
+    query = query.where(Equipment.serial_number.like(f"{SERIAL_PREFIX}%")).order_by(Equipment.name, Equipment.id)
+    # Новая сессия на прогон: identity map не переиспользуется
+    session = AsyncSession(bind=conn)
+    if trace:
+        tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    started = time.perf_counter()
+    fetched = fetch(await session.execute(query))
+    # Блоки памяти, которые держат прочитанные строки (объекты, состояние, значения)
+    blocks = sys.getallocatedblocks() - blocks_before
+    items = build(fetched)
+    built = time.perf_counter()
+    body = serialize(items)
+    finished = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    await session.close()
+    assert len(items) == rows
+    return {
+        "read_ms": (built - started) * 1000,
+        "serialize_ms": (finished - built) * 1000,
+        "peak_bytes_per_row": peak / rows,
+        "blocks_per_row": blocks / rows,
+        "body_bytes": len(body),
+    }
+
+
+async def run(rows: int, repeats: int):
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        factory_id = await conn.scalar(select(Factory.id).limit(1))
+        if factory_id is None:
+            print("Нет ни одного завода: заполните БД")
+            return
+        await conn.execute(text(SEED_SQL), {"factory_id": factory_id, "prefix": SERIAL_PREFIX, "rows": rows})
+
+        results = {}
+        for name, method in METHODS.items():
+            await _measure(conn, method, rows, trace=False)  # прогрев
+            timed = [await _measure(conn, method, rows, trace=False) for _ in range(repeats)]
+            traced = await _measure(conn, method, rows, trace=True)
+            results[name] = {key: statistics.median(run[key] for run in timed) for key in timed[0]}
+            results[name]["peak_bytes_per_row"] = traced["peak_bytes_per_row"]
+        await transaction.rollback()
+
+    print(f"Строк: {rows}, повторов: {repeats} (медиана)")
+    print(f"{'способ':<24} {'чтение мс':>10} {'JSON мс':>9} {'пик Б/стр':>10} {'блоков/стр':>11} {'тело Б':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<24} {r['read_ms']:>10.1f} {r['serialize_ms']:>9.1f} "
+            f"{r['peak_bytes_per_row']:>10.0f} {r['blocks_per_row']:>11.1f} {r['body_bytes']:>10.0f}"
+        )
+    orm, lean = results.values()
+    print(
+        f"Экономия на строку: {orm['blocks_per_row'] - lean['blocks_per_row']:.1f} блоков, "
+        f"{orm['peak_bytes_per_row'] - lean['peak_bytes_per_row']:.0f} Б пика; "
+        f"ускорение {(orm['read_ms'] + orm['serialize_ms']) / (lean['read_ms'] + lean['serialize_ms']):.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
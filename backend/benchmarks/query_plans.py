@@ -0,0 +1,200 @@
+"""
+Проверка планов запросов: EXPLAIN запросов эндпоинтов на заполненной БД
+
+Завершается с кодом 1, если на большой таблице в плане есть Seq Scan. На
+небольшой тестовой БД планировщик и так выбрал бы полный просмотр, поэтому
+он запрещается в транзакции (enable_seqscan = off): Seq Scan остаётся в
+плане только там, где подходящего индекса нет.
+
+Запуск из каталога backend (после alembic upgrade head и заполнения БД):
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --verbose   # печатать планы целиком
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import Select, desc, select
+
+from app.api.v1.endpoints.analytics import ANOMALIES_KEYSET, ANOMALY_LIST_COLUMNS
+from app.api.v1.endpoints.equipment import EQUIPMENT_KEYSET, EQUIPMENT_LIST_COLUMNS, equipment_filters
+from app.api.v1.endpoints.metrics import DATA_POINT_COLUMNS
+from app.api.v1.endpoints.production import (
+    CYCLE_LIST_COLUMNS, CYCLES_KEYSET, MAINTENANCE_KEYSET, MAINTENANCE_LIST_COLUMNS,
+)
+from app.api.v1.endpoints.reports import REPORT_LIST_COLUMNS, REPORTS_KEYSET
+from app.api.v1.pagination import paginate
+from app.core.database import engine
+from app.models.analytics import Anomaly, KPICalculation, Prediction, Recommendation
+from app.models.equipment import Equipment
+from app.models.integrations import GeneratedReport
+from app.models.metrics import MetricsCatalog, MetricsData
+from app.models.production import MaintenanceLog, ProductionCycle
+from app.services.dashboard_stats import build_stats_query
+from app.services.equipment_search import build_search_query
+from app.services.list_totals import count_query
+from app.services.metrics_aggregation import build_bucket_query
+from app.services.metrics_downsampling import build_series_query
+
+# Таблицы, на которых полный просмотр недопустим (секции metrics_data - по префиксу)
+LARGE_TABLES = {
+    "metrics_data", "production_cycles", "anomalies", "kpi_calculations",
+    "maintenance_log", "equipment", "predictions", "recommendations", "generated_reports",
+}
+
+LIMIT = 50
+
+
+def _cursor(keyset, key_value, item_id) -> str:
+    """Курсор «глубокой» страницы: проверяется и условие keyset"""
+    return keyset.encode(SimpleNamespace(**{keyset.key.key: key_value, keyset.id_column.key: item_id}))
+
+
+def build_cases(factory_id, equipment_id, metric_id, now: datetime) -> List[Tuple[str, Select]]:
+    """Запросы эндпоинтов в том виде, в каком их строят обработчики (колонки ответа, keyset)"""
+    week_ago = now - timedelta(days=7)
+    equipment_list = select(*EQUIPMENT_LIST_COLUMNS).where(
+        *equipment_filters(factory_id, None, "operational", None, None)
+    )
+    cycles = select(*CYCLE_LIST_COLUMNS)
+    maintenance = select(*MAINTENANCE_LIST_COLUMNS).join(Equipment, MaintenanceLog.equipment_id == Equipment.id)
+    anomalies = select(*ANOMALY_LIST_COLUMNS).join(Equipment, Anomaly.equipment_id == Equipment.id)
+    return [
+        ("equipment: список завода по статусу",
+         paginate(equipment_list, EQUIPMENT_KEYSET, None, 0, LIMIT)),
+        ("equipment: total=exact",
+         count_query(equipment_list)),
+        ("equipment: курсор",
+         paginate(select(*EQUIPMENT_LIST_COLUMNS), EQUIPMENT_KEYSET, _cursor(EQUIPMENT_KEYSET, "М", equipment_id), 0, LIMIT)),
+        ("equipment: поиск",
+         build_search_query("pump 100", factory_id, 20)),
+        ("production: циклы завода",
+         paginate(cycles.where(ProductionCycle.factory_id == factory_id),
+                  CYCLES_KEYSET, _cursor(CYCLES_KEYSET, now, equipment_id), 0, LIMIT)),
+        ("production: циклы оборудования",
+         paginate(cycles.where(ProductionCycle.equipment_id == equipment_id), CYCLES_KEYSET, None, 0, LIMIT)),
+        ("production: обслуживание оборудования",
+         paginate(maintenance.where(MaintenanceLog.equipment_id == equipment_id), MAINTENANCE_KEYSET, None, 0, LIMIT)),
+        ("production: обслуживание завода",
+         paginate(maintenance.where(Equipment.factory_id == factory_id), MAINTENANCE_KEYSET, None, 0, LIMIT)),
+        ("analytics: аномалии завода",
+         paginate(anomalies.where(Equipment.factory_id == factory_id), ANOMALIES_KEYSET, None, 0, LIMIT)),
+        ("analytics: аномалии по статусу",
+         paginate(anomalies.where(Anomaly.status == "new"), ANOMALIES_KEYSET, None, 0, LIMIT)),
+        ("analytics: аномалии оборудования",
+         paginate(anomalies.where(Anomaly.equipment_id == equipment_id), ANOMALIES_KEYSET, None, 0, LIMIT)),
+        ("analytics: аномалии потоком (stream) после курсора",
+         ANOMALIES_KEYSET.after(
+             ANOMALIES_KEYSET.order(anomalies.where(Equipment.factory_id == factory_id)),
+             _cursor(ANOMALIES_KEYSET, now, equipment_id),
+         )),
+        ("analytics: KPI сущности",
+         select(KPICalculation)
+         .where(KPICalculation.entity_type == "equipment")
+         .where(KPICalculation.entity_id == equipment_id)
+         .where(KPICalculation.period_type == "daily")
+         .order_by(desc(KPICalculation.period_start)).limit(30)),
+        ("analytics: прогнозы оборудования",
+         select(Prediction).where(Prediction.equipment_id == equipment_id)
+         .order_by(desc(Prediction.created_at)).limit(LIMIT)),
+        ("analytics: рекомендации завода",
+         select(Recommendation)
+         .where(Recommendation.target_type == "factory")
+         .where(Recommendation.target_id == factory_id)
+         .order_by(desc(Recommendation.created_at)).limit(LIMIT)),
+        ("reports: отчёты завода",
+         paginate(select(*REPORT_LIST_COLUMNS).where(GeneratedReport.factory_id == factory_id),
+                  REPORTS_KEYSET, None, 0, LIMIT)),
+        ("dashboard: статистика завода",
+         build_stats_query(factory_id, now.replace(hour=0, minute=0, second=0, microsecond=0))),
+        ("metrics: сырые точки",
+         select(*DATA_POINT_COLUMNS).where(MetricsData.equipment_id == equipment_id)
+         .where(MetricsData.metric_id == metric_id)
+         .where(MetricsData.timestamp >= week_ago)
+         .order_by(MetricsData.timestamp.desc()).limit(1000)),
+        ("metrics: корзины",
+         build_bucket_query(equipment_id, "1h", ["avg", "max"], metric_id=metric_id, start_time=week_ago)),
+        ("metrics: ряд для LTTB",
+         build_series_query(equipment_id, metric_id, week_ago, now)),
+    ]
+
+
+def _walk(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def _is_large(relation: str) -> bool:
+    return relation in LARGE_TABLES or relation.startswith("metrics_data_p")
+
+
+def seq_scans(plan: dict) -> List[str]:
+    """Большие таблицы, которые план читает полным просмотром"""
+    return [
+        node["Relation Name"]
+        for node in _walk(plan)
+        if node["Node Type"] == "Seq Scan" and _is_large(node.get("Relation Name", ""))
+    ]
+
+
+def indexes_used(plan: dict) -> List[str]:
+    # Индексы секций metrics_data сворачиваются в один
+    return sorted({
+        re.sub(r"^metrics_data_p\d+_", "metrics_data_p*_", node["Index Name"])
+        for node in _walk(plan) if "Index Name" in node
+    })
+
+
+async def run(verbose: bool) -> int:
+    checked = failures = 0
+    async with engine.connect() as conn:
+        sample = (await conn.execute(
+            select(Equipment.factory_id, Equipment.id).order_by(Equipment.id).limit(1)
+        )).first()
+        metric_id = await conn.scalar(select(MetricsCatalog.id).order_by(MetricsCatalog.id).limit(1))
+        if sample is None or metric_id is None:
+            print("БД пуста: заполните её перед проверкой планов")
+            return 1
+        has_trgm = (await conn.exec_driver_sql(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        )).first() is not None
+
+        await conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        for name, query in build_cases(sample.factory_id, sample.id, metric_id, datetime.now(timezone.utc)):
+            if "поиск" in name and not has_trgm:
+                print(f"SKIP {name}: нет расширения pg_trgm")
+                continue
+            sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            root = plan[0]["Plan"]
+            scans = seq_scans(root)
+            checked += 1
+            failures += bool(scans)
+            status = "FAIL" if scans else "ok  "
+            detail = f"Seq Scan: {', '.join(sorted(set(scans)))}" if scans else ", ".join(indexes_used(root))
+            print(f"{status} {name}: {detail}")
+            if verbose:
+                print(json.dumps(root, indent=2, ensure_ascii=False))
+        await conn.rollback()
+
+    print(f"\nПроверено запросов: {checked}, с полным просмотром большой таблицы: {failures}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--verbose", action="store_true", help="печатать планы целиком")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.verbose)))
+
+
+if __name__ == "__main__":
+    main()
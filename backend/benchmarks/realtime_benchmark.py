@@ -0,0 +1,103 @@
+"""
+Бенчмарк рассылки показаний в реальном времени
+
+В одном процессе создаётся N подписчиков на E единиц оборудования, часть
+из них читает медленно. Публикатор рассылает сообщения с заданной частотой,
+как приём телеметрии. Печатаются задержка доставки (p50/p99/max) у быстрых
+подписчиков - медленные не должны её увеличивать - и число сообщений,
+вытесненных из очередей медленных. Для backend=redis нужен Redis из REDIS_URL.
+Запуск из каталога backend:
+    python -m benchmarks.realtime_benchmark --subscribers 5000 --backend memory
+    python -m benchmarks.realtime_benchmark --subscribers 5000 --backend redis
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+import orjson
+
+from app.services.metrics_pubsub import MetricsBroker
+
+
+async def _consume(subscriber, latencies: list, delay: float, counters: dict):
+    while True:
+        message = orjson.loads(await subscriber.get())
+        if message["type"] == "gap":
+            counters["gaps"] += 1
+            continue
+        counters["received"] += 1
+        if delay:
+            await asyncio.sleep(delay)
+        else:
+            latencies.append(time.perf_counter() - message["sent"])
+
+
+async def run(subscribers: int, equipment: int, slow_share: float, messages: int, rate: float, backend: str, queue: int):
+    broker = MetricsBroker(backend=backend, max_queue=queue)
+    equipment_ids = [uuid.uuid4() for _ in range(equipment)]
+    slow_count = int(subscribers * slow_share)
+    fast_latencies: list = []
+    fast = {"received": 0, "gaps": 0}
+    slow = {"received": 0, "gaps": 0}
+
+    consumers = []
+    for i in range(subscribers):
+        subscriber = await broker.subscribe([equipment_ids[i % equipment]])
+        is_slow = i < slow_count
+        consumers.append(asyncio.create_task(_consume(
+            subscriber, fast_latencies, 0.05 if is_slow else 0.0, slow if is_slow else fast
+        )))
+    if backend == "redis":
+        # Дать слушателю подписаться на каналы
+        await asyncio.sleep(1.0)
+
+    started = time.perf_counter()
+    interval = 1.0 / rate
+    for seq in range(messages):
+        await broker.publish({
+            equipment_id: {"type": "readings", "seq": seq, "sent": time.perf_counter()}
+            for equipment_id in equipment_ids
+        })
+        await asyncio.sleep(max(0.0, started + (seq + 1) * interval - time.perf_counter()))
+    await asyncio.sleep(1.0)
+    elapsed = time.perf_counter() - started
+
+    for task in consumers:
+        task.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    stats = broker.stats()
+    await broker.close()
+
+    fast_count = subscribers - slow_count
+    expected = messages * fast_count
+    lat_ms = np.array(fast_latencies) * 1000 if fast_latencies else np.zeros(1)
+    print(f"backend={backend}, подписчиков: {subscribers} (медленных {slow_count}), оборудования: {equipment}")
+    print(f"Сообщений на оборудование: {messages} с частотой {rate:g}/с, за {elapsed:.1f} с")
+    print(f"Доставлено подписчикам: {stats['delivered']}, вытеснено из очередей: {stats['dropped']}")
+    print(f"Быстрые: получено {fast['received']} из {expected}, gap: {fast['gaps']}")
+    print(
+        f"Задержка доставки быстрым, мс: p50 {np.percentile(lat_ms, 50):.2f}, "
+        f"p99 {np.percentile(lat_ms, 99):.2f}, max {lat_ms.max():.2f}"
+    )
+    print(f"Медленные: получено {slow['received']}, событий gap: {slow['gaps']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--equipment", type=int, default=200)
+    parser.add_argument("--slow-share", type=float, default=0.1, help="доля медленных подписчиков")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50.0, help="пакетов в секунду")
+    parser.add_argument("--backend", choices=["memory", "redis"], default="memory")
+    parser.add_argument("--queue", type=int, default=100, help="размер очереди подписчика")
+    args = parser.parse_args()
+    asyncio.run(run(
+        args.subscribers, args.equipment, args.slow_share, args.messages, args.rate, args.backend, args.queue
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Бенчмарк плановых отчётов: запрос на каждый завод против одного прохода по
+данным для всех заводов шаблона (run_report_batch)
+
+Выполняется только выборка данных отчёта (без записи файлов) за последние
+--days дней для первых --factories заводов БД. Запуск из каталога backend:
+    python -m benchmarks.report_batch_benchmark --report oee --factories 300
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+
+from app.core.database import engine
+from app.models.factory import Factory
+from app.services.report_jobs import REPORTS
+
+
+async def run(report_type: str, factories: int, days: int, repeat: int):
+    sql = text(REPORTS[report_type].sql)
+    end = datetime.now(timezone.utc)
+    period = {"start": end - timedelta(days=days), "end": end}
+    async with engine.connect() as conn:
+        factory_ids = (await conn.execute(select(Factory.id).order_by(Factory.id).limit(factories))).scalars().all()
+        if not factory_ids:
+            print("Нет заводов: заполните БД")
+            return
+
+        per_factory, batched = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            per_factory_rows = 0
+            for factory_id in factory_ids:
+                per_factory_rows += len((await conn.execute(sql, {"factory_ids": [factory_id], **period})).all())
+            per_factory.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            batched_rows = len((await conn.execute(sql, {"factory_ids": list(factory_ids), **period})).all())
+            batched.append(time.perf_counter() - started)
+    await engine.dispose()
+
+    print(f"Отчёт {report_type}: заводов {len(factory_ids)}, период {days} дн., строк {batched_rows}")
+    if per_factory_rows != batched_rows:
+        print(f"ВНИМАНИЕ: по заводам {per_factory_rows} строк, одним запросом {batched_rows}")
+    print(f"{'способ':<22} {'запросов':>9} {'лучшее, мс':>11}")
+    print(f"{'запрос на завод':<22} {len(factory_ids):>9} {min(per_factory) * 1000:>11.1f}")
+    print(f"{'один проход':<22} {1:>9} {min(batched) * 1000:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--report", choices=list(REPORTS), default="oee")
+    parser.add_argument("--factories", type=int, default=300)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.report, args.factories, args.days, args.repeat))
+
+
+if __name__ == "__main__":
+    main()